@@ -0,0 +1,25 @@
+from database import db
+
+class CommandDeadline(db.Model):
+    # One row per queued command, shared by all workers (times are epoch seconds)
+    __tablename__ = 'command_deadlines'
+
+    id = db.Column(db.String(32), primary_key=True) # command['id']
+    feeder_id = db.Column(db.Integer, nullable=False, index=True)
+    type = db.Column(db.String(32), nullable=True)
+    duration = db.Column(db.Integer, nullable=True) # ms, as queued (feed events on ack)
+    payload = db.Column(db.Text, nullable=True) # The command as queued (JSON); the CommandBus delivers it
+    queued_at = db.Column(db.Float, nullable=False, index=True)
+    deadline = db.Column(db.Float, nullable=True, index=True) # Ack deadline; NULL once acked or expired
+    acked_at = db.Column(db.Float, nullable=True)
+    expired_at = db.Column(db.Float, nullable=True)
+
+    # Round-trip trace (CommandTrace): first delivery and what the ack reported
+    delivered_at = db.Column(db.Float, nullable=True)
+    status = db.Column(db.String(16), nullable=True)
+    firmware_version = db.Column(db.String(32), nullable=True)
+
+    # water_control OPEN only: when the valve must be closed again
+    valve_deadline = db.Column(db.Float, nullable=True, index=True)
+    valve_timed = db.Column(db.Boolean, default=False)
+    valve_expired_at = db.Column(db.Float, nullable=True)
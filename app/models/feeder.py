@@ -1,5 +1,6 @@
 from database import db
 from datetime import datetime
+from app.services.clock import Clock
 import secrets
 
 class Feeder(db.Model):
@@ -43,6 +44,7 @@ class Feeder(db.Model):
     
     status = db.Column(db.String(16), default='NORMAL') # NORMAL, WARNING, CRITICAL, TRIP
     trip_reason = db.Column(db.String(128), nullable=True) # Reason for TRIP
+    status_changed_at = db.Column(db.Float, nullable=True) # Epoch s of the last status transition
     
     # Block & Water Logic
     block_name = db.Column(db.String(64), nullable=True) # Grouping (e.g., "Block A")
@@ -51,15 +53,16 @@ class Feeder(db.Model):
     
     # Advanced Logic
     last_stable_weight = db.Column(db.Float, default=0.0) # For Hysteresis
+    weight_filter = db.Column(db.String(16), default='deadband') # deadband, median, ema, hysteresis, kalman
     maintenance_mode = db.Column(db.Boolean, default=False) # Suppress Alarms
 
-    def __init__(self, name, food_tank_id=None, water_tank_id=None, avatar='cat'):
+    def __init__(self, name, food_tank_id=None, water_tank_id=None, avatar='cat', token=None):
         self.name = name
         self.food_tank_id = food_tank_id
         self.water_tank_id = water_tank_id
         self.avatar = avatar
-        self.token = secrets.token_urlsafe(32)
-        self.last_seen = datetime.utcnow()
+        self.token = token or secrets.token_urlsafe(32)
+        self.last_seen = Clock.utcnow()
         self.battery_level = 100
         self.target_weight = 210.0
         self.warning_weight = 80.0
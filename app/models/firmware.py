@@ -0,0 +1,26 @@
+from database import db
+from datetime import datetime
+
+class Firmware(db.Model):
+    __tablename__ = 'firmware'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.String(32), unique=True, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False) # Artifact file name and strong ETag
+    size = db.Column(db.Integer, nullable=False)
+    notes = db.Column(db.String(256), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Staged rollout: share of the fleet (0-100%) offered this version
+    rollout_percent = db.Column(db.Integer, default=0)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'version': self.version,
+            'sha256': self.sha256,
+            'size': self.size,
+            'notes': self.notes,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'rollout_percent': self.rollout_percent
+        }
@@ -1,13 +1,101 @@
-from flask import Blueprint, request, jsonify
+import hmac
+from datetime import timedelta
+from flask import Blueprint, request, jsonify, current_app, Response, send_file, url_for, abort, stream_with_context
+from flask_login import login_required, current_user
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 from database import db
 from app.models.feeder import Feeder
+from app.models.command_deadline import CommandDeadline
+from app.models.firmware import Firmware
 from app.models.log import Log
 from app.services.auth import token_required
 from app.services.command_bus import CommandBus
-from datetime import datetime
+from app.services.command_trace import CommandTrace
+from app.services.fleet import FleetModel, commit_devices
+from app.services.dirty import WriteStats, touch_presence, commit_if_changed
+from app.services.partitioning import snapshot_feeder, snapshot_log, snapshot_tank
+from app.services.signal_filters import filter_weight, classify
+from app.services import journal, history
+from app.services.clock import Clock
+from app.services import export
+from app.services.export import parse_range
+from app.services.admission import client_key, queued_ms
+from app.services.aggregates import derived_level
+from app.services.deadlines import Deadlines
+from app.services.dispense_check import DISPENSE_COMMANDS
+from app.services.heartbeat import WeightTrend, next_report_interval, presence_interval, server_load
+from app.services.provisioning import ProvisioningError, provision, sheet_csv
 
 api_bp = Blueprint('api', __name__)
 
+# --- Admission Control (device endpoints only) ---
+
+DEVICE_ENDPOINTS = {
+    'api.get_config': 'feeder',
+    'api.report_status': 'feeder',
+    'api.get_command': 'feeder',
+    'api.ack_command': 'feeder',
+    'api.log_event': 'feeder',
+    'api.report_tank_status': 'tank',
+}
+# Command traffic is never a plain heartbeat
+PRIORITY_ENDPOINTS = ('api.get_command', 'api.ack_command', 'api.log_event')
+
+def _priority_request(endpoint, kind, device_id):
+    # Cached read model (peek: no sync before admission) and command queue only:
+    # pending commands or an alarm state
+    if endpoint in PRIORITY_ENDPOINTS:
+        return True
+    if kind != 'feeder' or device_id is None:
+        return False
+    if CommandBus.has_commands(device_id):
+        return True
+    state = FleetModel.peek(device_id)
+    if state is not None and state.status in ('WARNING', 'CRITICAL', 'TRIP'):
+        return True
+    data = request.get_json(silent=True) or {}
+    return data.get('water_sensor') == 'LSLL'
+
+def _authenticated(kind, device_id):
+    # Bearer checked against the cached read model, still without DB access. A device
+    # created on another worker since this one last synced pays as a client meanwhile
+    header = request.headers.get('Authorization', '')
+    token = header[len('Bearer '):] if header.startswith('Bearer ') else ''
+    state = FleetModel.peek(device_id) if kind == 'feeder' else FleetModel.peek_tank(device_id)
+    return bool(token) and state is not None and bool(state.token) and \
+        hmac.compare_digest(state.token.encode(), token.encode())
+
+def _client_address():
+    # nginx (biofeed.conf) passes the peer in X-Real-IP; only trust it from the local proxy
+    if request.remote_addr in ('127.0.0.1', '::1'):
+        return request.headers.get('X-Real-IP') or request.remote_addr
+    return request.remote_addr
+
+@api_bp.before_request
+def admission_control():
+    admission = current_app.extensions.get('admission')
+    kind = DEVICE_ENDPOINTS.get(request.endpoint)
+    if admission is None or kind is None:
+        return None
+
+    # The URL id is unauthenticated: only a matching token may spend that device's bucket
+    device_id = (request.view_args or {}).get('id')
+    if device_id is not None and _authenticated(kind, device_id):
+        priority = _priority_request(request.endpoint, kind, device_id)
+    else:
+        kind, device_id, priority = 'client', client_key(_client_address()), False
+    rejected = admission.admit(kind, device_id, priority, queued_ms(request.headers.get('X-Request-Start')))
+    if rejected is None:
+        return None
+    status, reason, retry_after = rejected
+    return jsonify({'error': 'Server busy, retry later', 'reason': reason}), status, {'Retry-After': str(retry_after)}
+
+@api_bp.teardown_request
+def admission_release(exc):
+    admission = current_app.extensions.get('admission')
+    if admission is not None:
+        admission.release()
+
 @api_bp.route('/feeder/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -15,8 +103,10 @@ def register():
         return jsonify({'error': 'Name is required'}), 400
     
     feeder = Feeder(name=data['name'])
+    feeder.block_name = data.get('block_name')
+    current_app.extensions['partitioning'].assign_id(feeder)
     db.session.add(feeder)
-    db.session.commit()
+    commit_devices(feeder)
     
     return jsonify({
         'id': feeder.id,
@@ -30,16 +120,23 @@ def get_config(feeder, id):
     if feeder.id != id:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    feeder.last_seen = datetime.utcnow()
-    feeder.online = True
-    db.session.commit()
+    _touch_presence(feeder)
+    commit_if_changed('get_config', feeder)
 
     return jsonify({
         'interval_seconds': feeder.interval_seconds,
         'open_duration_ms': feeder.open_duration_ms,
-        'next_run': feeder.next_run.timestamp() if feeder.next_run else 0
+        'next_run': feeder.next_run.timestamp() if feeder.next_run else 0,
+        'next_report_s': _next_report(feeder)
     })
 
+def _next_report(feeder, delivered=False):
+    return next_report_interval(feeder, current_app.config, server_load(current_app), delivered)
+
+def _touch_presence(feeder):
+    # Presence is only written when stale, and "stale" includes the wait for the next report
+    return touch_presence(feeder, presence_interval(current_app.config, _next_report(feeder)))
+
 @api_bp.route('/feeder/<int:id>/status', methods=['POST'])
 @token_required
 def report_status(feeder, id):
@@ -48,9 +145,7 @@ def report_status(feeder, id):
     
     data = request.get_json()
     
-    # Update feeder status
-    feeder.last_seen = datetime.utcnow()
-    feeder.online = True
+    # Update feeder status (presence is touched below, once the next interval is known)
     if 'firmware_version' in data:
         feeder.firmware_version = data.get('firmware_version')
     if 'battery' in data:
@@ -62,31 +157,21 @@ def report_status(feeder, id):
     if 'weight' in data:
         raw_weight = float(data['weight'])
         
-        # Hysteresis Logic (Filter noise)
-        # Only update if change > 2g (assuming high precision) or if it's the first reading
-        last_weight = feeder.last_stable_weight or 0.0
-        if abs(raw_weight - last_weight) > 2.0:
-            feeder.drawer_weight = raw_weight
-            feeder.last_stable_weight = raw_weight
-        else:
-            # Keep old weight to avoid jitter
-            pass
-            
-        weight = feeder.drawer_weight or raw_weight
+        # Noise Filter (per feeder: deadband, median, ema, hysteresis, kalman)
+        # Only persist when the filtered weight actually moves
+        stable_weight, weight, margin = filter_weight(feeder, raw_weight)
+        WeightTrend.update(feeder.id, weight)
+        if stable_weight is not None:
+            feeder.drawer_weight = stable_weight
+            feeder.last_stable_weight = stable_weight
         
         # Thresholds
         warning = feeder.warning_weight or 80.0
         critical = feeder.critical_weight or 20.0
         
-        if weight > warning:
-            new_state = 'LSH'
-            new_status = 'NORMAL'
-        elif weight > critical:
-            new_state = 'LSL'
-            new_status = 'WARNING'
-        else:
-            new_state = 'LSLL'
-            new_status = 'CRITICAL'
+        # Climb-back margin keeps readings near a threshold from flipping the state
+        new_state = classify(weight, warning, critical, feeder.sensor_state, margin)
+        new_status = {'LSH': 'NORMAL', 'LSL': 'WARNING', 'LSLL': 'CRITICAL'}[new_state]
 
         if feeder.status != 'TRIP' and not feeder.maintenance_mode:
             # Check Block Status (Interlock: 2 Feeders in LSL -> Block Critical)
@@ -152,20 +237,39 @@ def report_status(feeder, id):
                         'action': 'OPEN',
                         'duration': 10000 # 10s Timeout check
                     })
+                    feeder.water_valve_state = 'OPEN'  # closed again by the valve deadline
                     print(f"Feeder {feeder.id}: Water Low. Opening Solenoid (Auto).")
             else:
                  print(f"Feeder {feeder.id}: Water Low but Mode is MANUAL.")
 
-    db.session.commit()
+    # Chart history keeps every reading, even the ones that change nothing
+    history.record('feeder', feeder.id, weight if 'weight' in data else None,
+                   feeder.battery_level if 'battery' in data else None)
+
+    # Unchanged heartbeats produce no UPDATE and no commit
+    _touch_presence(feeder)
+    commit_if_changed('report_status', feeder)
     
     # Check for pending commands
     commands = CommandBus.get_commands(feeder.id)
     
-    return jsonify({
+    response = {
         "status": "ok", 
         "commands": commands,
-        "feeder_status": feeder.status
-    })
+        "feeder_status": feeder.status,
+        "next_report_s": _next_report(feeder, bool(commands))
+    }
+
+    # OTA: only healthy feeders in the current rollout wave are offered an update
+    if feeder.status == 'NORMAL':
+        update = current_app.extensions['firmware'].offer_for(feeder, _firmware_url)
+        if update:
+            response['firmware'] = update
+
+    return jsonify(response)
+
+def _firmware_url(version, sig):
+    return url_for('api.firmware_download', version=version, sig=sig, _external=True)
 
 @api_bp.route('/feeder/<int:id>/command', methods=['GET'])
 @token_required
@@ -185,16 +289,40 @@ def ack_command(feeder, id):
     data = request.get_json()
     cmd_id = data.get('command_id')
     status = data.get('status')
-    
-    # Log the execution
+
+    # Disarms the command's ack deadline (and marks a valve open as confirmed);
+    # stamps the round trip on the command's shared row, whichever worker queued it
+    trace = Deadlines.acknowledged(feeder.id, cmd_id, status, feeder.firmware_version)
+    if trace is None:
+        CommandTrace.unmatched_ack()
+
+    response = {'status': 'ack_received', 'matched': trace is not None}
+    if trace is not None:
+        response['command'] = trace.type
+
+    # Executed dispenses become feed events here (the firmware never posts /log);
+    # the dispense verifier later checks them against the drawer scale
     if status == 'executed':
-        # If it was a feed command, log it
-        # In a real app, we'd match the command ID to know what it was.
-        # For simplicity, we assume if we get an ACK it might be a feed.
-        # But better to just log explicit feed reports or infer from command type.
-        pass
+        dispensed = _dispensed(feeder, cmd_id, data, trace)
+        if dispensed is not None:
+            current_app.extensions['log_writer'].submit(feeder.id, *dispensed)
+    return jsonify(response)
 
-    return jsonify({'status': 'ack_received'})
+def _dispensed(feeder, cmd_id, data, trace):
+    """(type, duration) of an executed ack to log as a feed event, or None.
+
+    The command type comes from its shared row, whichever worker queued it (a late
+    ack, after the deadline expired, still dispensed). Ids without a row fall back
+    to the type/duration the device sent; a repeated ack of a command logs nothing."""
+    if trace is not None:
+        kind, duration = trace.type, trace.duration
+    elif isinstance(cmd_id, str) and db.session.get(CommandDeadline, cmd_id) is not None:
+        return None
+    else:
+        kind, duration = data.get('type'), data.get('duration')
+    if kind not in DISPENSE_COMMANDS:
+        return None
+    return kind, (duration if isinstance(duration, (int, float)) else 0)
 
 # Endpoint to log feed events from ESP32 (optional, if not covered by status)
 @api_bp.route('/feeder/<int:id>/log', methods=['POST'])
@@ -207,14 +335,63 @@ def log_event(feeder, id):
     action = data.get('action', 'auto')
     duration = data.get('duration_ms', 0)
     
-    log = Log(feeder_id=id, action=action, duration_ms=duration)
-    db.session.add(log)
-    
-    feeder.last_run = datetime.utcnow()
-    db.session.commit()
+    # Queued for the group-commit writer (also sets feeder.last_run)
+    writer = current_app.extensions['log_writer']
+    if not writer.submit(id, action, duration):
+        return jsonify({'error': 'Log queue full, retry later'}), 503, {'Retry-After': '1'}
     
     return jsonify({'status': 'logged'})
-    return jsonify({'status': 'logged'})
+
+# --- Firmware OTA ---
+
+@api_bp.route('/firmware/<version>/download', methods=['GET'])
+def firmware_download(version):
+    # Signed URL from the status response (the ESP32 OTA client sends no Bearer token)
+    store = current_app.extensions['firmware']
+    if store.verify(request.args.get('sig', ''), version) is None:
+        return jsonify({'error': 'Invalid or expired download link'}), 403
+
+    release = Firmware.query.filter_by(version=version).first_or_404()
+
+    accel = current_app.config['FIRMWARE_ACCEL_PREFIX']
+    if accel:
+        # nginx streams the file (sendfile, Range, limit_conn); we only authorize. No
+        # download slot is taken: the transfer outlives this response and nginx tells
+        # the app nothing when it ends, so behind nginx the concurrency cap is its
+        # limit_conn (biofeed.conf), not FIRMWARE_MAX_DOWNLOADS
+        response = Response(mimetype='application/octet-stream')
+        response.headers['X-Accel-Redirect'] = f"{accel.rstrip('/')}/{release.sha256}.bin"
+        response.set_etag(release.sha256)
+        return response
+
+    # Resumed/duplicate checks answer 304 without taking a download slot
+    if release.sha256 in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(release.sha256)
+        return response
+
+    try:
+        artifact = store.open_download(release.sha256)
+    except OSError:
+        return jsonify({'error': 'Firmware artifact missing'}), 404
+    if artifact is None:
+        return jsonify({'error': 'Too many firmware downloads, retry later'}), 503, {'Retry-After': '30'}
+
+    # Strong ETag = content hash; Range/If-Range resumes answer 206
+    response = send_file(
+        artifact,
+        mimetype='application/octet-stream',
+        download_name=f"firmware-{release.version}.bin",
+        etag=release.sha256,
+        conditional=False,
+        max_age=0
+    )
+    response.content_length = release.size
+    try:
+        return response.make_conditional(request.environ, accept_ranges=True, complete_length=release.size)
+    except RequestedRangeNotSatisfiable:
+        artifact.close()
+        raise
 
 # --- Tank API Routes ---
 
@@ -238,8 +415,7 @@ def report_tank_status(id):
 
     data = request.get_json()
     
-    tank.last_seen = datetime.utcnow()
-    tank.online = True
+    touch_presence(tank, current_app.config['PRESENCE_WRITE_INTERVAL'])
     
     if 'level' in data:
         tank.level = int(data['level'])
@@ -247,15 +423,239 @@ def report_tank_status(id):
     # Optional: Update weight if provided (e.g. for Food Tank scales)
     if 'weight' in data:
         tank.current_weight = float(data['weight'])
-        # Recalculate level based on max_weight if needed, 
-        # but for now we trust the 'level' sent by ESP or use weight directly.
-        # If ESP sends weight but not level, we could calculate:
-        # tank.level = int((tank.current_weight / tank.max_weight) * 100)
+        # A level sensor wins; scale-only tanks get their level from max_weight
+        if 'level' not in data:
+            level = derived_level(tank.current_weight, tank.max_weight)
+            if level is not None:
+                tank.level = level
 
-    db.session.commit()
+    history.record('tank', tank.id, tank.current_weight if 'weight' in data else None,
+                   tank.level if 'level' in data or 'weight' in data else None)
+    commit_if_changed('report_tank_status', tank)
     
     return jsonify({'status': 'ok', 'level': tank.level})
 
+# --- Bulk Provisioning ---
+
+@api_bp.route('/provision', methods=['POST'])
+@login_required
+def provision_devices():
+    # One manifest, one transaction; the response is the credential sheet
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin only'}), 403
+    manifest = request.get_json(silent=True)
+    dry_run = request.args.get('dry_run') == '1'
+    try:
+        sheet = provision(manifest, current_app.extensions['partitioning'], dry_run=dry_run)
+    except ProvisioningError as e:
+        return jsonify({'error': 'Invalid manifest', 'errors': e.errors}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if request.args.get('format') == 'csv':
+        return Response(sheet_csv(sheet), mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=credentials.csv'})
+    return jsonify({'devices': sheet}), 200 if dry_run else 201
+
+# --- Fleet Read Model ---
+
+@api_bp.route('/fleet', methods=['GET'])
+@login_required
+def fleet():
+    # Served from the in-memory read model: per-device JSON is cached per version
+    return Response(FleetModel.fleet_json(), mimetype='application/json')
+
+@api_bp.route('/blocks/<name>/summary', methods=['GET'])
+@login_required
+def block_summary(name):
+    # Totals are maintained on every device write, no aggregate query here
+    summary = FleetModel.block_summary(name)
+    if summary is None:
+        return jsonify({'error': 'Block not found'}), 404
+    return jsonify(summary)
+
+@api_bp.route('/stats/admission', methods=['GET'])
+@login_required
+def admission_stats():
+    # Shared across workers: admitted vs rate-limited/shed device requests
+    admission = current_app.extensions.get('admission')
+    return jsonify(admission.stats() if admission else {'enabled': False})
+
+@api_bp.route('/stats/deadlines', methods=['GET'])
+@login_required
+def deadline_stats():
+    # Armed command/valve deadlines and expiries (shared table), and whether this worker scans
+    return jsonify(Deadlines.pending())
+
+@api_bp.route('/stats/commands', methods=['GET'])
+@login_required
+def command_stats():
+    # Command round-trip percentiles (queued / delivered / executed) across all workers
+    return jsonify(CommandTrace.stats(request.args.get('feeder_id', type=int)))
+
+@api_bp.route('/stats/dispense', methods=['GET'])
+@login_required
+def dispense_stats():
+    # Last dispense verification run of this worker (None until it has run)
+    verifier = current_app.extensions.get('dispense_check')
+    if verifier is None:
+        return jsonify({'error': 'Dispense verification disabled'}), 404
+    return jsonify({'interval_s': verifier.interval, 'last': verifier.last})
+
+@api_bp.route('/stats/writes', methods=['GET'])
+@login_required
+def write_stats():
+    # Applied vs skipped device writes in this worker (change-only persistence),
+    # plus this worker's feed-log writer (retried and dropped batches)
+    return jsonify(dict(WriteStats.snapshot(), log_writer=current_app.extensions['log_writer'].stats()))
+
+# --- State-Transition Journal ---
+
+@api_bp.route('/feeder/<int:id>/timeline', methods=['GET'])
+@login_required
+def feeder_timeline(id):
+    log = journal.get_journal()
+    if log is None:
+        return jsonify({'error': 'Journal disabled'}), 404
+    try:
+        start, end = parse_range(request.args.get('start'), request.args.get('end'))
+    except ValueError:
+        return jsonify({'error': 'Invalid start/end'}), 400
+    end = end or Clock.utcnow()
+    start = start or end - timedelta(hours=24)
+    limit = min(request.args.get('limit', 1000, type=int), 10000)
+
+    events = log.timeline(id, journal.to_epoch(start), journal.to_epoch(end), limit=limit)
+    return jsonify({
+        'feeder_id': id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'events': events
+    })
+
+@api_bp.route('/feeder/<int:id>/history', methods=['GET'])
+@login_required
+def feeder_history(id):
+    return _history_response('feeder', id)
+
+@api_bp.route('/tank/<int:id>/history', methods=['GET'])
+@login_required
+def tank_history(id):
+    return _history_response('tank', id)
+
+def _history_response(kind, id):
+    store = history.get_history()
+    if store is None:
+        return jsonify({'error': 'History disabled'}), 404
+    try:
+        start, end = parse_range(request.args.get('start'), request.args.get('end'))
+    except ValueError:
+        return jsonify({'error': 'Invalid start/end'}), 400
+    method = request.args.get('method', 'minmax')
+    if method not in history.METHODS:
+        return jsonify({'error': f"method must be one of {', '.join(history.METHODS)}"}), 400
+    now = Clock.utcnow()
+    end = end or now
+    start = start or end - timedelta(hours=24)
+    retention = current_app.config['HISTORY_RETENTION_DAYS']
+    if retention > 0:
+        # Nothing older is kept (and ?start=0001-01-01 must not pick day-wide buckets)
+        start = max(start, now - timedelta(days=retention + 1))
+    points = min(max(request.args.get('points', 500, type=int), 10), 5000)
+
+    result = store.query(kind, id, journal.to_epoch(start), journal.to_epoch(end), points, method)
+    response = jsonify({
+        f'{kind}_id': id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'points': points,
+        'method': method,
+        **result
+    })
+    if end.date() < now.date():
+        # Past days only: the answer will not change
+        response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+@api_bp.route('/fleet/state', methods=['GET'])
+@login_required
+def fleet_state_at():
+    # Fleet state as of ?at= (default now), rebuilt from the nearest journal snapshot
+    log = journal.get_journal()
+    if log is None:
+        return jsonify({'error': 'Journal disabled'}), 404
+    try:
+        at, _ = parse_range(request.args.get('at'), None)
+    except ValueError:
+        return jsonify({'error': 'Invalid at'}), 400
+    at = at or Clock.utcnow()
+    state = log.state_at(journal.to_epoch(at))
+    return jsonify({'at': at.isoformat(), 'feeders': {str(k): v for k, v in state.items()}})
+
+# --- Partition API (peer fan-out) ---
+
+PARTITION_LOG_LIMIT = 10_000
+
+def _partition_denied():
+    # Only peer partitions (shared secret) may read these; None when allowed
+    partitioning = current_app.extensions['partitioning']
+    if not partitioning.enabled:
+        abort(404)
+    if not partitioning.authorized(request.headers):
+        return jsonify({'error': 'Unauthorized'}), 403
+    return None
+
+@api_bp.route('/partition/feeders', methods=['GET'])
+def partition_feeders():
+    denied = _partition_denied()
+    if denied:
+        return denied
+
+    feeders = Feeder.query.all()
+    return jsonify({
+        'partition': current_app.extensions['partitioning'].self_name,
+        'feeders': [snapshot_feeder(f) for f in feeders]
+    })
+
+@api_bp.route('/partition/tanks', methods=['GET'])
+def partition_tanks():
+    denied = _partition_denied()
+    if denied:
+        return denied
+    return jsonify({
+        'partition': current_app.extensions['partitioning'].self_name,
+        'tanks': [snapshot_tank(t) for t in FleetModel.tanks()],
+        'blocks': FleetModel.block_summaries()
+    })
+
+@api_bp.route('/partition/logs', methods=['GET'])
+def partition_logs():
+    # Newest `limit` logs and the total, for the merged logs page
+    denied = _partition_denied()
+    if denied:
+        return denied
+    limit = min(max(request.args.get('limit', 20, type=int), 0), PARTITION_LOG_LIMIT)
+    return jsonify({
+        'partition': current_app.extensions['partitioning'].self_name,
+        'total': db.session.query(db.func.count(Log.id)).scalar(),
+        'logs': [snapshot_log(*row) for row in export.recent_logs(limit)]
+    })
+
+@api_bp.route('/partition/export/<kind>', methods=['GET'])
+def partition_export(kind):
+    # This partition's share of a dashboard export, as NDJSON in export order
+    denied = _partition_denied()
+    if denied:
+        return denied
+    if kind not in export.COLUMNS:
+        abort(404)
+    try:
+        rows = export.rows_for(kind, request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid date (use YYYY-MM-DD or ISO datetime)'}), 400
+    return Response(stream_with_context(export.stream_ndjson(export.COLUMNS[kind], rows)),
+                    mimetype=export.FORMATS['ndjson'])
+
 @api_bp.route('/identify', methods=['GET'])
 def identify_device():
     token = None
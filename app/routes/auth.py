@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models.user import User
+from app.services.user_cache import UserCache
 from database import db
 
 auth_bp = Blueprint('auth', __name__)
@@ -51,6 +52,7 @@ def register_admin():
             new_user.set_password(password)
             db.session.add(new_user)
             db.session.commit()
+            UserCache.invalidate(new_user.id)
             flash(f'Administrador {username} criado com sucesso!', 'success')
             return redirect(url_for('dashboard.index'))
             
@@ -1,38 +1,110 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, abort, session, make_response
 from database import db
 from app.models.feeder import Feeder
+from app.models.firmware import Firmware
 from app.models.log import Log
 from app.models.tank import Tank
+from app.models.user import User
 from app.services.command_bus import CommandBus
+from app.services.command_trace import CommandTrace
+from app.services.fleet import FleetModel, commit_devices
+from app.services.fragments import etag_for
+from app.services.heartbeat import ONLINE_WINDOW_S
+from app.services.signal_filters import FILTERS
+from app.services.user_cache import UserCache
+from app.services.clock import Clock
+from app.services.firmware import rollout_bucket, version_key
 from datetime import datetime
+from math import ceil
+from types import SimpleNamespace
+from markupsafe import Markup
 from flask_login import login_required, current_user
 import json
-from flask import jsonify
+from flask import jsonify, Response, stream_with_context
+from app.services import export
+from app.services.partitioning import remote_feeder, remote_log, snapshot_log
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
+def _conditional(etag_parts, render):
+    # Digest-based weak ETag: unchanged pages answer 304 without rendering, on any worker
+    if session.get('_flashes'):
+        return render()
+    etag = etag_for(current_user.id, current_user.theme, current_user.is_admin, *etag_parts)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _is_online(feeder, now):
+    # Derived at render time from last_seen; the model is only written by the device path
+    return bool(feeder.last_seen) and (now - feeder.last_seen).total_seconds() < ONLINE_WINDOW_S
+
+def _feeder_card(feeder, now):
+    last_run_hours = round((now - feeder.last_run).total_seconds() / 3600, 1) if feeder.last_run else None
+    online = _is_online(feeder, now)
+    context = {'feeder': feeder, 'online': online, 'last_run_hours': last_run_hours}
+    if not hasattr(feeder, 'version'):
+        # Remote (partitioned) feeder: no version to key on
+        return Markup(render_template('_feeder_card.html', **context))
+
+    food, water = feeder.food_tank, feeder.water_tank
+    key = ('card', feeder.id, feeder.version,
+           food.version if food else None, water.version if water else None, last_run_hours, online)
+    return current_app.extensions['fragments'].render(key, '_feeder_card.html', context)
+
+def _tank_options(tank_type, selected_id):
+    key = ('tank_options', tank_type, FleetModel.tanks_version, selected_id)
+    return current_app.extensions['fragments'].render(
+        key, '_tank_options.html',
+        lambda: {'tanks': FleetModel.tanks(), 'tank_type': tank_type, 'selected_id': selected_id}
+    )
+
 @dashboard_bp.route('/')
 @dashboard_bp.route('/dashboard')
 @login_required
 def index():
-    feeders = Feeder.query.all()
-    
-    # Check online status (simple timeout check)
-    now = datetime.utcnow()
-    for f in feeders:
-        if f.last_seen:
-            delta = now - f.last_seen
-            f.online = delta.total_seconds() < 120 # 2 minutes timeout
-        else:
-            f.online = False
-            
-    return render_template('dashboard.html', feeders=feeders)
+    feeders = FleetModel.feeders()
+    now = Clock.utcnow()
+
+    # Partitioned mode: merge the other partitions' feeders into the grid
+    partitioning = current_app.extensions['partitioning']
+    if partitioning.enabled:
+        for payload in partitioning.fan_out('/api/partition/feeders', skip_self=True).values():
+            for data in (payload or {}).get('feeders', []):
+                feeders.append(remote_feeder(data))
+        feeders.sort(key=lambda f: f.id)
+        return render_template('dashboard.html', cards=[_feeder_card(f, now) for f in feeders])
+
+    # "h atrás" labels move in 0.1 h steps, hence the 6-minute bucket
+    return _conditional(
+        ('dashboard', FleetModel.fleet_digest(), int(Clock.time() // 360),
+         tuple(f.id for f in feeders if _is_online(f, now))),
+        lambda: render_template('dashboard.html', cards=[_feeder_card(f, now) for f in feeders])
+    )
 
 @dashboard_bp.route('/tanks')
 @login_required
 def tanks():
-    tanks = Tank.query.all()
-    return render_template('tanks.html', tanks=tanks)
+    # Read model: tank records and the incrementally maintained block totals
+    tanks, blocks = _fleet_tanks()
+    return render_template('tanks.html', tanks=tanks, blocks=blocks)
+
+def _fleet_tanks():
+    """Tanks and block summaries, merged with the other partitions' in partitioned mode."""
+    tanks, blocks = FleetModel.tanks(), FleetModel.block_summaries()
+    partitioning = current_app.extensions['partitioning']
+    if partitioning.enabled:
+        # A block lives on one partition, so the summaries just concatenate
+        for payload in partitioning.fan_out('/api/partition/tanks', skip_self=True).values():
+            tanks.extend(SimpleNamespace(**data) for data in (payload or {}).get('tanks', []))
+            blocks.extend((payload or {}).get('blocks', []))
+        tanks.sort(key=lambda t: t.id)
+        blocks.sort(key=lambda b: b['block'])
+    return tanks, blocks
 
 @dashboard_bp.route('/tanks/create', methods=['POST'])
 @login_required
@@ -42,8 +114,9 @@ def create_tank():
     capacity = request.form.get('capacity')
     
     tank = Tank(name=name, type=type, capacity=capacity)
+    current_app.extensions['partitioning'].assign_id(tank)
     db.session.add(tank)
-    db.session.commit()
+    commit_devices(tank)
     flash('Tanque criado com sucesso!', 'success')
     return redirect(url_for('dashboard.tanks'))
 
@@ -63,19 +136,31 @@ def update_tank(id):
     # Update Level if provided
     if request.form.get('level'):
         tank.level = int(request.form.get('level'))
-        tank.last_refill = datetime.utcnow()
+        tank.last_refill = Clock.utcnow()
         
-    db.session.commit()
+    commit_devices(tank)
     flash('Tanque atualizado com sucesso!', 'success')
     return redirect(url_for('dashboard.tanks'))
 
 @dashboard_bp.route('/feeder/<int:id>')
 @login_required
 def feeder_detail(id):
-    feeder = Feeder.query.get_or_404(id)
-    logs = Log.query.filter_by(feeder_id=id).order_by(Log.timestamp.desc()).limit(50).all()
-    tanks = Tank.query.all()
-    return render_template('feeder.html', feeder=feeder, logs=logs, tanks=tanks)
+    feeder = FleetModel.feeder(id) or abort(404)
+    online = _is_online(feeder, Clock.utcnow())
+
+    def render():
+        # last_run moves with every new log, so it keys the recent-logs block
+        recent_logs = current_app.extensions['fragments'].render(
+            ('logs', id, feeder.last_run), '_recent_logs.html',
+            lambda: {'logs': Log.query.filter_by(feeder_id=id).order_by(Log.timestamp.desc()).limit(50).all()}
+        )
+        return render_template(
+            'feeder.html', feeder=feeder, online=online, recent_logs=recent_logs,
+            food_tank_options=_tank_options('food', feeder.food_tank_id),
+            water_tank_options=_tank_options('water', feeder.water_tank_id)
+        )
+
+    return _conditional(('feeder', id, feeder.digest(), FleetModel.tanks_digest(), online), render)
 
 @dashboard_bp.route('/feeder/<int:id>/update', methods=['POST'])
 @login_required
@@ -97,9 +182,11 @@ def update_feeder(id):
     feeder.warning_weight = float(request.form.get('warning_weight', 80.0))
     feeder.critical_weight = float(request.form.get('critical_weight', 20.0))
     feeder.dose_count = int(request.form.get('dose_count', 1))
+    if request.form.get('weight_filter') in FILTERS:
+        feeder.weight_filter = request.form.get('weight_filter')
     
-    feeder.food_tank_id = request.form.get('food_tank_id') or None
-    feeder.water_tank_id = request.form.get('water_tank_id') or None
+    feeder.food_tank_id = request.form.get('food_tank_id', type=int)
+    feeder.water_tank_id = request.form.get('water_tank_id', type=int)
     
     feeder.avatar = request.form.get('avatar')
     feeder.mode = request.form.get('mode')
@@ -142,14 +229,15 @@ def update_feeder(id):
     times = request.form.getlist('schedule_times')
     feeder.schedule_times = json.dumps(times)
     
-    db.session.commit()
+    commit_devices(feeder)
     flash('Configurações atualizadas!', 'success')
     return redirect(url_for('dashboard.feeder_detail', id=id))
 
 @dashboard_bp.route('/feeder/<int:id>/feed', methods=['POST'])
 @login_required
 def feed_now(id):
-    feeder = Feeder.query.get_or_404(id)
+    # Safety interlock: read the lock from the row, never from the (possibly stale) read model
+    feeder = db.session.get(Feeder, id) or abort(404)
     
     if feeder.is_locked:
         flash('ERRO: O alimentador está travado (Safety Lock).', 'danger')
@@ -164,6 +252,7 @@ def feed_now(id):
         'units': 1, # Refill 1 unit (target_weight)
         'duration': feeder.open_duration_ms # Or specific refill duration
     })
+    db.session.commit()  # their ack deadlines
     
     flash('Ciclo de Alimentação Iniciado (Liberar + Reabastecer)!', 'info')
     return redirect(url_for('dashboard.feeder_detail', id=id))
@@ -172,21 +261,74 @@ def feed_now(id):
 @login_required
 def logs():
     page = request.args.get('page', 1, type=int)
+    partitioning = current_app.extensions['partitioning']
+    if partitioning.enabled:
+        return render_template('logs.html', logs=_fleet_logs(partitioning, max(page, 1), per_page=20))
     logs = Log.query.order_by(Log.timestamp.desc()).paginate(page=page, per_page=20)
     return render_template('logs.html', logs=logs)
 
+def _fleet_logs(partitioning, page, per_page):
+    # The newest page * per_page logs of every partition hold the requested page
+    limit = page * per_page
+    total = db.session.query(db.func.count(Log.id)).scalar()
+    logs = [snapshot_log(*row) for row in export.recent_logs(limit)]
+    for payload in partitioning.fan_out('/api/partition/logs', {'limit': limit}, skip_self=True).values():
+        total += (payload or {}).get('total', 0)
+        logs.extend((payload or {}).get('logs', []))
+    logs.sort(key=lambda log: (log['timestamp'], log['id']), reverse=True)
+    pages = max(ceil(total / per_page), 1)
+    return SimpleNamespace(
+        items=[remote_log(log) for log in logs[limit - per_page:limit]],
+        page=page, pages=pages,
+        has_prev=page > 1, prev_num=page - 1,
+        has_next=page < pages, next_num=page + 1
+    )
+
+def _export_response(kind):
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    try:
+        rows = export.rows_for(kind, request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid date (use YYYY-MM-DD or ISO datetime)'}), 400
+
+    partitioning = current_app.extensions['partitioning']
+    if partitioning.enabled:
+        params = {k: v for k, v in request.args.items() if k != 'format'}
+        rows = export.merge(kind, rows, [partitioning.stream(name, f'/api/partition/export/{kind}', params)
+                                         for name in partitioning.names if name != partitioning.self_name])
+
+    filename = f"{kind}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    # No Content-Length: the body goes out chunked as the generator yields
+    return Response(
+        stream_with_context(export.stream(fmt, export.COLUMNS[kind], rows)),
+        mimetype=export.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@dashboard_bp.route('/logs/export')
+@login_required
+def export_logs():
+    return _export_response('logs')
+
+@dashboard_bp.route('/feeders/export')
+@login_required
+def export_feeders():
+    return _export_response('feeders')
+
 @dashboard_bp.route('/register', methods=['GET'])
 @login_required
 def register_page():
-    tanks = Tank.query.all()
+    tanks, _ = _fleet_tanks()
     return render_template('register.html', new_feeder=None, tanks=tanks)
 
 @dashboard_bp.route('/register', methods=['POST'])
 @login_required
 def register_feeder_action():
     name = request.form.get('name')
-    food_tank_id = request.form.get('food_tank_id') or None
-    water_tank_id = request.form.get('water_tank_id') or None
+    food_tank_id = request.form.get('food_tank_id', type=int)
+    water_tank_id = request.form.get('water_tank_id', type=int)
     avatar = request.form.get('avatar')
     
     if not name:
@@ -194,10 +336,11 @@ def register_feeder_action():
         return redirect(url_for('dashboard.register_page'))
     
     feeder = Feeder(name=name, food_tank_id=food_tank_id, water_tank_id=water_tank_id, avatar=avatar)
+    current_app.extensions['partitioning'].assign_id(feeder)
     db.session.add(feeder)
-    db.session.commit()
+    commit_devices(feeder)
     
-    tanks = Tank.query.all()
+    tanks, _ = _fleet_tanks()
     return render_template('register.html', new_feeder=feeder, tanks=tanks)
 
 @dashboard_bp.route('/settings')
@@ -208,8 +351,72 @@ def settings():
 @dashboard_bp.route('/firmware')
 @login_required
 def firmware():
-    feeders = Feeder.query.all()
-    return render_template('firmware.html', feeders=feeders)
+    feeders = FleetModel.feeders()
+    store = current_app.extensions['firmware']
+    releases = []
+    for release in Firmware.query.order_by(Firmware.id.desc()).all():
+        releases.append({
+            'release': release,
+            'in_wave': sum(1 for f in feeders if rollout_bucket(release.version, f.id) < release.rollout_percent),
+            'installed': sum(1 for f in feeders if f.firmware_version == release.version)
+        })
+    return render_template('firmware.html', feeders=feeders, releases=releases,
+                           busy_slots=store.busy_slots(), max_downloads=store.max_downloads)
+
+@dashboard_bp.route('/firmware/upload', methods=['POST'])
+@login_required
+def upload_firmware():
+    if not current_user.is_admin:
+        flash('Acesso negado. Apenas administradores podem publicar firmware.', 'error')
+        return redirect(url_for('dashboard.firmware'))
+
+    file = request.files.get('file')
+    version = (request.form.get('version') or '').strip()
+    if not file or not version:
+        flash('Informe a versão e o arquivo .bin do firmware.', 'error')
+    elif version_key(version) is None:
+        # Feeders are only offered newer builds, so the version must be comparable
+        flash('Versão inválida: use o formato 1.2.3.', 'error')
+    elif Firmware.query.filter_by(version=version).first():
+        flash(f'A versão {version} já existe.', 'error')
+    else:
+        release = current_app.extensions['firmware'].add(file.stream, version, request.form.get('notes'))
+        flash(f'Firmware {release.version} publicado ({release.size} bytes). Rollout em 0%.', 'success')
+    return redirect(url_for('dashboard.firmware'))
+
+@dashboard_bp.route('/firmware/<int:id>/rollout', methods=['POST'])
+@login_required
+def firmware_rollout(id):
+    if not current_user.is_admin:
+        flash('Acesso negado. Apenas administradores podem alterar o rollout.', 'error')
+        return redirect(url_for('dashboard.firmware'))
+
+    release = Firmware.query.get_or_404(id)
+    percent = request.form.get('rollout_percent', type=int)
+    release.rollout_percent = max(0, min(100, percent or 0))
+    db.session.commit()
+    current_app.extensions['firmware'].invalidate()
+    flash(f'Rollout do firmware {release.version}: {release.rollout_percent}% da frota.', 'info')
+    return redirect(url_for('dashboard.firmware'))
+
+@dashboard_bp.route('/debug/sql')
+@login_required
+def sql_profile():
+    # Only with SQL_PROFILE=1; reports are per worker process
+    profiler = current_app.extensions.get('sql_profiler')
+    if profiler is None or not current_user.is_admin:
+        abort(404)
+    if request.args.get('format') == 'json':
+        return jsonify({'routes': profiler.by_endpoint(), 'requests': profiler.recent()})
+    return render_template('sql_profile.html', routes=profiler.by_endpoint(), reports=profiler.recent()[:100],
+                           threshold=profiler.repeat_threshold, slow_ms=profiler.slow_ms)
+
+@dashboard_bp.route('/commands')
+@login_required
+def command_latency():
+    # Read from the shared command rows; only the unmatched-ack counter is per worker
+    feeder_names = {str(f.id): f.name for f in FleetModel.feeders()}
+    return render_template('commands.html', stats=CommandTrace.stats(), feeder_names=feeder_names)
 
 @dashboard_bp.route('/wiring')
 @login_required
@@ -223,8 +430,10 @@ def update_theme():
     new_theme = data.get('theme')
     
     if new_theme in ['light', 'dark']:
-        current_user.theme = new_theme
+        # current_user is a detached CachedUser: update the row directly
+        User.query.filter_by(id=current_user.id).update({'theme': new_theme})
         db.session.commit()
+        UserCache.invalidate(current_user.id)
         return jsonify({'success': True})
     
     return jsonify({'success': False}), 400
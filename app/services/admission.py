@@ -0,0 +1,202 @@
+# Admission control for the device API (heartbeat storms after a Wi-Fi outage).
+# State lives in a small mmap'd file shared by every gunicorn worker, guarded by
+# flock (plus a thread lock, since flock does not exclude threads of one process):
+#
+#   counters   <4Q>        admitted, rate_limited, shed_busy, shed_queue
+#   workers    64 x <iI>   (pid, requests in flight); dead pids are ignored, so a
+#                          killed worker cannot leak capacity
+#   buckets    N x <Qdd>   per-device token bucket (key, tokens, updated)
+#
+# Plain heartbeats (report_status/get_config/tank status with nothing to deliver)
+# pay a token from their device's bucket and only get `low_share` of the in-flight
+# cap. A request only pays from the device's bucket when its Bearer token matches
+# the cached device; anything else pays from a bucket of its client address and is
+# never priority, so a forged request cannot drain a real device's tokens. Priority requests (pending commands, alarm states, command ack/log) skip the
+# bucket and may use the whole cap. Rejections are fast (no DB access) and carry a
+# jittered Retry-After so reconnecting devices spread out instead of retrying in
+# lockstep. With sync workers in-flight never exceeds the worker count, so the cap
+# defaults to WEB_CONCURRENCY: plain heartbeats then keep the last worker free for
+# priority traffic. With nginx's X-Request-Start header, heartbeats that already waited
+# longer than max_queue_ms in the backlog are shed as well: with 3 sync workers the
+# backlog, not the in-flight count, is where a storm piles up.
+
+import fcntl
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from app.services.clock import Clock
+
+COUNTERS = struct.Struct('<4Q')
+WORKER = struct.Struct('<iI')
+BUCKET = struct.Struct('<Qdd')
+MAX_WORKERS = 64
+BUCKET_SLOTS = 8192
+WORKERS_AT = COUNTERS.size
+BUCKETS_AT = WORKERS_AT + MAX_WORKERS * WORKER.size
+FILE_SIZE = BUCKETS_AT + BUCKET_SLOTS * BUCKET.size
+
+COUNTER_NAMES = ('admitted', 'rate_limited', 'shed_busy', 'shed_queue')
+DEVICE_KINDS = {'feeder': 1, 'tank': 2, 'client': 3}
+
+
+class AdmissionControl:
+    def __init__(self, path, rate=1.0, burst=5, max_inflight=3, low_share=0.75, max_queue_ms=0):
+        self.rate = rate
+        self.burst = burst
+        self.max_inflight = max_inflight
+        self.low_limit = max(1, int(max_inflight * low_share))
+        self.max_queue_ms = max_queue_ms
+        self._thread_lock = threading.Lock()
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o660)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < FILE_SIZE:
+                os.ftruncate(self._fd, FILE_SIZE)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, FILE_SIZE)
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    # --- Shared state (call with the lock held) ---
+
+    def _count(self, name):
+        values = list(COUNTERS.unpack_from(self._map, 0))
+        values[COUNTER_NAMES.index(name)] += 1
+        COUNTERS.pack_into(self._map, 0, *values)
+
+    def _worker_slot(self):
+        pid = os.getpid()
+        free = None
+        for index in range(MAX_WORKERS):
+            slot_pid, _ = WORKER.unpack_from(self._map, WORKERS_AT + index * WORKER.size)
+            if slot_pid == pid:
+                return index
+            if free is None and (slot_pid == 0 or not _alive(slot_pid)):
+                free = index
+        if free is None:
+            return None
+        WORKER.pack_into(self._map, WORKERS_AT + free * WORKER.size, pid, 0)
+        return free
+
+    def _inflight(self):
+        total = 0
+        for index in range(MAX_WORKERS):
+            pid, count = WORKER.unpack_from(self._map, WORKERS_AT + index * WORKER.size)
+            if count and (pid == os.getpid() or _alive(pid)):
+                total += count
+        return total
+
+    def _add_inflight(self, slot, delta):
+        offset = WORKERS_AT + slot * WORKER.size
+        pid, count = WORKER.unpack_from(self._map, offset)
+        WORKER.pack_into(self._map, offset, pid, max(0, count + delta))
+
+    def _take_token(self, kind, device_id, now):
+        """Returns 0 if a token was taken, else the seconds until one is available."""
+        key = (DEVICE_KINDS[kind] << 40) | device_id
+        offset = BUCKETS_AT + (key % BUCKET_SLOTS) * BUCKET.size
+        slot_key, tokens, updated = BUCKET.unpack_from(self._map, offset)
+        if slot_key != key:
+            tokens, updated = float(self.burst), now  # new device (or slot collision)
+        tokens = min(float(self.burst), tokens + max(0.0, now - updated) * self.rate)
+        if tokens >= 1.0:
+            BUCKET.pack_into(self._map, offset, key, tokens - 1.0, now)
+            return 0.0
+        BUCKET.pack_into(self._map, offset, key, tokens, now)
+        return (1.0 - tokens) / self.rate
+
+    # --- Request hooks ---
+
+    def admit(self, kind, device_id, priority, queued_ms=None):
+        """Returns None if admitted (call release() at teardown), else (status, reason, retry_after)."""
+        if not priority and self.max_queue_ms and queued_ms is not None and queued_ms > self.max_queue_ms:
+            with self._locked():
+                self._count('shed_queue')
+            return 503, 'shed_queue', self._jitter(1.0)
+
+        now = Clock.time()
+        with self._locked():
+            if not priority and device_id is not None:
+                wait = self._take_token(kind, device_id, now)
+                if wait:
+                    self._count('rate_limited')
+                    return 429, 'rate_limited', self._jitter(wait)
+
+            limit = self.max_inflight if priority else self.low_limit
+            slot = self._worker_slot()
+            if slot is None or self._inflight() >= limit:
+                self._count('shed_busy')
+                return 503, 'shed_busy', self._jitter(1.0)
+
+            self._add_inflight(slot, 1)
+            self._count('admitted')
+        self._local.slot = slot
+        return None
+
+    def release(self):
+        slot = getattr(self._local, 'slot', None)
+        if slot is None:
+            return
+        self._local.slot = None
+        with self._locked():
+            self._add_inflight(slot, -1)
+
+    def stats(self):
+        with self._locked():
+            counters = dict(zip(COUNTER_NAMES, COUNTERS.unpack_from(self._map, 0)))
+            counters['in_flight'] = self._inflight()
+        counters['max_inflight'] = self.max_inflight
+        counters['heartbeat_limit'] = self.low_limit
+        return counters
+
+    def load(self):
+        """Share (0-1) of the in-flight cap in use across all workers."""
+        with self._locked():
+            return min(1.0, self._inflight() / self.max_inflight)
+
+    @staticmethod
+    def _jitter(seconds):
+        # Spread retries over [1x, 3x] so a reconnect storm does not come back in lockstep
+        return max(1, int(seconds * random.uniform(1.0, 3.0) + 0.999))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def client_key(address):
+    """Bucket id (40 bits) of an unauthenticated client address."""
+    return zlib.crc32((address or '').encode()) & 0xFFFFFFFFFF
+
+
+def queued_ms(header, now=None):
+    """Backlog wait from nginx's `X-Request-Start: t=<epoch seconds.millis>` (wall clock)."""
+    if not header:
+        return None
+    try:
+        started = float(header.split('=', 1)[-1])
+    except ValueError:
+        return None
+    return max(0.0, ((now or time.time()) - started) * 1000)
@@ -0,0 +1,129 @@
+# Per-block inventory totals, maintained incrementally by the fleet read model.
+# Every time FleetModel applies a feeder or tank record (local commit or resync),
+# the device's previous contribution to its block is subtracted and the new one
+# added, so a block summary is a dict lookup instead of a GROUP BY over feeders
+# and tanks. Drawer weights are grams, food tanks kg, water tanks litres.
+
+import threading
+
+
+def derived_level(current_weight, max_weight):
+    """Tank level (0-100 %) from its scale reading, or None without a capacity."""
+    if not max_weight or current_weight is None:
+        return None
+    return max(0, min(100, int(round(100.0 * current_weight / max_weight))))
+
+
+class _Block:
+    __slots__ = ('name', 'feeders', 'statuses', 'drawer_g', 'food_kg', 'food_capacity_kg',
+                 'water_l', 'water_capacity_l', 'tanks')
+
+    def __init__(self, name):
+        self.name = name
+        self.feeders = 0
+        self.statuses = {}
+        self.drawer_g = 0.0
+        self.food_kg = 0.0
+        self.food_capacity_kg = 0.0
+        self.water_l = 0.0
+        self.water_capacity_l = 0.0
+        self.tanks = set()
+
+    def empty(self):
+        return not self.feeders and not self.tanks
+
+    def to_dict(self, tanks=()):
+        drawer_kg = self.drawer_g / 1000.0
+        return {
+            'block': self.name,
+            'feeders': self.feeders,
+            'status': dict(sorted((s, n) for s, n in self.statuses.items() if n)),
+            'drawer_food_kg': round(drawer_kg, 3),
+            'tank_food_kg': round(self.food_kg, 3),
+            'total_food_kg': round(drawer_kg + self.food_kg, 3),
+            'food_tank_level': derived_level(self.food_kg, self.food_capacity_kg),
+            'water_l': round(self.water_l, 3),
+            'water_tank_level': derived_level(self.water_l, self.water_capacity_l),
+            'tanks': [{'id': t.id, 'name': t.name, 'type': t.type, 'level': t.level,
+                       'current_weight': t.current_weight, 'max_weight': t.max_weight} for t in tanks],
+        }
+
+
+class BlockAggregates:
+    _blocks = {}         # block name -> _Block
+    _contributions = {}  # ('feeder' | 'tank', id) -> tuple added to a block
+    _lock = threading.RLock()
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._blocks = {}
+            cls._contributions = {}
+
+    @classmethod
+    def feeder(cls, feeder_id, block_name, status, drawer_weight):
+        cls._replace(('feeder', feeder_id), (block_name, status, drawer_weight or 0.0) if block_name else None)
+
+    @classmethod
+    def tank(cls, tank_id, block_name, type, current_weight, max_weight):
+        cls._replace(('tank', tank_id),
+                     (block_name, type, current_weight or 0.0, max_weight or 0.0) if block_name else None)
+
+    @classmethod
+    def remove(cls, kind, device_id):
+        cls._replace((kind, device_id), None)
+
+    @classmethod
+    def _replace(cls, key, contribution):
+        with cls._lock:
+            previous = cls._contributions.get(key)
+            if previous == contribution:
+                return
+            if previous is not None:
+                cls._apply(key, previous, -1)
+            if contribution is None:
+                cls._contributions.pop(key, None)
+            else:
+                cls._contributions[key] = contribution
+                cls._apply(key, contribution, 1)
+
+    @classmethod
+    def _apply(cls, key, contribution, sign):
+        kind, device_id = key
+        block = cls._blocks.get(contribution[0])
+        if block is None:
+            block = cls._blocks[contribution[0]] = _Block(contribution[0])
+
+        if kind == 'feeder':
+            _, status, weight = contribution
+            block.feeders += sign
+            block.statuses[status] = block.statuses.get(status, 0) + sign
+            block.drawer_g += sign * weight
+        else:
+            _, type, weight, capacity = contribution
+            if sign > 0:
+                block.tanks.add(device_id)
+            else:
+                block.tanks.discard(device_id)
+            if type == 'food':
+                block.food_kg += sign * weight
+                block.food_capacity_kg += sign * capacity
+            elif type == 'water':
+                block.water_l += sign * weight
+                block.water_capacity_l += sign * capacity
+
+        if block.empty():
+            del cls._blocks[block.name]
+
+    # --- Read side (call through FleetModel, which keeps them fresh) ---
+
+    @classmethod
+    def get(cls, name):
+        with cls._lock:
+            block = cls._blocks.get(name)
+            return (block, sorted(block.tanks)) if block is not None else (None, [])
+
+    @classmethod
+    def names(cls):
+        with cls._lock:
+            return sorted(cls._blocks)
@@ -0,0 +1,254 @@
+# Static assets: vendored front-end libraries, content-hashed build, pre-compression.
+#
+# The dashboard used to pull Tailwind, Lucide, Chart.js, the Inter font and the
+# avatar icons from four CDNs on every page. `flask --app main assets --fetch`
+# downloads the pinned VENDOR files into app/static/vendor once, and refuses any
+# file whose sha256 is not the pinned one; `--css` compiles the Tailwind classes
+# the templates use into css/app.css with the pinned Tailwind CLI (the Play CDN
+# script compiled them in every browser on every page load). `assets` then
+# copies every static file to app/static/dist as <name>.<hash>.<ext> (CSS url()
+# references rewritten to the hashed names), writes .gz and, when the optional
+# `brotli` package is installed, .br next to each compressible one, and records
+# the mapping in dist/manifest.json.
+#
+# Templates link through asset_url('vendor/chart.umd.min.js'): the hashed dist
+# file when built, the plain static file otherwise, or the CDN for a vendored
+# library that was never fetched (development checkout). Hashed files never
+# change, so both the app and nginx (biofeed.conf) serve them with a one-year
+# `immutable` Cache-Control and pick the pre-compressed variant the client
+# accepts. Files of the previous build are kept for pages already in flight.
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import subprocess
+import tempfile
+import urllib.request
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # optional: gzip variants only
+    brotli = None
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+COMPRESSIBLE = ('.js', '.css', '.svg', '.json', '.txt', '.map', '.ico')
+CSS_URL = re.compile(r"""url\(\s*(['"]?)(?!data:|https?:|//|/)([^'")?#]+)([^'")]*)\1\s*\)""")
+
+# Pinned front-end libraries: static path -> (source URL, sha256 of the file).
+# A download whose digest differs is refused; an entry without a digest is refused
+# too, and the error prints the digest to pin once the file has been reviewed.
+# (css/fonts.css repeats the Inter URL as its fallback src: keep the pins in step)
+VENDOR = {
+    'vendor/lucide.min.js': ('https://unpkg.com/lucide@0.468.0/dist/umd/lucide.min.js', None),
+    'vendor/chart.umd.min.js': ('https://cdn.jsdelivr.net/npm/chart.js@4.4.7/dist/chart.umd.min.js', None),
+    'vendor/inter-latin-wght-normal.woff2': (
+        'https://cdn.jsdelivr.net/npm/@fontsource-variable/inter@5.1.0/files/inter-latin-wght-normal.woff2', None),
+    'vendor/avatars/squirrel.png': ('https://cdn-icons-png.flaticon.com/512/2316/2316669.png', None),
+    'vendor/avatars/mouse.png': ('https://cdn-icons-png.flaticon.com/512/7002/7002275.png', None),
+    'vendor/avatars/twister.png': ('https://cdn-icons-png.flaticon.com/512/5228/5228693.png', None),
+}
+
+# Tailwind build: tailwind.config.js scans the templates, the output is an ordinary
+# static file (hashed and compressed by build() like the others)
+TAILWIND_VERSION = '3.4.16'
+TAILWIND_CONFIG = 'tailwind.config.js'
+TAILWIND_INPUT = 'tailwind.css'
+TAILWIND_OUTPUT = 'css/app.css'
+
+
+class VendorError(Exception):
+    pass
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def fetch_vendor(static_dir, force=False, timeout=30):
+    """Downloads the missing (or all, with force) VENDOR files. Returns the fetched paths.
+
+    Files that do not match their pinned sha256 are not written; they are reported
+    together in a VendorError once the others are fetched."""
+    fetched, errors = [], []
+    for name, (url, sha256) in VENDOR.items():
+        path = os.path.join(static_dir, name)
+        if os.path.exists(path) and not force:
+            continue
+        with urllib.request.urlopen(urllib.request.Request(url, headers={'User-Agent': 'biofeed-assets'}),
+                                    timeout=timeout) as response:
+            data = response.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if sha256 is None:
+            errors.append(f"{name} has no pinned sha256; review {url} and pin '{digest}' in VENDOR")
+        elif digest != sha256:
+            errors.append(f"{name}: sha256 {digest} does not match the pinned {sha256} ({url})")
+        else:
+            _write(path, data)
+            fetched.append(name)
+    if errors:
+        raise VendorError('\n'.join(errors))
+    return fetched
+
+
+def build_css(project_dir, static_dir, run=subprocess.run):
+    """Compiles the Tailwind classes used by the templates into static/css/app.css (needs Node.js)."""
+    output = os.path.join(static_dir, TAILWIND_OUTPUT)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    run(['npx', '--yes', f'tailwindcss@{TAILWIND_VERSION}', '-c', TAILWIND_CONFIG,
+         '-i', TAILWIND_INPUT, '-o', output, '--minify'], cwd=project_dir, check=True)
+    return output
+
+
+def hashed_name(name, data):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+
+def _sources(static_dir):
+    dist = os.path.join(static_dir, DIST)
+    for root, dirs, files in os.walk(static_dir):
+        if root == static_dir and DIST in dirs:
+            dirs.remove(DIST)
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if not name.startswith('.') and not name.endswith('.part'):
+                path = os.path.join(root, name)
+                if not path.startswith(dist + os.sep):
+                    yield os.path.relpath(path, static_dir).replace(os.sep, '/')
+
+
+def _rewrite_css(name, css, manifest):
+    """Points relative url()s of a stylesheet at the hashed files."""
+    base = os.path.dirname(name)
+
+    def replace(match):
+        quote, target, suffix = match.groups()
+        logical = os.path.normpath(os.path.join(base, target)).replace(os.sep, '/')
+        if logical not in manifest:
+            return match.group(0)
+        # Relative to where the hashed stylesheet itself lands (dist/<base>)
+        relative = os.path.relpath(manifest[logical], os.path.join(DIST, base)).replace(os.sep, '/')
+        return f"url({quote}{relative}{suffix}{quote})"
+
+    return CSS_URL.sub(replace, css.decode('utf-8')).encode('utf-8')
+
+
+def build(static_dir):
+    """Writes the hashed, pre-compressed copies into static/dist. Returns build stats."""
+    dist = os.path.join(static_dir, DIST)
+    manifest_path = os.path.join(dist, MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = {}
+
+    names = list(_sources(static_dir))
+    # Stylesheets last: their url()s need the hashed names of what they reference
+    names.sort(key=lambda n: n.endswith('.css'))
+    manifest = {}
+    stats = {'files': 0, 'bytes': 0, 'gz': 0, 'br': 0, 'written': 0, 'brotli': brotli is not None}
+    for name in names:
+        with open(os.path.join(static_dir, name), 'rb') as f:
+            data = f.read()
+        if name.endswith('.css'):
+            data = _rewrite_css(name, data, manifest)
+        target = hashed_name(name, data)
+        manifest[name] = f"{DIST}/{target}"
+        stats['files'] += 1
+        stats['bytes'] += len(data)
+
+        path = os.path.join(dist, target)
+        variants = [(path, data)]
+        if name.endswith(COMPRESSIBLE):
+            variants.append((path + '.gz', gzip.compress(data, 9, mtime=0)))
+            if brotli is not None:
+                variants.append((path + '.br', brotli.compress(data, quality=11)))
+        for variant, content in variants:
+            if variant != path and len(content) >= len(data) * 0.95:
+                continue  # not worth a Content-Encoding
+            if variant != path:
+                stats[variant.rsplit('.', 1)[1]] += len(content)
+            if not os.path.exists(variant):  # same hash, same bytes
+                _write(variant, content)
+                stats['written'] += 1
+
+    _write(manifest_path, json.dumps(manifest, indent=1, sort_keys=True).encode())
+    stats['pruned'] = _prune(dist, manifest, previous)
+    return stats
+
+
+def _prune(dist, manifest, previous):
+    keep = {MANIFEST}
+    for target in list(manifest.values()) + list(previous.values()):
+        target = target[len(DIST) + 1:]
+        keep.update((target, target + '.gz', target + '.br'))
+    removed = 0
+    for root, _, files in os.walk(dist):
+        for name in files:
+            relative = os.path.relpath(os.path.join(root, name), dist).replace(os.sep, '/')
+            if relative not in keep:
+                os.remove(os.path.join(root, name))
+                removed += 1
+    return removed
+
+
+class Assets:
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self.manifest = {}
+        self.hashed = set()
+        self._resolved = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(os.path.join(self.static_dir, DIST, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+        self.hashed = set(self.manifest.values())
+        self._resolved = {}
+
+    def exists(self, filename):
+        """True if the file is built or present in static (templates pick a fallback otherwise)."""
+        return filename in self.manifest or os.path.exists(os.path.join(self.static_dir, filename))
+
+    def url(self, filename, **kwargs):
+        """url_for('static', ...) for templates, through the build manifest."""
+        target = self._resolved.get(filename)
+        if target is None:
+            target = self.manifest.get(filename)
+            if target is None and filename in VENDOR and not os.path.exists(os.path.join(self.static_dir, filename)):
+                target = VENDOR[filename][0]  # not fetched yet: straight from the CDN
+            self._resolved[filename] = target = target or filename
+        if target.startswith('https://'):
+            return target
+        return url_for('static', filename=target, **kwargs)
+
+    def serve(self, filename):
+        """Static view: hashed files get the pre-compressed variant and immutable caching."""
+        if filename not in self.hashed:
+            return current_app.send_static_file(filename)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = None
+        for candidate, ext in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[candidate] and os.path.exists(os.path.join(self.static_dir, filename + ext)):
+                encoding, filename = candidate, filename + ext
+                break
+        response = send_from_directory(self.static_dir, filename, mimetype=mimetype, max_age=31536000)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,222 @@
+# Online backups of the SQLite database (no service stop, no racing file copy).
+#
+# Copies go through SQLite's backup API from a separate read-only connection
+# into a temp file that is integrity-checked and then renamed into BACKUP_DIR as
+#   <db>-<YYYYmmddTHHMMSSZ>-<reason>.db   (scheduled, manual, pre-migration, pre-restore)
+# In WAL mode (SQLITE_WAL, the default) the copy is one step over a read
+# snapshot: writers keep committing to the WAL the whole time. In rollback-journal
+# mode a reader blocks commits, so the copy goes BACKUP_STEP_PAGES pages per step
+# with a short sleep in between; a write from another connection restarts it,
+# and after BACKUP_MAX_RESTARTS restarts the rest is copied in one step (writers
+# wait for that one, a few ms per MB). benchmarks/bench_backup.py measures both.
+#
+# Every worker runs a scheduler thread; the first one to find the newest
+# scheduled backup older than BACKUP_INTERVAL_S takes backup.lock and does it.
+
+import fcntl
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+NAME = re.compile(r'^(?P<stem>.+)-(?P<stamp>\d{8}T\d{6}Z)-(?P<reason>[a-z-]+)\.db$')
+
+
+class BackupError(RuntimeError):
+    pass
+
+
+def sqlite_path(engine):
+    """Absolute path of a file-backed SQLite database, or None."""
+    url = engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        return None
+    return os.path.abspath(url.database)
+
+
+def backup_dir(app):
+    return app.config['BACKUP_DIR'] or os.path.join(app.instance_path, 'backups')
+
+
+def enable_wal(path):
+    """Switches the database to WAL (persistent; a no-op once set). Returns the mode."""
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        return conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def integrity_ok(path):
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        return conn.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+    finally:
+        conn.close()
+
+
+def copy_database(src_path, dest_path, step_pages=1024, sleep=0.005, max_restarts=3, read_only=True):
+    """Copies a live database with the backup API. Returns copy stats."""
+    stats = {'pages': 0, 'steps': 0, 'restarts': 0, 'single_step': step_pages < 0}
+    started = time.perf_counter()
+    src = sqlite3.connect(f'file:{src_path}?mode=ro' if read_only else f'file:{src_path}', uri=True, timeout=30)
+    dest = sqlite3.connect(dest_path, timeout=30)
+    remaining = [None]
+
+    class Restarted(Exception):
+        pass
+
+    def progress(status, left, total):
+        stats['steps'] += 1
+        stats['pages'] = total
+        if remaining[0] is not None and left > remaining[0]:
+            stats['restarts'] += 1
+            if stats['restarts'] > max_restarts:
+                raise Restarted()
+        remaining[0] = left
+
+    try:
+        if step_pages >= 0 and src.execute("PRAGMA journal_mode").fetchone()[0] == 'wal':
+            step_pages = -1  # a snapshot read blocks no writer; steps would only restart
+            stats['single_step'] = True
+        if step_pages < 0:
+            src.backup(dest, pages=-1, progress=progress)
+        else:
+            try:
+                src.backup(dest, pages=step_pages, progress=progress, sleep=sleep)
+            except Restarted:
+                # Busy database: finish in one step (writers wait for this one)
+                stats['single_step'] = True
+                src.backup(dest, pages=-1, progress=progress)
+    finally:
+        dest.close()
+        src.close()
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def snapshot(db_path, directory, reason, **kwargs):
+    """Backs `db_path` up into `directory`; returns the stats with 'path' and 'bytes'."""
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    path = os.path.join(directory, f'{stem}-{stamp}-{reason}.db')
+    tmp = path + '.tmp'
+    try:
+        stats = copy_database(db_path, tmp, **kwargs)
+        if not integrity_ok(tmp):
+            raise BackupError(f"Backup of {db_path} failed the integrity check")
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    stats.update(path=path, bytes=os.path.getsize(path), reason=reason)
+    return stats
+
+
+def list_backups(directory):
+    """Backups in `directory`, newest first."""
+    backups = []
+    if not os.path.isdir(directory):
+        return backups
+    for name in os.listdir(directory):
+        match = NAME.match(name)
+        if match is None:
+            continue
+        path = os.path.join(directory, name)
+        backups.append({
+            'name': name,
+            'path': path,
+            'reason': match.group('reason'),
+            'created': datetime.strptime(match.group('stamp'), '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc),
+            'bytes': os.path.getsize(path),
+        })
+    backups.sort(key=lambda b: (b['created'], b['name']), reverse=True)
+    return backups
+
+
+def prune(directory, keep, reason='scheduled'):
+    """Deletes all but the newest `keep` backups of one kind. Returns the removed names."""
+    removed = []
+    for backup in [b for b in list_backups(directory) if b['reason'] == reason][keep:]:
+        os.remove(backup['path'])
+        removed.append(backup['name'])
+    return removed
+
+
+def restore(backup_path, db_path, directory):
+    """Replaces the live database with a backup, after snapshotting the current one.
+
+    Runs through the backup API (under the destination's write lock), so it is
+    safe against other connections; workers must still be restarted afterwards,
+    their in-memory fleet model and caches describe the old data."""
+    if not os.path.isfile(backup_path):
+        raise BackupError(f"No such backup: {backup_path}")
+    if not integrity_ok(backup_path):
+        raise BackupError(f"{backup_path} failed the integrity check; not restoring it")
+    previous = snapshot(db_path, directory, 'pre-restore', step_pages=-1) if os.path.exists(db_path) else None
+    stats = copy_database(backup_path, db_path, step_pages=-1)
+    stats['previous'] = previous['path'] if previous else None
+    return stats
+
+
+class BackupScheduler:
+    def __init__(self, db_path, directory, interval, keep=7, step_pages=1024, sleep=0.005,
+                 max_restarts=3, first_check=60.0):
+        self.db_path = db_path
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.copy_options = {'step_pages': step_pages, 'sleep': sleep, 'max_restarts': max_restarts}
+        self.first_check = first_check
+        self.last = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        # Idempotent: called on every request by main.start_background_threads
+        if self.interval <= 0 or self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='backup-scheduler', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def due(self):
+        newest = next((b for b in list_backups(self.directory) if b['reason'] == 'scheduled'), None)
+        return newest is None or time.time() - newest['created'].timestamp() >= self.interval
+
+    def run_once(self):
+        """Takes a scheduled backup if one is due and no other worker is on it."""
+        if not self.due():
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'backup.lock'), 'a') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            if not self.due():  # another worker just finished one
+                return None
+            stats = snapshot(self.db_path, self.directory, 'scheduled', **self.copy_options)
+            stats['pruned'] = prune(self.directory, self.keep)
+        self.last = stats
+        print(f"Backup: {stats['path']} ({stats['bytes']} bytes, {stats['seconds']} s, "
+              f"{stats['restarts']} restarts)")
+        return stats
+
+    def _run(self):
+        # Checked often, done rarely: the newest file's timestamp is the schedule
+        wait = self.first_check
+        while not self._stop.wait(wait):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Backup: scheduled backup failed: {e}")
+            wait = min(max(self.interval / 10, 1.0), 600.0)
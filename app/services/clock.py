@@ -0,0 +1,29 @@
+# Wall clock for the time-dependent paths (presence, feed logs, journal, online window).
+# Production reads the real clock; simulator/virtual_fleet.py installs a virtual
+# source so days of heartbeats can be replayed in seconds through the test client.
+
+import time
+from datetime import datetime, timezone
+
+
+class Clock:
+    _source = None  # callable returning epoch seconds; None = real time
+
+    @classmethod
+    def use(cls, source):
+        cls._source = source
+
+    @classmethod
+    def reset(cls):
+        cls._source = None
+
+    @classmethod
+    def time(cls):
+        return cls._source() if cls._source is not None else time.time()
+
+    @classmethod
+    def utcnow(cls):
+        """Naive UTC datetime, like datetime.utcnow() used across the models."""
+        if cls._source is None:
+            return datetime.utcnow()
+        return datetime.fromtimestamp(cls._source(), timezone.utc).replace(tzinfo=None)
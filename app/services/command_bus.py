@@ -1,24 +1,61 @@
-# Simple in-memory command bus for demonstration. 
-# In a production environment with multiple workers, use Redis or a DB table.
+# Command queue shared by all workers through the database.
+# A queued command is its `command_deadlines` row: Deadlines arms it in the
+# caller's session with the command as JSON in `payload`, and it is committed
+# with the route's own commit. A feeder polling any gunicorn worker gets the
+# commands queued on another (including the CLOSE the deadline scanner forces);
+# delivery claims each row by stamping delivered_at with a conditional UPDATE,
+# so a command is handed out once. Commands whose ack deadline already expired
+# are not delivered any more.
 
-class CommandBus:
-    _commands = {}
+import json
+from sqlalchemy import bindparam, select, update
+from database import db
+from app.models.command_deadline import CommandDeadline
+from app.services import journal
+from app.services.clock import Clock
+from app.services.deadlines import Deadlines
+
+# Core statements on the session's connection: every heartbeat asks, usually for nothing
+_PENDING = (
+    select(CommandDeadline.id, CommandDeadline.payload)
+    .where(CommandDeadline.feeder_id == bindparam('feeder_id'),
+           CommandDeadline.delivered_at.is_(None),
+           CommandDeadline.expired_at.is_(None),
+           CommandDeadline.payload.isnot(None))
+    .order_by(CommandDeadline.queued_at)
+)
+_ANY_PENDING = _PENDING.with_only_columns(CommandDeadline.id).limit(1)
 
+
+class CommandBus:
     @classmethod
     def add_command(cls, feeder_id, command):
-        if feeder_id not in cls._commands:
-            cls._commands[feeder_id] = []
-        cls._commands[feeder_id].append(command)
+        Deadlines.command_added(feeder_id, command)  # assigns command['id'], adds its row
+        journal.record(feeder_id, [('command', command)])
 
     @classmethod
     def get_commands(cls, feeder_id):
-        if feeder_id in cls._commands and cls._commands[feeder_id]:
-            # Return all pending commands and clear the list
-            cmds = cls._commands[feeder_id]
-            cls._commands[feeder_id] = []
-            return cmds
-        return []
+        """Pending commands in queue order, stamped delivered (commits when there are any)."""
+        rows = db.session.connection().execute(_PENDING, {'feeder_id': feeder_id}).all()
+        if not rows:
+            return []
+        now = Clock.time()
+        commands = []
+        for command_id, payload in rows:
+            # A poll on another worker may have claimed it in between
+            claimed = db.session.execute(
+                update(CommandDeadline)
+                .where(CommandDeadline.id == command_id, CommandDeadline.delivered_at.is_(None))
+                .values(delivered_at=now)
+            ).rowcount
+            if claimed:
+                commands.append(json.loads(payload))
+        db.session.commit()
+        return commands
 
     @classmethod
     def has_commands(cls, feeder_id):
-        return feeder_id in cls._commands and len(cls._commands[feeder_id]) > 0
+        # Commands queued by this request are still unflushed rows of its session
+        if any(isinstance(row, CommandDeadline) and row.feeder_id == feeder_id for row in db.session.new):
+            return True
+        return db.session.connection().execute(_ANY_PENDING, {'feeder_id': feeder_id}).first() is not None
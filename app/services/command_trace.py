@@ -0,0 +1,118 @@
+# Command round-trip tracing: enqueue -> delivery -> device ack.
+# Every queued command already has a row in `command_deadlines` (Deadlines arms
+# it with queued_at); the CommandBus stamps delivered_at when a feeder picks the
+# command up and the ack route stamps acked_at, status and firmware version, so
+# an ack handled by any gunicorn worker closes the trace opened by another.
+# Stage latencies are read back from the most recent acked rows (SAMPLES per
+# group) for percentiles:
+#   queued     enqueue -> delivery (waiting for the feeder to poll)
+#   delivered  delivery -> ack (execution on the device and the ack request)
+#   executed   enqueue -> ack (what the user sees after "Alimentar Agora")
+# overall, per command type, per feeder and per firmware version.
+# Only `unmatched` (acks for unknown or already acknowledged ids) is counted per
+# worker: those acks have no row to stamp.
+
+import threading
+from sqlalchemy import func
+from database import db
+from app.models.command_deadline import CommandDeadline
+
+STAGES = ('queued', 'delivered', 'executed')
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    rank = max(1, -(-p * len(ordered) // 100))
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    summary = {'count': len(ordered)}
+    for p in PERCENTILES:
+        value = percentile(ordered, p)
+        summary[f'p{p}_ms'] = round(value * 1000, 1) if value is not None else None
+    summary['max_ms'] = round(ordered[-1] * 1000, 1) if ordered else None
+    return summary
+
+
+class CommandTrace:
+    _lock = threading.Lock()
+    samples = 512
+    max_rows = 50000  # acked rows scanned per stats() call, newest first
+    unmatched = 0     # this worker only
+
+    @classmethod
+    def configure(cls, samples=512, max_rows=50000):
+        with cls._lock:
+            cls.samples = samples
+            cls.max_rows = max_rows
+            cls.unmatched = 0
+
+    # --- Hooks (ack route) ---
+
+    @classmethod
+    def unmatched_ack(cls):
+        # An ack Deadlines could not match to a pending command
+        with cls._lock:
+            cls.unmatched += 1
+
+    # --- Read side ---
+
+    @classmethod
+    def stats(cls, feeder_id=None):
+        """Stage percentiles overall and by type, feeder and firmware (or for one feeder)."""
+        query = db.session.query(
+            CommandDeadline.type, CommandDeadline.feeder_id, CommandDeadline.firmware_version,
+            CommandDeadline.queued_at, CommandDeadline.delivered_at, CommandDeadline.acked_at,
+        ).filter(CommandDeadline.acked_at.isnot(None))
+        if feeder_id is not None:
+            query = query.filter(CommandDeadline.feeder_id == feeder_id)
+        rows = query.order_by(CommandDeadline.acked_at.desc()).limit(cls.max_rows).all()
+
+        samples = {}  # (group, key, stage) -> seconds, newest first
+        for type_, feeder, firmware, queued_at, delivered_at, acked_at in rows:
+            delivered_at = delivered_at or acked_at
+            durations = {
+                'queued': delivered_at - queued_at,
+                'delivered': acked_at - delivered_at,
+                'executed': acked_at - queued_at,
+            }
+            groups = (('all', None), ('type', type_), ('feeder', feeder), ('firmware', firmware or 'unknown'))
+            for group, key in groups:
+                for stage, seconds in durations.items():
+                    values = samples.setdefault((group, key, stage), [])
+                    if len(values) < cls.samples:
+                        values.append(seconds)
+
+        def stages(group, key):
+            return {stage: summarize(samples.get((group, key, stage), ())) for stage in STAGES}
+
+        if feeder_id is not None:
+            return {'feeder_id': feeder_id, 'stages': stages('feeder', feeder_id)}
+
+        def by(group):
+            keys = sorted({key for g, key, _ in samples if g == group}, key=str)
+            return {str(key): stages(group, key) for key in keys}
+
+        counts = db.session.query(
+            func.count(CommandDeadline.id),
+            func.count(CommandDeadline.delivered_at),
+            func.count(CommandDeadline.acked_at),
+            func.count(CommandDeadline.expired_at),
+            func.count(CommandDeadline.deadline),
+        ).one()
+        failed = db.session.query(func.count(CommandDeadline.id)).filter(
+            CommandDeadline.acked_at.isnot(None), CommandDeadline.status != 'executed').scalar()
+        return {
+            'stages': stages('all', None),
+            'by_type': by('type'),
+            'by_feeder': by('feeder'),
+            'by_firmware': by('firmware'),
+            'pending': counts[4],
+            'counts': {'queued': counts[0], 'delivered': counts[1], 'acked': counts[2],
+                       'expired': counts[3], 'failed': failed, 'unmatched': cls.unmatched},
+        }
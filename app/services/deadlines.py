@@ -0,0 +1,315 @@
+# Valve timeouts and command deadlines, shared by all workers through the database.
+#
+# - Every command put on the CommandBus gets an id and an ack deadline
+#   (COMMAND_ACK_TIMEOUT_S); the device's /ack cancels it. An expired command
+#   raises a fault (TRIP with trip_reason) on its feeder.
+# - A `water_control OPEN` arms the feeder's valve deadline: its duration plus
+#   WATER_VALVE_GRACE_S, or WATER_VALVE_MAX_OPEN_S for an open without duration
+#   (manual control). A CLOSE disarms it. On expiry, an acknowledged timed open
+#   is simply marked CLOSED (the device closed it itself); otherwise the device
+#   may have crashed with the valve open, so a CLOSE is issued, the valve is
+#   marked CLOSED and the feeder trips.
+# Feeders in maintenance mode get the close, never the trip.
+#
+# Deadlines are rows of `command_deadlines`, so an ack handled by any gunicorn
+# worker cancels a deadline armed by another. Arming adds the row to the
+# caller's session (it is committed with the route's own commit); acks and
+# expiries claim a row with a conditional UPDATE, so each deadline resolves once
+# (a late ack still stamps an expired row, once).
+# Every worker runs a ticker thread, but only the one holding deadlines.lock
+# (flock, released when its process dies) keeps the deadlines in a timing wheel:
+# all armed rows are loaded on election, then every DEADLINE_TICK_S the rows
+# queued since the last load (armed on other workers) are added and the wheel
+# advances. A deadline that fires is checked against its row before anything is
+# written, since acks and CLOSEs handled elsewhere only touch the row. The
+# simulator disables the thread and calls advance() from its virtual clock.
+
+import atexit
+import fcntl
+import os
+import threading
+import time
+import json
+import uuid
+from sqlalchemy import func, or_, update
+from database import db
+from app.models.command_deadline import CommandDeadline
+from app.models.feeder import Feeder
+from app.services.clock import Clock
+from app.services.fleet import commit_devices
+from app.services.timing_wheel import TimingWheel
+
+RETENTION_S = 86400  # resolved rows are kept this long (stats, late acks)
+LOAD_OVERLAP_S = 60.0  # rows commit after their queued_at stamp: each load re-reads this far back
+
+
+class Deadlines:
+    _app = None
+    _lock = threading.RLock()
+    _thread = None
+    _stopping = False
+    _leader = None  # open deadlines.lock while this process is the scanner
+    _wheel = None   # scanner only: ('command' | 'valve', row id) timers
+    _loaded_at = None
+    _pruned_at = 0.0
+    lock_path = None
+    tick = 1.0
+    command_timeout = 300.0
+    valve_grace = 30.0
+    valve_max_open = 600.0
+    use_thread = True
+
+    @classmethod
+    def configure(cls, app, tick=1.0, command_timeout=300.0, valve_grace=30.0,
+                  valve_max_open=600.0, use_thread=True, lock_path=None):
+        cls.stop()
+        with cls._lock:
+            cls._app = app
+            cls.tick = tick
+            cls.command_timeout = command_timeout
+            cls.valve_grace = valve_grace
+            cls.valve_max_open = valve_max_open
+            cls.use_thread = use_thread
+            cls.lock_path = lock_path or os.path.join(app.instance_path, 'deadlines.lock')
+            cls._wheel = None
+            cls._loaded_at = None
+            cls._pruned_at = 0.0
+
+    # --- Hooks (CommandBus and the ack route) ---
+
+    @classmethod
+    def command_added(cls, feeder_id, command):
+        """Gives the command an id and arms its deadlines in the caller's session (no-op until configured)."""
+        command.setdefault('id', uuid.uuid4().hex[:12])
+        if cls._app is None:
+            return
+        now = Clock.time()
+        row = CommandDeadline(id=command['id'], feeder_id=feeder_id, type=command.get('type'),
+                              duration=command.get('duration'), payload=json.dumps(command),
+                              queued_at=now, deadline=now + cls.command_timeout)
+        if command.get('type') == 'water_control':
+            # A new OPEN replaces the armed one, a CLOSE disarms it
+            db.session.execute(
+                update(CommandDeadline)
+                .where(CommandDeadline.feeder_id == feeder_id, CommandDeadline.valve_deadline.isnot(None))
+                .values(valve_deadline=None)
+            )
+            if command.get('action') == 'OPEN':
+                duration_s = (command.get('duration') or 0) / 1000.0
+                row.valve_deadline = now + (duration_s + cls.valve_grace if duration_s else cls.valve_max_open)
+                row.valve_timed = bool(duration_s)
+        db.session.add(row)
+        with cls._lock:
+            if cls._wheel is not None:
+                # Armed on the scanner itself: no need to wait for the next load
+                cls._schedule(row.id, row.deadline, row.valve_deadline)
+
+    @classmethod
+    def acknowledged(cls, feeder_id, command_id, status=None, firmware_version=None):
+        """Device ack: cancels the command deadline and stamps the trace (commits).
+        Returns the command's row (expired_at set for a late ack), or None for
+        unknown or already acknowledged ids."""
+        if cls._app is None or not isinstance(command_id, str):
+            return None
+        result = db.session.execute(
+            update(CommandDeadline)
+            .where(CommandDeadline.id == command_id, CommandDeadline.feeder_id == feeder_id,
+                   CommandDeadline.acked_at.is_(None))
+            .values(acked_at=Clock.time(), deadline=None, status=status, firmware_version=firmware_version)
+        )
+        db.session.commit()
+        if result.rowcount != 1:
+            return None
+        with cls._lock:
+            if cls._wheel is not None:
+                cls._wheel.cancel(('command', command_id))
+        return db.session.get(CommandDeadline, command_id)
+
+    @classmethod
+    def pending(cls):
+        if cls._app is None:
+            return {'commands': 0, 'valves': 0, 'expired': {'command': 0, 'valve': 0}}
+        row = db.session.query(
+            func.count(CommandDeadline.deadline),
+            func.count(CommandDeadline.valve_deadline),
+            func.count(CommandDeadline.expired_at),
+            func.count(CommandDeadline.valve_expired_at),
+        ).one()
+        return {'commands': row[0], 'valves': row[1],
+                'expired': {'command': row[2], 'valve': row[3]},
+                'scanner': cls._leader is not None,
+                'timers': len(cls._wheel) if cls._wheel is not None else None}
+
+    # --- Expiry ---
+
+    @classmethod
+    def advance(cls, now=None):
+        """Fires every deadline due by now; returns how many expired."""
+        if cls._app is None:
+            return 0
+        now = Clock.time() if now is None else now
+        fired = 0
+        with cls._app.app_context():
+            try:
+                with cls._lock:
+                    cls._load(now)
+                    due = cls._wheel.advance(now)
+                for kind in ('command', 'valve'):
+                    ids = [command_id for (key_kind, command_id), _ in due if key_kind == kind]
+                    if ids:
+                        fired += cls._fire(kind, ids, now)
+                if now - cls._pruned_at >= 3600:
+                    cls._prune(now)
+            finally:
+                db.session.remove()
+        return fired
+
+    @classmethod
+    def _load(cls, now):
+        """Schedules the armed rows: all of them on election, then the recently queued ones."""
+        query = db.session.query(CommandDeadline.id, CommandDeadline.deadline, CommandDeadline.valve_deadline) \
+            .filter(or_(CommandDeadline.deadline.isnot(None), CommandDeadline.valve_deadline.isnot(None)))
+        if cls._wheel is None:
+            # One tick back, so rows already overdue fire on this advance
+            cls._wheel = TimingWheel(tick=cls.tick, now=now - cls.tick)
+        else:
+            query = query.filter(CommandDeadline.queued_at > cls._loaded_at - LOAD_OVERLAP_S)
+        for command_id, deadline, valve_deadline in query:
+            cls._schedule(command_id, deadline, valve_deadline)
+        cls._loaded_at = now
+
+    @classmethod
+    def _schedule(cls, command_id, deadline, valve_deadline):
+        if deadline is not None:
+            cls._wheel.schedule(('command', command_id), deadline)
+        if valve_deadline is not None:
+            cls._wheel.schedule(('valve', command_id), valve_deadline)
+
+    @classmethod
+    def _fire(cls, kind, ids, now):
+        # Acked, disarmed or replaced meanwhile: the row says so, nothing is written
+        column = CommandDeadline.deadline if kind == 'command' else CommandDeadline.valve_deadline
+        due = db.session.query(CommandDeadline.id) \
+            .filter(CommandDeadline.id.in_(ids), column <= now).order_by(column).all()
+        return sum(cls._expire(command_id, now, kind) for (command_id,) in due)
+
+    @classmethod
+    def _expire(cls, command_id, now, kind):
+        # Claim the row first: an ack that got there in between wins
+        if kind == 'command':
+            column, stamp, handler = CommandDeadline.deadline, 'expired_at', cls._command_expired
+        else:
+            column, stamp, handler = CommandDeadline.valve_deadline, 'valve_expired_at', cls._valve_expired
+        try:
+            claimed = db.session.execute(
+                update(CommandDeadline)
+                .where(CommandDeadline.id == command_id, column.isnot(None), column <= now)
+                .values({column.key: None, stamp: now})
+            ).rowcount
+            if not claimed:
+                db.session.rollback()
+                return 0
+            handler(db.session.get(CommandDeadline, command_id))
+            db.session.commit()
+            return 1
+        except Exception as e:
+            db.session.rollback()
+            print(f"Deadlines: failed to expire {command_id}: {e}")
+            return 0
+
+    @classmethod
+    def _prune(cls, now):
+        db.session.query(CommandDeadline).filter(
+            CommandDeadline.queued_at < now - RETENTION_S,
+            CommandDeadline.deadline.is_(None),
+            CommandDeadline.valve_deadline.is_(None),
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        cls._pruned_at = now
+
+    @classmethod
+    def _command_expired(cls, row):
+        feeder = db.session.get(Feeder, row.feeder_id)
+        if feeder is None:
+            return
+        print(f"Feeder {row.feeder_id}: command {row.type} ({row.id}) not acknowledged.")
+        cls._fault(feeder, f"Comando {row.type} sem confirmação em {cls.command_timeout:g} s")
+        commit_devices(feeder)
+
+    @classmethod
+    def _valve_expired(cls, row):
+        feeder = db.session.get(Feeder, row.feeder_id)
+        if feeder is None:
+            return
+        feeder.water_valve_state = 'CLOSED'
+        if not (row.acked_at is not None and row.valve_timed):
+            from app.services.command_bus import CommandBus
+            print(f"Feeder {row.feeder_id}: water valve deadline expired. Forcing CLOSE.")
+            CommandBus.add_command(row.feeder_id, {'type': 'water_control', 'action': 'CLOSE', 'duration': 0})
+            if not row.valve_timed:
+                reason = f"Válvula de água aberta por mais de {cls.valve_max_open:g} s"
+            else:
+                reason = "Válvula de água sem confirmação de fechamento"
+            cls._fault(feeder, reason)
+        commit_devices(feeder)
+
+    @staticmethod
+    def _fault(feeder, reason):
+        # Maintenance suppresses alarms; an existing trip keeps its first reason
+        if feeder.maintenance_mode or feeder.status == 'TRIP':
+            return
+        feeder.status = 'TRIP'
+        feeder.trip_reason = reason
+
+    # --- Ticker thread (one scanning worker) ---
+
+    @classmethod
+    def ensure_started(cls):
+        # Started on first request so the thread lives in the worker, not a pre-fork master
+        if not cls.use_thread or cls._thread is not None:
+            return
+        with cls._lock:
+            if cls._thread is None:
+                cls._stopping = False
+                cls._thread = threading.Thread(target=cls._run, name='deadlines', daemon=True)
+                cls._thread.start()
+                atexit.register(cls.stop)
+
+    @classmethod
+    def _elect(cls):
+        """Takes deadlines.lock if no other worker holds it; True while this process leads."""
+        if cls._leader is not None:
+            return True
+        os.makedirs(os.path.dirname(cls.lock_path), exist_ok=True)
+        lock = open(cls.lock_path, 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return False
+        cls._leader = lock
+        return True
+
+    @classmethod
+    def _run(cls):
+        while not cls._stopping:
+            time.sleep(cls.tick)
+            try:
+                if cls._elect():
+                    cls.advance()
+            except Exception as e:
+                print(f"Deadlines: tick failed: {e}")
+
+    @classmethod
+    def stop(cls):
+        thread = cls._thread
+        if thread is not None:
+            cls._stopping = True
+            if thread is not threading.current_thread():
+                thread.join()
+            cls._thread = None
+        if cls._leader is not None:
+            cls._leader.close()  # releases the flock: another worker takes over
+            cls._leader = None
+        with cls._lock:
+            cls._wheel = None
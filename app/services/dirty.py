@@ -0,0 +1,65 @@
+# Change-only persistence for device status reports.
+# Heartbeats mostly repeat the stored battery/weight/firmware/sensor values, so the
+# write paths compare the row against its loaded (committed) state and skip the
+# UPDATE and the commit fsync when nothing changed. Presence (last_seen/online)
+# is handled separately: it is only written when the stored value is older than
+# PRESENCE_WRITE_INTERVAL, well inside the dashboard's 2-minute online window.
+
+import threading
+from sqlalchemy import inspect
+from database import db
+from app.services.clock import Clock
+from app.services.fleet import commit_devices
+
+
+class WriteStats:
+    """Per-process counters of applied and skipped device writes, by route."""
+    _counts = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def record(cls, route, applied):
+        with cls._lock:
+            counts = cls._counts.setdefault(route, {'applied': 0, 'skipped': 0})
+            counts['applied' if applied else 'skipped'] += 1
+
+    @classmethod
+    def snapshot(cls):
+        with cls._lock:
+            return {route: dict(counts) for route, counts in cls._counts.items()}
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._counts.clear()
+
+
+def touch_presence(device, interval, now=None):
+    """Marks the device online; only dirties the row when the stored presence is stale."""
+    now = now or Clock.utcnow()
+    if device.online and device.last_seen and (now - device.last_seen).total_seconds() < interval:
+        return False
+    device.last_seen = now
+    device.online = True
+    return True
+
+
+def changed_fields(obj):
+    """Column attributes whose new value differs from the loaded one.
+
+    Assigning an equal value leaves the attribute 'unchanged' in SQLAlchemy's
+    history, so plain assignments in the routes need no extra comparisons."""
+    state = inspect(obj)
+    return [attr.key for attr in state.mapper.column_attrs if state.attrs[attr.key].history.has_changes()]
+
+
+def commit_if_changed(route, *devices):
+    """Commits (and updates the read model) only if one of the devices changed.
+
+    Rows added to the session meanwhile (command deadlines) also need the commit."""
+    if db.session.new or any(changed_fields(device) for device in devices):
+        commit_devices(*devices)
+        WriteStats.record(route, True)
+        return True
+    WriteStats.record(route, False)
+    return False
@@ -0,0 +1,249 @@
+# Batch check that dispenses actually moved the drawer scale.
+#
+# Executed feed/refill commands are logged (ack route, or the device's /log).
+# Every DISPENSE_VERIFY_INTERVAL_S, one worker (flock on the state file) takes
+# the Log events since its watermark that are at least DISPENSE_VERIFY_WINDOW_S
+# old, so the readings after them have arrived, and checks the whole fleet in
+# one NumPy pass over the reading history:
+#   - events of a feeder closer than DISPENSE_MERGE_S form one burst ("Alimentar
+#     Agora" is a feed followed by a refill): a burst with a refill must raise the
+#     drawer weight, a feed-only burst must lower it;
+#   - the median of the last READINGS readings before the burst and of the
+#     first READINGS after it (each within the window) give the observed delta;
+#   - a burst whose delta is below DISPENSE_MIN_DELTA_G trips its feeder
+#     (status TRIP + trip_reason), unless the drawer was already full (refill)
+#     or already empty (feed), or the feeder is in maintenance.
+# One query for the events, one read of each involved feeder's day files and
+# one UPDATE batch for the trips: the cost grows with the events in the window,
+# not with queries per heartbeat. The first run of each day also prunes the
+# reading history past HISTORY_RETENTION_DAYS.
+
+import fcntl
+import json
+import os
+import threading
+import time
+import warnings
+import numpy as np
+from database import db
+from app.models.feeder import Feeder
+from app.models.log import Log
+from app.services import history, journal
+from app.services.clock import Clock
+from app.services.fleet import FleetModel, commit_devices
+
+DISPENSE_COMMANDS = ('feed', 'refill', 'smart_refill')
+REFILL_ACTIONS = ('refill', 'smart_refill')
+READINGS = 3
+
+
+def _nearest(keys, values, lo_keys, hi_keys, from_end):
+    """Median of up to READINGS values per [lo, hi] key window (nearest the event side)."""
+    lo = np.searchsorted(keys, lo_keys, side='left')
+    hi = np.searchsorted(keys, hi_keys, side='right')
+    if from_end:
+        index = hi[:, None] - 1 - np.arange(READINGS)
+        valid = index >= lo[:, None]
+    else:
+        index = lo[:, None] + np.arange(READINGS)
+        valid = index < hi[:, None]
+    if not len(values):
+        return np.full(len(lo_keys), np.nan)
+    gathered = np.where(valid, values[np.clip(index, 0, len(values) - 1)], np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN rows: nothing to compare
+        return np.nanmedian(gathered, axis=1)
+
+
+def verify_events(feeder_ids, times, refills, readings, window, merge_s, min_delta, targets):
+    """Vectorized verification of dispense events.
+
+    feeder_ids/times/refills: one entry per event; readings: {feeder_id: (ts, weight)};
+    targets: {feeder_id: drawer target weight}. Returns one dict per failed burst and
+    the counts of checked, verified and unverifiable bursts."""
+    counts = {'events': len(times), 'bursts': 0, 'verified': 0, 'failed': 0, 'unverifiable': 0, 'skipped': 0}
+    if not len(times):
+        return [], counts
+
+    ids = np.unique(feeder_ids)
+    fidx = np.searchsorted(ids, feeder_ids)
+    order = np.lexsort((times, fidx))
+    fidx, times, refills = fidx[order], times[order], refills[order]
+
+    # Bursts: same feeder, events less than merge_s apart
+    new = np.r_[True, (fidx[1:] != fidx[:-1]) | (np.diff(times) > merge_s)]
+    starts = np.flatnonzero(new)
+    burst_fidx = fidx[starts]
+    burst_start = times[starts]
+    burst_end = np.maximum.reduceat(times, starts)
+    burst_refill = np.maximum.reduceat(refills.astype(np.int8), starts).astype(bool)
+    counts['bursts'] = len(starts)
+
+    # Every reading of every involved feeder on one axis: key = feeder slot * span + time
+    t0 = burst_start.min() - window
+    span = burst_end.max() + window - t0 + 1.0
+    keys, weights = [], []
+    for slot, feeder_id in enumerate(ids.tolist()):
+        ts, weight = readings.get(feeder_id, (np.empty(0), np.empty(0)))
+        keys.append(slot * span + (ts - t0))
+        weights.append(weight)
+    keys = np.concatenate(keys)
+    weights = np.concatenate(weights)
+    order = np.argsort(keys, kind='stable')
+    keys, weights = keys[order], weights[order]
+
+    base = burst_fidx * span - t0
+    before = _nearest(keys, weights, base + burst_start - window, base + burst_start, from_end=True)
+    after = _nearest(keys, weights, base + burst_end + 1e-3, base + burst_end + window, from_end=False)
+    delta = after - before
+
+    target = np.array([targets.get(i, 210.0) for i in ids.tolist()])[burst_fidx]
+    unknown = np.isnan(delta)
+    skipped = ~unknown & np.where(burst_refill, before >= target - min_delta, before < min_delta)
+    failed = ~unknown & ~skipped & np.where(burst_refill, delta < min_delta, delta > -min_delta)
+    counts['unverifiable'] = int(unknown.sum())
+    counts['skipped'] = int(skipped.sum())
+    counts['failed'] = int(failed.sum())
+    counts['verified'] = counts['bursts'] - counts['unverifiable'] - counts['skipped'] - counts['failed']
+
+    failures = [{
+        'feeder_id': int(ids[burst_fidx[i]]),
+        'at': float(burst_start[i]),
+        'refill': bool(burst_refill[i]),
+        'before': round(float(before[i]), 1),
+        'after': round(float(after[i]), 1),
+        'delta': round(float(delta[i]), 1),
+    } for i in np.flatnonzero(failed)]
+    return failures, counts
+
+
+class DispenseVerifier:
+    def __init__(self, app, state_path, interval=300.0, window=300.0, merge_s=60.0, min_delta=20.0,
+                 lookback=3600.0):
+        self.app = app
+        self.state_path = state_path
+        self.interval = interval
+        self.window = window
+        self.merge_s = merge_s
+        self.min_delta = min_delta
+        self.lookback = lookback
+        self.last = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        # Idempotent: called on every request by main.start_background_threads
+        if self.interval <= 0 or self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='dispense-verifier', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"DispenseVerifier: run failed: {e}")
+
+    def run_once(self, now=None):
+        """Checks the events that became old enough since the last run (any worker's)."""
+        store = history.get_history()
+        if store is None:
+            return None
+        now = Clock.time() if now is None else now
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        with open(self.state_path, 'a+') as state:
+            try:
+                fcntl.flock(state, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None  # another worker is on it
+            state.seek(0)
+            try:
+                saved = json.loads(state.read() or '{}')
+            except ValueError:
+                saved = {}
+            # The worker holding the lock also expires old history, once a day
+            today = int(now // history.DAY_S)
+            if saved.get('pruned_day') != today:
+                removed = store.prune(now)
+                if removed:
+                    print(f"History: pruned {removed} day file(s) older than {store.retention_days} days")
+                saved['pruned_day'] = today
+                self._save(state, saved)
+
+            since = saved.get('checked_until')
+            until = now - self.window
+            since = until - self.lookback if since is None else since
+            if until <= since:
+                return None
+
+            with self.app.app_context():
+                try:
+                    result = self.verify(store, since, until)
+                finally:
+                    db.session.remove()
+
+            saved['checked_until'] = until
+            self._save(state, saved)
+        self.last = result
+        if result['failed']:
+            print(f"DispenseVerifier: {result['failed']} dispense(s) without weight change: "
+                  f"{[f['feeder_id'] for f in result['failures']]}")
+        return result
+
+    @staticmethod
+    def _save(state, saved):
+        state.seek(0)
+        state.truncate()
+        state.write(json.dumps(saved))
+        state.flush()
+
+    def verify(self, store, since, until):
+        started = time.perf_counter()
+        rows = (db.session.query(Log.feeder_id, Log.timestamp, Log.action)
+                .filter(Log.timestamp > journal.from_epoch(since), Log.timestamp <= journal.from_epoch(until))
+                .all())
+        feeder_ids = np.array([r[0] for r in rows], dtype=np.int64)
+        times = np.array([journal.to_epoch(r[1]) for r in rows], dtype=np.float64)
+        refills = np.array([r[2] in REFILL_ACTIONS for r in rows], dtype=bool)
+
+        readings, targets = {}, {}
+        for feeder_id in np.unique(feeder_ids).tolist():
+            ts, weight, _ = store.readings('feeder', feeder_id, since - self.window, until + self.window)
+            present = ~np.isnan(weight)
+            readings[feeder_id] = (ts[present], weight[present])
+            feeder = FleetModel.feeder(feeder_id)
+            targets[feeder_id] = (feeder.target_weight or 210.0) if feeder else 210.0
+
+        failures, counts = verify_events(feeder_ids, times, refills, readings, self.window,
+                                         self.merge_s, self.min_delta, targets)
+        counts['tripped'] = self._trip(failures)
+        counts.update(since=since, until=until, failures=failures[:100],
+                      seconds=round(time.perf_counter() - started, 4))
+        return counts
+
+    def _trip(self, failures):
+        latest = {}
+        for failure in failures:
+            latest[failure['feeder_id']] = failure
+        if not latest:
+            return 0
+        tripped = []
+        for feeder in Feeder.query.filter(Feeder.id.in_(list(latest))).all():
+            # Maintenance suppresses alarms; an existing trip keeps its first reason
+            if feeder.maintenance_mode or feeder.status == 'TRIP':
+                continue
+            failure = latest[feeder.id]
+            what = 'Reabastecimento sem aumento' if failure['refill'] else 'Alimentação sem queda'
+            feeder.status = 'TRIP'
+            feeder.trip_reason = f"{what} de peso na gaveta ({failure['delta']:+.0f} g)"
+            tripped.append(feeder)
+        if tripped:
+            commit_devices(*tripped)
+        return len(tripped)
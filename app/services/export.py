@@ -0,0 +1,139 @@
+# Streaming exports (CSV / NDJSON) for logs and feeder state.
+# Rows are pulled from the database with yield_per (a streaming cursor) and
+# encoded in small chunks, so memory stays constant for year-long ranges and
+# the first bytes leave as soon as the first chunk is ready. In partitioned
+# mode the peers' NDJSON streams are merged in, keeping the export order.
+
+import csv
+import heapq
+import io
+import json
+from datetime import datetime, date
+from database import db
+from app.models.feeder import Feeder
+from app.models.log import Log
+
+CHUNK_ROWS = 500
+
+LOG_COLUMNS = ['id', 'timestamp', 'feeder_id', 'feeder_name', 'block_name', 'action', 'duration_ms']
+
+FEEDER_COLUMNS = [
+    'id', 'name', 'block_name', 'status', 'sensor_state', 'water_sensor_state',
+    'water_valve_state', 'drawer_weight', 'battery_level', 'firmware_version',
+    'online', 'is_locked', 'maintenance_mode', 'last_seen', 'last_run', 'trip_reason',
+]
+
+COLUMNS = {'logs': LOG_COLUMNS, 'feeders': FEEDER_COLUMNS}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def parse_range(start, end):
+    """Parses ISO dates/datetimes from query args; a bare end date is inclusive."""
+    start_dt = datetime.fromisoformat(start) if start else None
+    end_dt = None
+    if end:
+        end_dt = datetime.fromisoformat(end)
+        if len(end) == 10:  # YYYY-MM-DD -> end of that day
+            end_dt = end_dt.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return start_dt, end_dt
+
+
+def log_rows(feeder_id=None, block=None, start=None, end=None, batch=1000):
+    # Single joined query: no lazy feeder.name load per row
+    query = (
+        db.session.query(Log.id, Log.timestamp, Log.feeder_id, Feeder.name,
+                         Feeder.block_name, Log.action, Log.duration_ms)
+        .join(Feeder, Log.feeder_id == Feeder.id)
+    )
+    if feeder_id:
+        query = query.filter(Log.feeder_id == feeder_id)
+    if block:
+        query = query.filter(Feeder.block_name == block)
+    if start:
+        query = query.filter(Log.timestamp >= start)
+    if end:
+        query = query.filter(Log.timestamp <= end)
+    return query.order_by(Log.timestamp, Log.id).yield_per(batch)
+
+
+def feeder_rows(feeder_id=None, block=None, batch=1000):
+    query = db.session.query(*[getattr(Feeder, c) for c in FEEDER_COLUMNS])
+    if feeder_id:
+        query = query.filter(Feeder.id == feeder_id)
+    if block:
+        query = query.filter(Feeder.block_name == block)
+    return query.order_by(Feeder.id).yield_per(batch)
+
+
+def recent_logs(limit):
+    """Newest `limit` logs (newest first), with the feeder name joined in."""
+    return (
+        db.session.query(Log.id, Log.timestamp, Log.feeder_id, Feeder.name, Log.action, Log.duration_ms)
+        .outerjoin(Feeder, Log.feeder_id == Feeder.id)
+        .order_by(Log.timestamp.desc(), Log.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def rows_for(kind, args):
+    """Rows of the `kind` export filtered by the request args (ValueError on a bad date)."""
+    if kind == 'logs':
+        start, end = parse_range(args.get('start'), args.get('end'))
+        return log_rows(feeder_id=args.get('feeder_id', type=int), block=args.get('block'),
+                        start=start, end=end)
+    return feeder_rows(feeder_id=args.get('feeder_id', type=int), block=args.get('block'))
+
+
+def merge(kind, rows, peer_records):
+    """Merges the peers' NDJSON records into the local rows (both already in export order)."""
+    columns = COLUMNS[kind]
+    peers = [(tuple(record.get(c) for c in columns) for record in records) for records in peer_records]
+    if kind == 'logs':
+        key = lambda row: (_plain(row[1]), row[0])  # (timestamp, id); peers send ISO strings
+    else:
+        key = lambda row: row[0]
+    return heapq.merge(rows, *peers, key=key)
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        writer.writerow([_plain(v) for v in row])
+        pending += 1
+        if pending >= CHUNK_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def stream_ndjson(columns, rows):
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(dict(zip(columns, (_plain(v) for v in row)))))
+        if len(chunk) >= CHUNK_ROWS:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+def stream(fmt, columns, rows):
+    if fmt == 'ndjson':
+        return stream_ndjson(columns, rows)
+    return stream_csv(columns, rows)
@@ -0,0 +1,200 @@
+# Firmware OTA: artifact store, staged rollout and download slots.
+# Artifacts are stored content-addressed (<sha256>.bin) in FIRMWARE_DIR, so the
+# hash doubles as a strong ETag and a re-upload of the same image is free.
+#
+# Rollout: each release has a rollout_percent; a feeder falls in a fixed bucket
+# (hash of release version + feeder id), so raising the percentage in waves
+# (5 -> 25 -> 100) only ever adds feeders. Feeders learn about their update in the
+# report_status response, with a signed download URL (the ESP32 OTA client
+# cannot send the Bearer header). Only upgrades are offered: a feeder already on
+# a newer build than the current release is left alone.
+#
+# Downloads hold one of FIRMWARE_MAX_DOWNLOADS flock slots shared by all gunicorn
+# workers, so a fleet update cannot tie up every worker or the barn uplink;
+# devices past the limit get 503 + Retry-After and resume later with Range.
+# With FIRMWARE_ACCEL_PREFIX the app only authorizes and nginx sends the file;
+# the slots are not used then (nothing reports when nginx finishes a transfer),
+# and nginx's limit_conn on the internal location is the cap instead.
+
+import fcntl
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from database import db
+from app.models.firmware import Firmware
+
+
+def rollout_bucket(version, feeder_id):
+    """Stable 0-99 bucket of a feeder for one release."""
+    return int(hashlib.sha256(f"{version}:{feeder_id}".encode()).hexdigest()[:8], 16) % 100
+
+
+def version_key(version):
+    """Comparable numeric part of '1.2.0', 'v1.2' or '1.2.0-SIM'; None if there is none."""
+    match = re.match(r'v?(\d+(?:\.\d+)*)', (version or '').strip())
+    if match is None:
+        return None
+    parts = [int(part) for part in match.group(1).split('.')]
+    while len(parts) > 1 and parts[-1] == 0:
+        parts.pop()  # 1.2 == 1.2.0
+    return tuple(parts)
+
+
+def is_upgrade(release_version, installed_version):
+    """True if the release is newer than the installed build (or the feeder never reported one)."""
+    if not installed_version:
+        return True
+    release, installed = version_key(release_version), version_key(installed_version)
+    return release is not None and installed is not None and release > installed
+
+
+class FirmwareStore:
+    def __init__(self, path, secret, max_downloads=2, url_ttl=86400, release_ttl=10.0):
+        self.path = path
+        self.max_downloads = max_downloads
+        self.url_ttl = url_ttl
+        self.release_ttl = release_ttl
+        self._signer = URLSafeTimedSerializer(secret, salt='firmware-download')
+        self._release = None
+        self._release_at = 0.0
+        self._lock = threading.Lock()
+
+    # --- Artifacts ---
+
+    def artifact_path(self, sha256):
+        return os.path.join(self.path, f"{sha256}.bin")
+
+    def add(self, stream, version, notes=None, chunk_size=64 * 1024):
+        """Stores an uploaded image and creates its release (rollout starts at 0%)."""
+        digest = hashlib.sha256()
+        size = 0
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: stream.read(chunk_size), b''):
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+        os.replace(tmp, self.artifact_path(sha256))
+
+        release = Firmware(version=version, sha256=sha256, size=size, notes=notes, rollout_percent=0)
+        db.session.add(release)
+        db.session.commit()
+        self.invalidate()
+        return release
+
+    # --- Rollout ---
+
+    def current(self):
+        """Newest release with a non-zero rollout, cached for release_ttl seconds."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._release_at < self.release_ttl:
+                return self._release
+        release = (Firmware.query.filter(Firmware.rollout_percent > 0)
+                   .order_by(Firmware.id.desc()).first())
+        snapshot = release.to_dict() if release else None
+        with self._lock:
+            self._release, self._release_at = snapshot, now
+        return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._release_at = 0.0
+
+    def offer_for(self, feeder, url_for_download):
+        """Update info for the status response, or None if the feeder is not in the wave."""
+        release = self.current()
+        if release is None or not is_upgrade(release['version'], feeder.firmware_version):
+            return None
+        if rollout_bucket(release['version'], feeder.id) >= release['rollout_percent']:
+            return None
+        sig = self._signer.dumps([feeder.id, release['version']])
+        return {
+            'version': release['version'],
+            'size': release['size'],
+            'sha256': release['sha256'],
+            'url': url_for_download(release['version'], sig)
+        }
+
+    def verify(self, sig, version):
+        """Feeder id of a signed download URL, or None if invalid/expired/another version."""
+        try:
+            feeder_id, signed_version = self._signer.loads(sig, max_age=self.url_ttl)
+        except BadSignature:
+            return None
+        return feeder_id if signed_version == version else None
+
+    # --- Download slots ---
+
+    def open_download(self, sha256):
+        """Opens an artifact holding a download slot, or returns None if all slots are taken."""
+        slot = self.acquire_slot()
+        if slot is None:
+            return None
+        try:
+            return _SlotFile(self.artifact_path(sha256), slot)
+        except OSError:
+            self.release_slot(slot)
+            raise
+
+    def _slot_path(self, index):
+        # Created on first use: accel deployments and the CLI never touch the slots
+        directory = os.path.join(self.path, 'slots')
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"slot-{index}.lock")
+
+    def acquire_slot(self):
+        """Returns an open, exclusively locked slot file, or None if all are taken."""
+        for index in range(self.max_downloads):
+            fd = open(self._slot_path(index), 'a')
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                fd.close()
+        return None
+
+    @staticmethod
+    def release_slot(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        fd.close()
+
+    def busy_slots(self):
+        if not os.path.isdir(os.path.join(self.path, 'slots')):
+            return 0
+        busy = 0
+        for index in range(self.max_downloads):
+            with open(self._slot_path(index), 'a') as fd:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                except BlockingIOError:
+                    busy += 1
+        return busy
+
+
+class _SlotFile(io.FileIO):
+    """Artifact file that releases its download slot when closed.
+
+    send_file() responses are direct passthrough: the WSGI server only closes the
+    file wrapper (gunicorn sends it with sendfile), never Response.call_on_close,
+    so the slot has to live and die with the file itself."""
+
+    def __init__(self, path, slot):
+        super().__init__(path, 'rb')
+        self._slot = slot
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self._slot is not None:
+                FirmwareStore.release_slot(self._slot)
+                self._slot = None
@@ -0,0 +1,317 @@
+# Process-local read model of the fleet.
+# Keeps one slotted record per feeder/tank with a version counter that is bumped
+# whenever a write path changes the device, plus the device's serialized JSON
+# cached for that version. Views and /api/fleet read from here instead of
+# re-querying rows and rebuilding to_dict() on every hit.
+#
+# Writes made by this process are applied at commit time (commit_devices).
+# Writes from other gunicorn workers are picked up by a full resync at most every
+# FLEET_SYNC_INTERVAL seconds, and only on read.
+#
+# Version counters are per process and only key process-local caches. HTTP
+# validators use digest(): a hash of the record's values, so two workers holding
+# the same rows produce the same ETag.
+#
+# Footprint (benchmarks/bench_fleet.py, CPython 3.11): ~1.2 KB per feeder record
+# (slots plus its strings/datetimes) and ~0.57 KB once its JSON is cached,
+# i.e. about 18 MB per 10k feeders.
+
+import hashlib
+import json
+import threading
+import time
+from sqlalchemy import select
+from database import db
+from app.models.feeder import Feeder
+from app.models.tank import Tank
+from app.services import journal
+from app.services.aggregates import BlockAggregates
+from app.services.clock import Clock
+
+FEEDER_FIELDS = tuple(c.name for c in Feeder.__table__.columns)
+TANK_FIELDS = tuple(c.name for c in Tank.__table__.columns)
+
+
+class FeederState:
+    __slots__ = FEEDER_FIELDS + ('version', '_json', '_json_version', '_digest', '_digest_version')
+
+    to_dict = Feeder.to_dict
+
+    @property
+    def food_tank(self):
+        return FleetModel._tanks.get(self.food_tank_id)
+
+    @property
+    def water_tank(self):
+        return FleetModel._tanks.get(self.water_tank_id)
+
+    def json_bytes(self):
+        if self._json_version != self.version:
+            self._json = json.dumps(self.to_dict(), separators=(',', ':')).encode()
+            self._json_version = self.version
+        return self._json
+
+    def digest(self):
+        return _digest(self, FEEDER_FIELDS)
+
+
+class TankState:
+    __slots__ = TANK_FIELDS + ('version', '_json', '_json_version', '_digest', '_digest_version')
+
+    to_dict = Tank.to_dict
+
+    def json_bytes(self):
+        if self._json_version != self.version:
+            self._json = json.dumps(self.to_dict(), separators=(',', ':')).encode()
+            self._json_version = self.version
+        return self._json
+
+    def digest(self):
+        return _digest(self, TANK_FIELDS)
+
+
+def _digest(record, fields):
+    """Hash of a record's values, cached for its version."""
+    if record._digest_version != record.version:
+        record._digest = hashlib.sha1(repr(tuple(getattr(record, name) for name in fields)).encode()).digest()[:10]
+        record._digest_version = record.version
+    return record._digest
+
+
+def _update(records, cls, fields, key, values):
+    """Creates or updates one record; bumps its version only if a field changed."""
+    record = records.get(key)
+    if record is None:
+        record = cls()
+        for name in fields:
+            setattr(record, name, values[name])
+        record.version = 1
+        record._json = None
+        record._json_version = 0
+        record._digest = None
+        record._digest_version = 0
+        records[key] = record
+        return True
+
+    changed = False
+    for name in fields:
+        value = values[name]
+        if getattr(record, name) != value:
+            setattr(record, name, value)
+            changed = True
+    if changed:
+        record.version += 1
+    return changed
+
+
+def _aggregate(record):
+    """Feeds a device's current values into its block totals (O(1))."""
+    if isinstance(record, FeederState):
+        BlockAggregates.feeder(record.id, record.block_name, record.status, record.drawer_weight)
+    else:
+        BlockAggregates.tank(record.id, record.block_name, record.type, record.current_weight, record.max_weight)
+
+
+class FleetModel:
+    _feeders = {}
+    _tanks = {}
+    _synced_at = 0.0
+    _lock = threading.RLock()
+    sync_interval = 2.0
+    version = 0  # bumped on any device change (used for whole-page caching)
+    tanks_version = 0  # bumped on any tank change (tank lists / dropdowns)
+    _fleet_digest = (-1, None)  # (version, digest)
+    _tanks_digest = (-1, None)  # (tanks_version, digest)
+
+    # --- Write side ---
+
+    @classmethod
+    def reset(cls, sync_interval=2.0):
+        with cls._lock:
+            cls._feeders = {}
+            cls._tanks = {}
+            cls._synced_at = 0.0
+            cls.sync_interval = sync_interval
+            cls.version += 1
+            cls.tanks_version += 1
+            BlockAggregates.reset()
+
+    @classmethod
+    def apply(cls, model, values):
+        if model is Feeder:
+            records, state_cls, fields = cls._feeders, FeederState, FEEDER_FIELDS
+        else:
+            records, state_cls, fields = cls._tanks, TankState, TANK_FIELDS
+        with cls._lock:
+            if _update(records, state_cls, fields, values['id'], values):
+                cls.version += 1
+                if model is Tank:
+                    cls.tanks_version += 1
+                _aggregate(records[values['id']])
+
+    @classmethod
+    def apply_feeder(cls, feeder):
+        cls.apply(Feeder, {name: getattr(feeder, name) for name in FEEDER_FIELDS})
+
+    @classmethod
+    def apply_tank(cls, tank):
+        cls.apply(Tank, {name: getattr(tank, name) for name in TANK_FIELDS})
+
+    @classmethod
+    def set_fields(cls, feeder_id, **fields):
+        """Patches a feeder record without an ORM object (e.g. the log writer's last_run)."""
+        with cls._lock:
+            record = cls._feeders.get(feeder_id)
+            if record is None:
+                return
+            changed = False
+            for name, value in fields.items():
+                if getattr(record, name) != value:
+                    setattr(record, name, value)
+                    changed = True
+            if changed:
+                record.version += 1
+                cls.version += 1
+                _aggregate(record)
+
+    @classmethod
+    def invalidate(cls):
+        """Forces a full resync on the next read."""
+        cls._synced_at = 0.0
+
+    # --- Read side ---
+
+    @classmethod
+    def sync(cls):
+        feeder_rows = db.session.execute(select(Feeder.__table__)).mappings().all()
+        tank_rows = db.session.execute(select(Tank.__table__)).mappings().all()
+        with cls._lock:
+            changed = False
+            for row in tank_rows:
+                if _update(cls._tanks, TankState, TANK_FIELDS, row['id'], row):
+                    changed = True
+                    _aggregate(cls._tanks[row['id']])
+            live_tanks = {row['id'] for row in tank_rows}
+            if changed or len(live_tanks) != len(cls._tanks):
+                cls.tanks_version += 1
+            for row in feeder_rows:
+                if _update(cls._feeders, FeederState, FEEDER_FIELDS, row['id'], row):
+                    changed = True
+                    _aggregate(cls._feeders[row['id']])
+
+            # Drop devices deleted elsewhere
+            for kind, records, rows in (('tank', cls._tanks, tank_rows), ('feeder', cls._feeders, feeder_rows)):
+                live = {row['id'] for row in rows}
+                for key in [k for k in records if k not in live]:
+                    del records[key]
+                    BlockAggregates.remove(kind, key)
+                    changed = True
+
+            if changed:
+                cls.version += 1
+            cls._synced_at = time.monotonic()
+
+    @classmethod
+    def ensure_fresh(cls):
+        if time.monotonic() - cls._synced_at > cls.sync_interval:
+            cls.sync()
+
+    @classmethod
+    def feeders(cls):
+        cls.ensure_fresh()
+        with cls._lock:
+            return sorted(cls._feeders.values(), key=lambda f: f.id)
+
+    @classmethod
+    def feeder(cls, feeder_id):
+        cls.ensure_fresh()
+        return cls._feeders.get(feeder_id)
+
+    @classmethod
+    def peek(cls, feeder_id):
+        """The cached record as last synced, never triggering a sync (hot paths, admission)."""
+        return cls._feeders.get(feeder_id)
+
+    @classmethod
+    def peek_tank(cls, tank_id):
+        return cls._tanks.get(tank_id)
+
+    @classmethod
+    def tanks(cls):
+        cls.ensure_fresh()
+        with cls._lock:
+            return sorted(cls._tanks.values(), key=lambda t: t.id)
+
+    @classmethod
+    def block_summary(cls, name):
+        """Inventory and status totals of one block, or None if it has no devices."""
+        cls.ensure_fresh()
+        with cls._lock:
+            block, tank_ids = BlockAggregates.get(name)
+            if block is None:
+                return None
+            return block.to_dict(cls._tanks[t] for t in tank_ids if t in cls._tanks)
+
+    @classmethod
+    def block_summaries(cls):
+        cls.ensure_fresh()
+        return [summary for summary in map(cls.block_summary, BlockAggregates.names()) if summary]
+
+    @classmethod
+    def fleet_digest(cls):
+        """Content hash of every feeder and tank (agrees across workers holding the same rows)."""
+        cls.ensure_fresh()
+        with cls._lock:
+            if cls._fleet_digest[0] != cls.version:
+                cls._fleet_digest = (cls.version, _combine(cls._feeders, cls._tanks))
+            return cls._fleet_digest[1]
+
+    @classmethod
+    def tanks_digest(cls):
+        """Content hash of every tank (tank lists / dropdowns)."""
+        cls.ensure_fresh()
+        with cls._lock:
+            if cls._tanks_digest[0] != cls.tanks_version:
+                cls._tanks_digest = (cls.tanks_version, _combine(cls._tanks))
+            return cls._tanks_digest[1]
+
+    @classmethod
+    def fleet_json(cls):
+        """Whole fleet as JSON bytes, stitched from the per-device cached JSON."""
+        feeders = cls.feeders()
+        tanks = cls.tanks()
+        return (b'{"version":' + str(cls.version).encode()
+                + b',"feeders":[' + b','.join(f.json_bytes() for f in feeders)
+                + b'],"tanks":[' + b','.join(t.json_bytes() for t in tanks) + b']}')
+
+
+def _combine(*groups):
+    digest = hashlib.sha1()
+    for records in groups:
+        for key in sorted(records):
+            digest.update(records[key].digest())
+    return digest.hexdigest()[:20]
+
+
+def commit_devices(*devices):
+    """Commits the session and applies the given Feeder/Tank rows to the read model.
+
+    Values are captured after the flush and before the commit, so applying them
+    does not trigger a reload of the expired instances. Transitions of the
+    journaled feeder fields are appended to the journal after the commit. A status
+    transition also stamps status_changed_at (shared by every worker)."""
+    pending = [(device, journal.feeder_transitions(device)) for device in devices if isinstance(device, Feeder)]
+    for device, changes in pending:
+        if any(field == 'status' for field, _ in changes):
+            device.status_changed_at = Clock.time()
+    db.session.flush()
+    transitions = [(device.id, changes) for device, changes in pending if changes]
+    snapshots = []
+    for device in devices:
+        fields = FEEDER_FIELDS if isinstance(device, Feeder) else TANK_FIELDS
+        snapshots.append((type(device), {name: getattr(device, name) for name in fields}))
+    db.session.commit()
+    for model, values in snapshots:
+        FleetModel.apply(model, values)
+    for feeder_id, changes in transitions:
+        journal.record(feeder_id, changes)
@@ -0,0 +1,52 @@
+# Render cache for template fragments (feeder cards, tank dropdowns, recent logs).
+# Keys embed the version counters of the data a fragment shows (FleetModel record
+# and tank versions, feeder.last_run for logs), so every write path that bumps a
+# version also retires the fragments built from it; stale entries simply stop
+# being hit and fall out of the LRU.
+
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import render_template
+from markupsafe import Markup
+
+
+class FragmentCache:
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, key, template, context):
+        """Returns the cached fragment for key, rendering it on a miss.
+
+        context may be a callable so queries behind a fragment only run on misses."""
+        if self.max_entries > 0:
+            with self._lock:
+                html = self._entries.get(key)
+                if html is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return html
+
+        html = Markup(render_template(template, **(context() if callable(context) else context)))
+        if self.max_entries > 0:
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = html
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def etag_for(*parts):
+    """Weak validator built from content digests (no need to render the page first).
+
+    Parts must be data every worker agrees on (FleetModel digests, not versions)."""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
@@ -0,0 +1,130 @@
+# Server-directed heartbeat intervals.
+# Every report_status/get_config response carries `next_report_s`, the number of
+# seconds the device should wait before its next report. Healthy idle feeders
+# report slowly; feeders that are alarming, have work in flight or whose drawer
+# is draining toward a threshold report quickly. A TRIP is followed closely for
+# HEARTBEAT_TRIP_FAST_S after the transition (status_changed_at, the same in
+# every worker), then at the WARNING pace until someone resets it. A CRITICAL
+# status raised by the block interlock alone (drawer still LSL) is paced like
+# WARNING: nothing on that feeder changes until its own drawer reaches LSLL. Under load (admission control
+# in-flight share) healthy feeders are stretched further, never alarming ones.
+#
+# last_seen is only rewritten when stale (touch_presence), and a slow heartbeat
+# means the next chance to rewrite it is far away: presence_interval() shortens
+# the staleness limit so the stored value still falls inside the dashboard online
+# window when the next report is due.
+
+import threading
+from app.services.clock import Clock
+from app.services.command_bus import CommandBus
+
+# Feeders are asked to report at least this many times before a draining drawer
+# crosses its next threshold
+SAMPLES_BEFORE_THRESHOLD = 4
+# Dashboard "online": seen within 2 minutes
+ONLINE_WINDOW_S = 120
+# A report may arrive this much later than next_report_s (device clock, Wi-Fi, backlog)
+REPORT_SLACK_S = 10
+
+
+class WeightTrend:
+    """Per-process drain rate (g/s, positive = dropping) of each feeder's drawer.
+
+    A worker only sees the beats routed to it, so the rate is estimated from
+    consecutive samples seen here and decays back to 0 when they are far apart."""
+    _samples = {}  # feeder_id -> (time, weight, rate)
+    _lock = threading.Lock()
+    alpha = 0.5
+    max_gap = 600.0
+
+    @classmethod
+    def update(cls, feeder_id, weight, now=None):
+        now = Clock.time() if now is None else now
+        with cls._lock:
+            previous = cls._samples.get(feeder_id)
+            rate = 0.0
+            if previous is not None:
+                elapsed = now - previous[0]
+                if 0 < elapsed <= cls.max_gap:
+                    rate = previous[2] + cls.alpha * ((previous[1] - weight) / elapsed - previous[2])
+                elif elapsed <= 0:
+                    rate = previous[2]
+            cls._samples[feeder_id] = (now, weight, rate)
+            return rate
+
+    @classmethod
+    def rate(cls, feeder_id):
+        with cls._lock:
+            sample = cls._samples.get(feeder_id)
+            return sample[2] if sample else 0.0
+
+    @classmethod
+    def reset(cls, feeder_id=None):
+        with cls._lock:
+            if feeder_id is None:
+                cls._samples.clear()
+            else:
+                cls._samples.pop(feeder_id, None)
+
+
+def next_report_interval(feeder, config, load=0.0, delivered=False):
+    """Seconds until the feeder's next report.
+
+    config holds the HEARTBEAT_* keys, load is server_load(), delivered is True
+    when this response hands commands to the device."""
+    fastest = config['HEARTBEAT_MIN_S']
+    idle = config['HEARTBEAT_IDLE_S']
+    slowest = config['HEARTBEAT_MAX_S']
+
+    # Work in flight: follow the valve and acks closely
+    if delivered or feeder.water_valve_state == 'OPEN' or CommandBus.has_commands(feeder.id):
+        return fastest
+
+    # Trip: fast while it is fresh, then WARNING pace (nothing acts until someone resets it)
+    if feeder.status == 'TRIP':
+        since = feeder.status_changed_at
+        if since is not None and Clock.time() - since < config['HEARTBEAT_TRIP_FAST_S']:
+            return fastest
+        return int(max(fastest, min(slowest, config['HEARTBEAT_WARNING_S'])))
+
+    # Empty drawer/bowl: follow the refill closely
+    if feeder.sensor_state == 'LSLL' or feeder.water_sensor_state == 'LSLL':
+        return fastest
+
+    # WARNING, or CRITICAL from the block interlock (this drawer is still LSL):
+    # nothing acts until the drawer itself crosses a threshold, see the drain rate below
+    interval = config['HEARTBEAT_WARNING_S'] if feeder.status in ('WARNING', 'CRITICAL') else idle
+
+    # Draining drawer: sample a few times before it reaches the next threshold
+    rate = WeightTrend.rate(feeder.id)
+    weight = feeder.drawer_weight
+    if rate > 0 and weight is not None:
+        threshold = feeder.critical_weight or 20.0
+        if feeder.sensor_state == 'LSH':
+            threshold = feeder.warning_weight or 80.0
+        if weight > threshold:
+            interval = min(interval, (weight - threshold) / rate / SAMPLES_BEFORE_THRESHOLD)
+        else:
+            interval = fastest
+
+    # Busy server: healthy feeders back off (up to 2x at a saturated in-flight cap)
+    if feeder.status == 'NORMAL' and load > 0.5:
+        interval *= 1.0 + min(1.0, (load - 0.5) * 2)
+
+    return int(max(fastest, min(slowest, interval)))
+
+
+def presence_interval(config, next_report_s):
+    """Max age (s) of the stored last_seen before this report must rewrite it.
+
+    Nothing refreshes presence until the next report, next_report_s from now, so
+    a value older than the window minus that wait is written now."""
+    return max(0.0, min(config['PRESENCE_WRITE_INTERVAL'], ONLINE_WINDOW_S - REPORT_SLACK_S - next_report_s))
+
+
+def server_load(app):
+    """Fraction of the admission in-flight cap currently used (0 when disabled)."""
+    admission = app.extensions.get('admission')
+    if admission is None:
+        return 0.0
+    return admission.load()
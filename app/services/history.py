@@ -0,0 +1,290 @@
+# Reading history for the feeder and tank charts, downsampled server-side.
+#
+# Every status report appends one fixed-width record <d f f> (epoch ts and two
+# values, NaN = not reported) to HISTORY_DIR/<kind>/<id>/<YYYYMMDD>.bin (UTC
+# day): feeders store (weight g, battery %), tanks (weight kg/L, level %).
+# Records are single O_APPEND writes, so workers append without a lock.
+#
+# A chart asks for a range and a point budget. Small ranges are answered raw;
+# otherwise each day is cut into buckets of a width from a fixed ladder and every
+# bucket keeps its min and max sample (shape-preserving: spikes and drops stay
+# visible), computed with NumPy over the whole day at once. 'lttb' tiles at a
+# finer width and reduces the result with Largest-Triangle-Three-Buckets. Tiles
+# of past days never change, so they are cached per (device, day, width, file
+# size) and zooming around old data is served from memory.
+#
+# Day files older than retention_days are deleted by prune(), which the dispense
+# verifier runs once a day (one worker). A query lists the device directory
+# instead of probing every calendar day, so its cost follows the files kept,
+# not the span asked for.
+
+import math
+import os
+import struct
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+import numpy as np
+from app.services.clock import Clock
+
+RECORD = struct.Struct('<dff')
+DTYPE = np.dtype([('ts', '<f8'), ('a', '<f4'), ('b', '<f4')])
+SERIES = {'feeder': ('weight', 'battery'), 'tank': ('weight', 'level')}
+METHODS = ('minmax', 'lttb')
+DAY_S = 86400
+BUCKET_WIDTHS = (1, 2, 5, 10, 15, 30, 60, 120, 300, 600, 900, 1800, 3600,
+                 7200, 10800, 21600, 43200, DAY_S)  # all divide a day
+LTTB_OVERSAMPLE = 4
+
+
+def bucket_width(span_s, buckets):
+    """Smallest ladder width that cuts `span_s` into at most `buckets` buckets."""
+    target = span_s / max(buckets, 1)
+    for width in BUCKET_WIDTHS:
+        if width >= target:
+            return width
+    return BUCKET_WIDTHS[-1]
+
+
+def minmax_tile(ts, values, origin, width):
+    """Indices of the min and max sample of every `width`-second bucket (ts sorted)."""
+    if not len(ts):
+        return np.empty(0, dtype=np.int64)
+    bucket = ((ts - origin) // width).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(ts)]
+    # Sorting by (bucket, value) keeps the groups in place: first = argmin, last = argmax
+    order = np.lexsort((values, bucket))
+    return np.unique(np.concatenate((order[starts], order[ends - 1])))
+
+
+def lttb(ts, values, points):
+    """Largest-Triangle-Three-Buckets: indices of `points` samples that keep the shape."""
+    size = len(ts)
+    if points >= size or points < 3:
+        return np.arange(size)
+    # n-2 buckets over the interior points; first and last are always kept
+    edges = np.linspace(1, size - 1, points - 1).astype(np.int64)
+    counts = np.diff(edges)
+    avg_t = np.add.reduceat(ts[:-1], edges[:-1]) / counts
+    avg_v = np.add.reduceat(values[:-1], edges[:-1]) / counts
+
+    keep = np.empty(points, dtype=np.int64)
+    keep[0], keep[-1] = 0, size - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i < points - 3:
+            ct, cv = avg_t[i + 1], avg_v[i + 1]
+        else:
+            ct, cv = ts[-1], values[-1]
+        at, av = ts[a], values[a]
+        area = np.abs((at - ct) * (values[lo:hi] - av) - (at - ts[lo:hi]) * (cv - av))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def _day_of(name):
+    """UTC day number of a '<YYYYMMDD>.bin' file name, or None for anything else."""
+    if len(name) != 12 or not name.endswith('.bin') or not name[:8].isdigit():
+        return None
+    try:
+        return int(datetime.strptime(name[:8], '%Y%m%d').replace(tzinfo=timezone.utc).timestamp() // DAY_S)
+    except ValueError:
+        return None
+
+
+class History:
+    def __init__(self, path, cache_tiles=2048, retention_days=0):
+        self.path = path
+        self.cache_tiles = cache_tiles
+        self.retention_days = retention_days
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    # --- Files ---
+
+    def _dir(self, kind, device_id):
+        return os.path.join(self.path, kind, str(device_id))
+
+    def _file(self, kind, device_id, day):
+        name = datetime.fromtimestamp(day * DAY_S, timezone.utc).strftime('%Y%m%d')
+        return os.path.join(self._dir(kind, device_id), f'{name}.bin')
+
+    def append(self, kind, device_id, ts, a, b):
+        path = self._file(kind, device_id, int(ts // DAY_S))
+        data = RECORD.pack(ts, a, b)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def _days(self, kind, device_id, start_ts, end_ts):
+        """[(day, path, record count)] of the day files overlapping the range, oldest first."""
+        first, last = int(start_ts // DAY_S), int(end_ts // DAY_S)
+        directory = self._dir(kind, device_id)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+        days = []
+        for name in names:
+            day = _day_of(name)
+            if day is None or not first <= day <= last:
+                continue
+            path = os.path.join(directory, name)
+            try:
+                count = os.stat(path).st_size // DTYPE.itemsize
+            except FileNotFoundError:
+                continue  # pruned meanwhile
+            if count:
+                days.append((day, path, count))
+        days.sort()
+        return days
+
+    def prune(self, now=None):
+        """Deletes the day files older than retention_days (0 keeps everything); returns how many."""
+        if self.retention_days <= 0:
+            return 0
+        oldest = int((Clock.time() if now is None else now) // DAY_S) - self.retention_days
+        removed = 0
+        for kind in SERIES:
+            root = os.path.join(self.path, kind)
+            if not os.path.isdir(root):
+                continue
+            for device in os.listdir(root):
+                directory = os.path.join(root, device)
+                if not os.path.isdir(directory):
+                    continue
+                for name in os.listdir(directory):
+                    day = _day_of(name)
+                    if day is not None and day < oldest:
+                        try:
+                            os.remove(os.path.join(directory, name))
+                            removed += 1
+                        except FileNotFoundError:
+                            pass
+        return removed
+
+    @staticmethod
+    def _read(path, count):
+        # Whole records only: a concurrent append may be in flight
+        records = np.fromfile(path, dtype=DTYPE, count=count)
+        ts = records['ts']
+        if len(ts) > 1 and np.any(ts[1:] < ts[:-1]):
+            # Workers stamp before writing, so neighbours can be slightly out of order
+            records = records[np.argsort(ts, kind='stable')]
+        return records
+
+    def readings(self, kind, device_id, start_ts, end_ts):
+        """Raw (ts, a, b) arrays of the readings in [start_ts, end_ts], oldest first."""
+        records = [self._read(path, count) for _, path, count in self._days(kind, device_id, start_ts, end_ts)]
+        records = np.concatenate(records) if records else np.empty(0, dtype=DTYPE)
+        records = records[(records['ts'] >= start_ts) & (records['ts'] <= end_ts)]
+        return records['ts'], records['a'], records['b']
+
+    # --- Tiles ---
+
+    def _tile(self, kind, device_id, day, path, count, width, today):
+        key = (kind, device_id, day, width, count)
+        if day < today:
+            with self._lock:
+                tile = self._tiles.get(key)
+                if tile is not None:
+                    self._tiles.move_to_end(key)
+                    self.hits += 1
+                    return tile
+
+        records = self._read(path, count)
+        tile = []
+        for column in ('a', 'b'):
+            values = records[column]
+            present = ~np.isnan(values)
+            ts, values = records['ts'][present], values[present].astype(np.float64)
+            keep = minmax_tile(ts, values, day * DAY_S, width)
+            tile.append((ts[keep], values[keep]))
+        tile = tuple(tile)
+
+        if day < today:
+            with self._lock:
+                self.misses += 1
+                self._tiles[key] = tile
+                while len(self._tiles) > self.cache_tiles:
+                    self._tiles.popitem(last=False)
+        return tile
+
+    # --- Query ---
+
+    def query(self, kind, device_id, start_ts, end_ts, points=500, method='minmax'):
+        """Downsampled series in [start_ts, end_ts]: {'bucket_s', 'series': {name: [[ms, v]]}}."""
+        names = SERIES[kind]
+        days = self._days(kind, device_id, start_ts, end_ts)
+        columns = ([], [])
+
+        if sum(count for _, _, count in days) <= points:
+            width = 0
+            for _, path, count in days:
+                records = self._read(path, count)
+                for column, chunks in zip(('a', 'b'), columns):
+                    values = records[column]
+                    present = ~np.isnan(values)
+                    chunks.append((records['ts'][present], values[present].astype(np.float64)))
+        else:
+            # Min/max tiles hold up to two samples per bucket
+            buckets = points // 2 if method == 'minmax' else points * LTTB_OVERSAMPLE // 2
+            width = bucket_width(end_ts - start_ts, buckets)
+            today = int(Clock.time() // DAY_S)
+            for day, path, count in days:
+                tile = self._tile(kind, device_id, day, path, count, width, today)
+                for part, chunks in zip(tile, columns):
+                    chunks.append(part)
+
+        series = {}
+        for name, chunks in zip(names, columns):
+            ts = np.concatenate([c[0] for c in chunks]) if chunks else np.empty(0)
+            values = np.concatenate([c[1] for c in chunks]) if chunks else np.empty(0)
+            inside = (ts >= start_ts) & (ts <= end_ts)
+            ts, values = ts[inside], values[inside]
+            if len(ts) > points:
+                keep = lttb(ts, values, points)
+                ts, values = ts[keep], values[keep]
+            series[name] = [[int(t * 1000), round(v, 2)]
+                            for t, v in zip(ts.tolist(), values.tolist())]
+        return {'bucket_s': width, 'series': series}
+
+    def cache_stats(self):
+        with self._lock:
+            return {'tiles': len(self._tiles), 'hits': self.hits, 'misses': self.misses}
+
+
+_history = None
+
+
+def configure(path, **kwargs):
+    global _history
+    _history = History(path, **kwargs) if path else None
+    return _history
+
+
+def get_history():
+    return _history
+
+
+def record(kind, device_id, a=None, b=None, ts=None):
+    """Appends one reading (None = not reported); never fails the request."""
+    if _history is None or (a is None and b is None):
+        return
+    try:
+        _history.append(kind, device_id, ts or Clock.time(),
+                        math.nan if a is None else a, math.nan if b is None else b)
+    except OSError as e:
+        print(f"History: failed to append for {kind} {device_id}: {e}")
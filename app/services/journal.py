@@ -0,0 +1,335 @@
+# Append-only journal of feeder state transitions.
+# The feeders row only keeps the latest state (and reset_trip wipes trip_reason),
+# so every change of a tracked field and every command issued is also appended
+# here, to be able to answer "what happened overnight".
+#
+# Layout (JOURNAL_DIR):
+#   seg-00000001.log   binary records: <d I B H> (epoch ts, feeder id, field code,
+#                      value length) followed by the JSON-encoded value
+#   seg-00000001.idx   sparse time index: <d Q> (ts, byte offset) every INDEX_STRIDE bytes
+#   seg-00000001.snap  JSON snapshot of every feeder's tracked fields at segment start
+#   seg-00000001.fidx  <I Q> (feeder id, offset) sorted by feeder, written on sealing
+# A segment is sealed at SEGMENT_BYTES; the next one starts with a snapshot, so
+# rebuilding the fleet as of any time replays at most one segment, and a feeder
+# timeline only reads that feeder's records from sealed segments.
+# Appends from all gunicorn workers are serialized with flock on journal.lock.
+
+import bisect
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from app.services.clock import Clock
+
+RECORD = struct.Struct('<dIBH')
+INDEX_ENTRY = struct.Struct('<dQ')
+FEEDER_ENTRY = struct.Struct('<IQ')
+
+FIELDS = (
+    'status', 'sensor_state', 'water_sensor_state', 'water_valve_state',
+    'is_locked', 'water_locked', 'maintenance_mode', 'trip_reason', 'command',
+)
+FIELD_CODES = {name: code for code, name in enumerate(FIELDS)}
+STATE_FIELDS = FIELDS[:-1]  # 'command' is an event, not state
+
+SEGMENT_BYTES = 1 << 20
+INDEX_STRIDE = 16 << 10
+# Timestamps are taken before the append lock, so records from different workers
+# can be slightly out of order; scans tolerate this much skew at their bounds.
+CLOCK_SKEW_S = 1.0
+
+
+def to_epoch(dt):
+    """Naive UTC datetime (as used across the app) -> epoch seconds."""
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+
+def from_epoch(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None)
+
+
+class Journal:
+    def __init__(self, path, segment_bytes=SEGMENT_BYTES, index_stride=INDEX_STRIDE):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.index_stride = index_stride
+        self._thread_lock = threading.Lock()
+        self._starts = {}  # seq -> snapshot start_ts (immutable once written)
+        os.makedirs(path, exist_ok=True)
+        self._lock_path = os.path.join(path, 'journal.lock')
+
+    # --- Files ---
+
+    def _file(self, seq, ext):
+        return os.path.join(self.path, f'seg-{seq:08d}.{ext}')
+
+    def segments(self):
+        seqs = []
+        for name in os.listdir(self.path):
+            if name.startswith('seg-') and name.endswith('.snap'):
+                seqs.append(int(name[4:12]))
+        return sorted(seqs)
+
+    def _read_snapshot(self, seq):
+        with open(self._file(seq, 'snap')) as f:
+            snap = json.load(f)
+        return snap['start_ts'], {int(k): v for k, v in snap['state'].items()}
+
+    def _start_ts(self, seq):
+        if seq not in self._starts:
+            with open(self._file(seq, 'snap')) as f:
+                self._starts[seq] = json.load(f)['start_ts']
+        return self._starts[seq]
+
+    def _write_snapshot(self, seq, start_ts, state):
+        tmp = self._file(seq, 'snap.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'start_ts': start_ts, 'state': state}, f, separators=(',', ':'))
+        os.replace(tmp, self._file(seq, 'snap'))
+
+    def _read_index(self, seq):
+        try:
+            with open(self._file(seq, 'idx'), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return [], []
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        entries = list(INDEX_ENTRY.iter_unpack(data[:usable]))
+        return [e[0] for e in entries], [e[1] for e in entries]
+
+    # --- Write side ---
+
+    def ensure_started(self, initial_state):
+        """Creates the first segment with a snapshot of the current fleet (called once)."""
+        with self._locked():
+            if not self.segments():
+                self._write_snapshot(1, Clock.time(), initial_state)
+                open(self._file(1, 'log'), 'ab').close()
+
+    def append(self, entries):
+        """entries: iterable of (epoch ts, feeder id, field, value)."""
+        blobs = []
+        for ts, feeder_id, field, value in entries:
+            payload = json.dumps(value, separators=(',', ':')).encode()
+            blobs.append((ts, RECORD.pack(ts, feeder_id, FIELD_CODES[field], len(payload)) + payload))
+        if not blobs:
+            return
+
+        with self._locked():
+            seqs = self.segments()
+            seq = seqs[-1] if seqs else self._start_empty()
+            log_path = self._file(seq, 'log')
+            offset = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+            if offset >= self.segment_bytes:
+                seq = self._roll(seq, blobs[0][0])
+                log_path, offset = self._file(seq, 'log'), 0
+
+            # Sparse index: the first record starting in each INDEX_STRIDE block
+            index = []
+            chunk = bytearray()
+            for ts, blob in blobs:
+                position = offset + len(chunk)
+                if position % self.index_stride == 0 or position // self.index_stride != (position + len(blob)) // self.index_stride:
+                    index.append(INDEX_ENTRY.pack(ts, position))
+                chunk += blob
+            with open(log_path, 'ab') as f:
+                f.write(chunk)
+            if index:
+                with open(self._file(seq, 'idx'), 'ab') as f:
+                    f.write(b''.join(index))
+
+    def _start_empty(self):
+        self._write_snapshot(1, Clock.time(), {})
+        return 1
+
+    def _roll(self, seq, ts):
+        # Seal the active segment: write its per-feeder index, and its end state
+        # becomes the next segment's snapshot
+        _, state = self._read_snapshot(seq)
+        by_feeder = []
+        for offset, record in self._records(seq):
+            _apply(state, record)
+            by_feeder.append((record[1], offset))
+        by_feeder.sort()
+        with open(self._file(seq, 'fidx'), 'wb') as f:
+            f.write(b''.join(FEEDER_ENTRY.pack(fid, offset) for fid, offset in by_feeder))
+
+        new_seq = seq + 1
+        self._write_snapshot(new_seq, ts, {str(k): v for k, v in state.items()})
+        open(self._file(new_seq, 'log'), 'ab').close()
+        return new_seq
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock, open(self._lock_path, 'a') as fd:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    # --- Read side ---
+
+    def _read_log(self, seq, offset=0):
+        try:
+            with open(self._file(seq, 'log'), 'rb') as f:
+                f.seek(offset)
+                return f.read()
+        except FileNotFoundError:
+            return b''
+
+    def _records(self, seq, offset=0, end_ts=None, feeder_id=None):
+        """Yields (offset, (ts, feeder_id, field, value)) from offset up to end_ts.
+
+        Only records of feeder_id (if given) have their value decoded."""
+        data = self._read_log(seq, offset)
+        pos = 0
+        while pos + RECORD.size <= len(data):
+            ts, fid, code, length = RECORD.unpack_from(data, pos)
+            end = pos + RECORD.size + length
+            if end > len(data):
+                break  # record still being written
+            if end_ts is not None and ts > end_ts + CLOCK_SKEW_S:
+                break
+            if (end_ts is None or ts <= end_ts) and (feeder_id is None or fid == feeder_id):
+                yield offset + pos, (ts, fid, FIELDS[code], json.loads(data[pos + RECORD.size:end]))
+            pos = end
+
+    def _feeder_offsets(self, seq, feeder_id):
+        """Record offsets of one feeder in a sealed segment (None if it has no .fidx)."""
+        try:
+            f = open(self._file(seq, 'fidx'), 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if not size:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                count = size // FEEDER_ENTRY.size
+                lo, hi = 0, count
+                while lo < hi:  # first entry of feeder_id
+                    mid = (lo + hi) // 2
+                    if FEEDER_ENTRY.unpack_from(m, mid * FEEDER_ENTRY.size)[0] < feeder_id:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                offsets = []
+                while lo < count:
+                    fid, offset = FEEDER_ENTRY.unpack_from(m, lo * FEEDER_ENTRY.size)
+                    if fid != feeder_id:
+                        break
+                    offsets.append(offset)
+                    lo += 1
+                return offsets
+
+    def _feeder_records(self, seq, offsets):
+        with open(self._file(seq, 'log'), 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for offset in offsets:
+                ts, fid, code, length = RECORD.unpack_from(m, offset)
+                start = offset + RECORD.size
+                yield ts, fid, FIELDS[code], json.loads(m[start:start + length])
+
+    def _segments_between(self, start_ts, end_ts):
+        seqs = self.segments()
+        starts = [self._start_ts(s) for s in seqs]
+        chosen = []
+        for i, seq in enumerate(seqs):
+            seg_end = starts[i + 1] if i + 1 < len(seqs) else float('inf')
+            if seg_end >= start_ts - CLOCK_SKEW_S and starts[i] <= end_ts:
+                chosen.append(seq)
+        return chosen
+
+    def timeline(self, feeder_id, start_ts, end_ts, limit=1000):
+        events = []
+        for seq in self._segments_between(start_ts, end_ts):
+            offsets = self._feeder_offsets(seq, feeder_id)
+            if offsets is not None:
+                # Sealed segment: read only this feeder's records
+                records = self._feeder_records(seq, offsets)
+            else:
+                # Active segment: seek with the sparse time index, then scan
+                stamps, index_offsets = self._read_index(seq)
+                i = bisect.bisect_left(stamps, start_ts - CLOCK_SKEW_S) - 1
+                offset = index_offsets[i] if i >= 0 else 0
+                records = (record for _, record in self._records(seq, offset, end_ts, feeder_id))
+            for ts, _, field, value in records:
+                if start_ts <= ts <= end_ts:
+                    events.append({'timestamp': from_epoch(ts).isoformat(), 'field': field, 'value': value})
+                    if len(events) >= limit:
+                        return events
+        return events
+
+    def state_at(self, ts):
+        """Tracked fields of every feeder as of ts: nearest snapshot + replay."""
+        seqs = self.segments()
+        if not seqs:
+            return {}
+        chosen = seqs[0]
+        for seq in seqs:
+            if self._start_ts(seq) <= ts:
+                chosen = seq
+        _, state = self._read_snapshot(chosen)
+        for _, record in self._records(chosen, 0, ts):
+            _apply(state, record)
+        return state
+
+
+def _apply(state, record):
+    _, feeder_id, field, value = record
+    if field in STATE_FIELDS:
+        state.setdefault(feeder_id, {})[field] = value
+
+
+# --- App integration ---
+
+_journal = None
+
+
+def configure(path, **kwargs):
+    global _journal
+    _journal = Journal(path, **kwargs) if path else None
+    return _journal
+
+
+def get_journal():
+    return _journal
+
+
+def start_from_database():
+    """First boot only: the first segment's snapshot is the fleet as stored now."""
+    if _journal is None or _journal.segments():
+        return
+    from app.models.feeder import Feeder
+    state = {
+        str(feeder.id): {field: getattr(feeder, field) for field in STATE_FIELDS}
+        for feeder in Feeder.query.all()
+    }
+    _journal.ensure_started(state)
+
+
+def feeder_transitions(feeder):
+    """Tracked fields changed on a (not yet flushed) Feeder, from attribute history."""
+    from sqlalchemy import inspect
+    state = inspect(feeder)
+    changes = []
+    for field in STATE_FIELDS:
+        history = state.attrs[field].history
+        if history.has_changes():
+            changes.append((field, history.added[0] if history.added else None))
+    return changes
+
+
+def record(feeder_id, changes, ts=None):
+    if _journal is None or not changes:
+        return
+    ts = ts or Clock.time()
+    try:
+        _journal.append((ts, feeder_id, field, value) for field, value in changes)
+    except OSError as e:
+        print(f"Journal: failed to append for feeder {feeder_id}: {e}")
@@ -0,0 +1,149 @@
+# Group-commit writer for feed event logs.
+# Routes enqueue log records on a bounded in-process queue; a background thread
+# drains it and writes each batch with one bulk INSERT (plus the feeders.last_run
+# updates) and a single commit, instead of one commit per request.
+# When the queue is full, submit() blocks producers for up to put_timeout seconds
+# (backpressure) and then reports failure so the route can answer 503.
+# A failed write (e.g. the database locked by a migration or restore) is retried
+# with exponential backoff while the queue waits behind it; only after
+# max_retries attempts is the batch dropped, logged and counted in `dropped`.
+
+import atexit
+import queue
+import threading
+import time
+from sqlalchemy import insert, update, bindparam
+from database import db
+from app.models.feeder import Feeder
+from app.models.log import Log
+from app.services.fleet import FleetModel
+from app.services.clock import Clock
+
+class LogWriter:
+    def __init__(self, app, max_queue=10000, batch_size=200, flush_interval=0.005,
+                 put_timeout=1.0, enabled=True, max_retries=5, retry_backoff=0.1):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.enabled = enabled
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = False
+        self.batches = 0
+        self.written = 0
+        self.retries = 0
+        self.dropped = 0
+
+    def submit(self, feeder_id, action, duration_ms, timestamp=None):
+        """Queues one Log row. Returns False if the queue stayed full (caller should shed)."""
+        record = {
+            'feeder_id': feeder_id,
+            'action': action,
+            'duration_ms': duration_ms,
+            'timestamp': timestamp or Clock.utcnow(),
+        }
+        if not self.enabled:
+            return self._write_with_retry([record])
+
+        self._ensure_started()
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            return False
+        return True
+
+    def stats(self):
+        return {'batches': self.batches, 'written': self.written, 'retries': self.retries,
+                'dropped': self.dropped, 'queued': self._queue.qsize()}
+
+    def flush(self):
+        """Blocks until every queued record has been committed."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def stop(self):
+        """Flushes pending records and stops the writer thread (called at exit)."""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._stopping = False
+
+    def _ensure_started(self):
+        # Started on first use so the thread lives in the worker, not a pre-fork master
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [] if item is None else [item]
+            done = item is None
+
+            # Gather more records until the batch is full or the flush window closes
+            while not done and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    break
+                if item is None:
+                    done = True
+                else:
+                    batch.append(item)
+
+            if batch:
+                self._write_with_retry(batch)
+            for _ in range(len(batch) + (1 if done else 0)):
+                self._queue.task_done()
+
+            if done:
+                if self._stopping and self._queue.empty():
+                    return
+
+    def _write_with_retry(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._write(batch)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.dropped += len(batch)
+                    self.app.logger.error("LogWriter: dropped %d log(s) after %d attempts: %s",
+                                          len(batch), attempt + 1, e)
+                    return False
+                delay = min(self.retry_backoff * 2 ** attempt, 5.0)
+                self.retries += 1
+                self.app.logger.warning("LogWriter: write of %d log(s) failed (%s), retrying in %.1f s",
+                                        len(batch), e, delay)
+                time.sleep(delay)
+
+    def _write(self, batch):
+        last_runs = {}
+        for record in batch:
+            last_runs[record['feeder_id']] = record['timestamp']
+
+        with self.app.app_context():
+            db.session.execute(insert(Log), batch)
+            db.session.execute(
+                update(Feeder.__table__)
+                .where(Feeder.__table__.c.id == bindparam('fid'))
+                .values(last_run=bindparam('ts')),
+                [{'fid': fid, 'ts': ts} for fid, ts in last_runs.items()]
+            )
+            db.session.commit()
+            db.session.remove()
+        for fid, ts in last_runs.items():
+            FleetModel.set_fields(fid, last_run=ts)
+        self.batches += 1
+        self.written += len(batch)
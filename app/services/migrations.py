@@ -0,0 +1,153 @@
+# Versioned schema migrations.
+# The database keeps its schema version in a one-row `schema_version` table,
+# so a worker boot costs a single SELECT instead of create_all() + ALTERs.
+# To change the schema, append a (version, description, fn) entry to MIGRATIONS;
+# each fn receives an open connection inside the migration transaction.
+
+from sqlalchemy import inspect, text
+from database import db
+from app.services import backup
+
+# Import every model so db.metadata knows about all tables
+from app.models.command_deadline import CommandDeadline  # noqa: F401
+from app.models.feeder import Feeder  # noqa: F401
+from app.models.firmware import Firmware  # noqa: F401
+from app.models.log import Log  # noqa: F401
+from app.models.tank import Tank  # noqa: F401
+from app.models.user import User  # noqa: F401
+
+
+def _add_column(conn, table, column_def):
+    # Idempotent ALTER: databases created by create_all() already have the column
+    col_name = column_def.split()[0]
+    columns = [c['name'] for c in inspect(conn).get_columns(table)]
+    if col_name not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column_def}"))
+        print(f"Added column: {column_def} to {table}")
+
+
+def _initial_schema(conn):
+    # checkfirst: legacy databases already have these tables
+    db.metadata.create_all(conn)
+
+
+def _block_water_columns(conn):
+    # Columns previously added by the old update_db.py script
+    _add_column(conn, "feeders", "block_name VARCHAR(64)")
+    _add_column(conn, "feeders", "water_mode VARCHAR(16) DEFAULT 'AUTO'")
+    _add_column(conn, "feeders", "water_valve_state VARCHAR(16) DEFAULT 'CLOSED'")
+    _add_column(conn, "feeders", "last_stable_weight FLOAT DEFAULT 0.0")
+    _add_column(conn, "feeders", "maintenance_mode BOOLEAN DEFAULT 0")
+    _add_column(conn, "tanks", "block_name VARCHAR(64)")
+    _add_column(conn, "users", "theme VARCHAR(16) DEFAULT 'dark'")
+
+
+def _weight_filter_column(conn):
+    _add_column(conn, "feeders", "weight_filter VARCHAR(16) DEFAULT 'deadband'")
+
+
+def _firmware_table(conn):
+    # checkfirst: only creates the new `firmware` table
+    db.metadata.create_all(conn)
+
+
+def _command_deadlines_table(conn):
+    # checkfirst: only creates the new `command_deadlines` table
+    db.metadata.create_all(conn)
+
+
+def _command_trace_columns(conn):
+    _add_column(conn, "command_deadlines", "duration INTEGER")
+    _add_column(conn, "command_deadlines", "delivered_at FLOAT")
+    _add_column(conn, "command_deadlines", "status VARCHAR(16)")
+    _add_column(conn, "command_deadlines", "firmware_version VARCHAR(32)")
+
+
+def _status_changed_column(conn):
+    _add_column(conn, "feeders", "status_changed_at FLOAT")
+
+
+def _command_payload_column(conn):
+    _add_column(conn, "command_deadlines", "payload TEXT")
+
+
+MIGRATIONS = [
+    (1, 'initial schema', _initial_schema),
+    (2, 'block, water and theme columns', _block_water_columns),
+    (3, 'per-feeder weight filter', _weight_filter_column),
+    (4, 'firmware releases', _firmware_table),
+    (5, 'shared command deadlines', _command_deadlines_table),
+    (6, 'command round-trip trace columns', _command_trace_columns),
+    (7, 'feeder status transition time', _status_changed_column),
+    (8, 'shared command queue payload', _command_payload_column),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+class SchemaOutdated(RuntimeError):
+    pass
+
+
+def current_version(conn):
+    """Returns the stored schema version, or 0 for a new/legacy database."""
+    try:
+        return conn.execute(text("SELECT version FROM schema_version")).scalar() or 0
+    except Exception:
+        conn.rollback()
+        return 0
+
+
+def _has_data_tables(conn):
+    """True once the database holds any table besides the version marker (a legacy DB reads as version 0)."""
+    return conn.execute(text(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite_%' AND name != 'schema_version'"
+    )).scalar() > 0
+
+
+def upgrade(engine, snapshot_dir=None):
+    """Applies pending migrations in one transaction. Returns the applied versions.
+
+    With `snapshot_dir`, an existing SQLite database is backed up there first."""
+    with engine.connect() as conn:
+        if engine.dialect.name == 'sqlite':
+            # Take the write lock up front so concurrent workers serialize here
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+        version = current_version(conn)
+
+        db_path = backup.sqlite_path(engine)
+        if snapshot_dir and db_path and version < LATEST_VERSION and (version > 0 or _has_data_tables(conn)):
+            # We hold the write lock, so a single-step copy is consistent and blocks no one new
+            stats = backup.snapshot(db_path, snapshot_dir, 'pre-migration', step_pages=-1)
+            print(f"Pre-migration snapshot: {stats['path']}")
+
+        applied = []
+        for number, description, migrate in MIGRATIONS:
+            if number <= version:
+                continue
+            migrate(conn)
+            applied.append(number)
+            print(f"Migration {number} applied: {description}")
+
+        if applied:
+            conn.execute(text("DELETE FROM schema_version"))
+            conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {'v': applied[-1]})
+        conn.commit()
+        return applied
+
+
+def ensure_schema(engine, auto_upgrade=True, snapshot_dir=None):
+    """Boot-time check: a single version lookup when the schema is current."""
+    with engine.connect() as conn:
+        version = current_version(conn)
+    if version >= LATEST_VERSION:
+        return version
+    if not auto_upgrade:
+        raise SchemaOutdated(
+            f"Database schema is at version {version}, expected {LATEST_VERSION}. "
+            "Run `python update_db.py` before starting the workers."
+        )
+    upgrade(engine, snapshot_dir)
+    return LATEST_VERSION
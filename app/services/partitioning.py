@@ -0,0 +1,232 @@
+# Partitioned deployment mode (scale-out by block).
+# Each partition is a full app instance with its own SQLite file, CommandBus and
+# presence; a block always lives on one partition, so the block interlock query
+# stays local. New devices are placed with a consistent-hash ring keyed by
+# block_name (or the feeder name when there is no block yet), and device ids are
+# allocated inside the owning partition's id range, so the router can forward
+# /api/feeder/<id>/* and /api/tank/<id>/* with no directory lookup.
+#
+# Config: PARTITION_NODES="p0=http://10.0.0.1:8001,p1=http://10.0.0.2:8001"
+#         PARTITION_NAME="p0"   (this node; empty = single-node mode)
+#         PARTITION_SECRET      (required with PARTITION_NODES: authenticates the
+#                                partitions' fan-out calls to each other)
+# Moving a block to another partition after devices exist is not automatic.
+
+import bisect
+import hashlib
+import hmac
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+import requests
+from sqlalchemy import func
+from database import db
+
+ID_SPAN = 10_000_000  # ids per partition: partition i owns [i * ID_SPAN, (i + 1) * ID_SPAN)
+SECRET_HEADER = 'X-Partition-Secret'
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes."""
+
+    def __init__(self, nodes, replicas=64):
+        self._ring = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self._keys = [h for h, _ in self._ring]
+
+    def node_for(self, key):
+        if not self._ring:
+            return None
+        idx = bisect.bisect(self._keys, _hash(key)) % len(self._ring)
+        return self._ring[idx][1]
+
+
+def placement_key(block_name=None, name=None, feeder_id=None):
+    if block_name:
+        return f"block:{block_name}"
+    if name:
+        return f"name:{name}"
+    return f"feeder:{feeder_id}"
+
+
+def parse_nodes(spec):
+    """'p0=http://a,p1=http://b' -> [('p0', 'http://a'), ('p1', 'http://b')]"""
+    nodes = []
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if item:
+            name, _, url = item.partition('=')
+            nodes.append((name.strip(), url.strip().rstrip('/')))
+    return nodes
+
+
+def _lock_for_write():
+    """SQLite: takes the write lock now (BEGIN IMMEDIATE) unless the session's
+    transaction already holds it; released by the caller's commit or rollback."""
+    connection = db.session.connection()
+    if connection.dialect.name == 'sqlite' and not connection.connection.driver_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+class Partitioning:
+    def __init__(self, nodes, self_name=None, secret=None, timeout=2.0):
+        self.nodes = nodes
+        self.names = [name for name, _ in nodes]
+        self.urls = dict(nodes)
+        self.self_name = self_name
+        self.secret = secret
+        self.timeout = timeout
+        self.ring = HashRing(self.names)
+
+    @classmethod
+    def from_config(cls, config):
+        partitioning = cls(parse_nodes(config.get('PARTITION_NODES')),
+                           self_name=config.get('PARTITION_NAME') or None,
+                           secret=config.get('PARTITION_SECRET') or None)
+        if partitioning.enabled and not partitioning.secret:
+            # /api/partition/* would otherwise hand the fleet to anyone who asks
+            raise RuntimeError("PARTITION_SECRET must be set when PARTITION_NODES is")
+        return partitioning
+
+    @property
+    def enabled(self):
+        return bool(self.nodes)
+
+    def authorized(self, headers):
+        """True for a fan-out call from another partition (the shared secret matches)."""
+        sent = headers.get(SECRET_HEADER)
+        return bool(self.secret and sent) and hmac.compare_digest(sent.encode(), self.secret.encode())
+
+    @property
+    def self_index(self):
+        return self.names.index(self.self_name) if self.self_name in self.names else 0
+
+    # --- Placement & routing ---
+
+    def node_for_key(self, key):
+        return self.ring.node_for(key)
+
+    def node_for_id(self, device_id):
+        index = device_id // ID_SPAN
+        return self.names[index] if 0 <= index < len(self.names) else None
+
+    def is_local_key(self, key):
+        return not self.enabled or self.node_for_key(key) == self.self_name
+
+    def assign_id(self, obj):
+        """Gives a new Feeder/Tank its first id inside this partition's range.
+
+        SQLite hands out max(rowid) + 1, so once one row exists in the range
+        later inserts stay inside it without explicit ids."""
+        if not self.enabled:
+            return
+        _lock_for_write()
+        model = type(obj)
+        lo = max(self.self_index * ID_SPAN, 1)
+        hi = (self.self_index + 1) * ID_SPAN
+        current = db.session.query(func.max(model.id)).filter(model.id >= lo, model.id < hi).scalar()
+        if current is None:
+            obj.id = lo
+
+    def allocate_ids(self, model, count):
+        """Next `count` free ids for a bulk insert (inside this partition's range).
+
+        Holds the database write lock from here to the caller's commit, so two
+        concurrent allocations cannot both read the same max(id)."""
+        _lock_for_write()
+        if self.enabled:
+            lo = max(self.self_index * ID_SPAN, 1)
+            hi = (self.self_index + 1) * ID_SPAN
+            current = db.session.query(func.max(model.id)).filter(model.id >= lo, model.id < hi).scalar()
+        else:
+            lo, hi = 1, None
+            current = db.session.query(func.max(model.id)).scalar()
+        first = current + 1 if current is not None else lo
+        if hi is not None and first + count > hi:
+            raise ValueError(f"Partition {self.self_name} has no room for {count} more {model.__tablename__}")
+        return range(first, first + count)
+
+    # --- Fan-out ---
+
+    def headers(self):
+        return {SECRET_HEADER: self.secret} if self.secret else {}
+
+    def fan_out(self, path, params=None, skip_self=False):
+        """GETs path on every partition in parallel. Returns {name: json or None}."""
+        targets = [(n, u) for n, u in self.nodes if not (skip_self and n == self.self_name)]
+
+        def fetch(target):
+            name, url = target
+            try:
+                resp = requests.get(url + path, params=params, headers=self.headers(), timeout=self.timeout)
+                return name, resp.json() if resp.status_code == 200 else None
+            except requests.RequestException as e:
+                print(f"Partition {name} unreachable: {e}")
+                return name, None
+
+        if not targets:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+            return dict(pool.map(fetch, targets))
+
+    def stream(self, name, path, params=None):
+        """Yields the records of a peer's NDJSON stream (nothing if it is unreachable)."""
+        try:
+            resp = requests.get(self.urls[name] + path, params=params, headers=self.headers(),
+                                timeout=self.timeout, stream=True)
+        except requests.RequestException as e:
+            print(f"Partition {name} unreachable: {e}")
+            return
+        with resp:
+            if resp.status_code != 200:
+                print(f"Partition {name} answered {resp.status_code} for {path}")
+                return
+            for line in resp.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+
+def snapshot_feeder(feeder):
+    """Feeder as served to peer partitions (to_dict plus the tank fields the dashboard shows)."""
+    data = feeder.to_dict()
+    data['block_name'] = feeder.block_name
+    for attr in ('food_tank', 'water_tank'):
+        tank = getattr(feeder, attr)
+        data[attr] = {'name': tank.name, 'level': tank.level} if tank else None
+    return data
+
+
+def snapshot_tank(tank):
+    """Tank as served to peer partitions (to_dict plus the token the tanks page shows)."""
+    data = tank.to_dict()
+    data['token'] = tank.token
+    return data
+
+
+def snapshot_log(log_id, timestamp, feeder_id, feeder_name, action, duration_ms):
+    return {'id': log_id, 'timestamp': timestamp.isoformat(), 'feeder_id': feeder_id,
+            'feeder_name': feeder_name, 'action': action, 'duration_ms': duration_ms}
+
+
+def remote_log(data):
+    """Rebuilds a log snapshot into the attributes logs.html reads (log.feeder.name included)."""
+    fields = dict(data)
+    fields['timestamp'] = datetime.fromisoformat(fields['timestamp'])
+    fields['feeder'] = SimpleNamespace(name=fields.pop('feeder_name'))
+    return SimpleNamespace(**fields)
+
+
+def remote_feeder(data):
+    """Rebuilds a peer's feeder snapshot into an attribute object for the templates."""
+    fields = dict(data)
+    for key in ('next_run', 'last_run', 'last_seen'):
+        if fields.get(key):
+            fields[key] = datetime.fromisoformat(fields[key])
+    for key in ('food_tank', 'water_tank'):
+        if fields.get(key):
+            fields[key] = SimpleNamespace(**fields[key])
+    return SimpleNamespace(**fields)
@@ -0,0 +1,264 @@
+# Bulk provisioning from a manifest (commissioning a barn in one go).
+#
+#   {
+#     "tanks":   [{"key": "food-A", "name": "Ração A", "type": "food", "block_name": "Bloco A",
+#                  "capacity": "40kg", "max_weight": 40}],
+#     "feeders": [{"name": "A-01", "block_name": "Bloco A", "avatar": "mouse",
+#                  "food_tank": "food-A", "water_tank": 12}]
+#   }
+#
+# Tank links name a manifest tank by its "key" or an existing tank by id. The
+# whole manifest is validated first, then ids are allocated as consecutive ranges
+# (inside this node's partition), tokens come from one urandom read, and every
+# row goes in with one executemany INSERT per table inside a single transaction:
+# either the whole barn exists afterwards or nothing does. The result is the
+# credential sheet (ids and tokens) to flash into the devices.
+#
+# Partitioned mode: each node only takes devices it owns, so the router splits
+# the manifest by placement (split_manifest), validates every part with
+# ?dry_run=1 and only then provisions the parts and merges their sheets.
+
+import base64
+import csv
+import io
+import json
+import os
+from database import db
+from app.models.feeder import Feeder
+from app.models.tank import Tank
+from app.services.fleet import commit_devices
+from app.services.partitioning import placement_key
+
+TOKEN_BYTES = 32  # same entropy as secrets.token_urlsafe(32)
+MAX_DEVICES = 5000
+TANK_FIELDS = ('name', 'type', 'capacity', 'max_weight', 'current_weight', 'block_name')
+SHEET_COLUMNS = ('kind', 'id', 'name', 'block_name', 'type', 'food_tank_id', 'water_tank_id', 'token')
+
+
+class ProvisioningError(ValueError):
+    """Invalid manifest; `errors` lists every problem found."""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+def generate_tokens(count):
+    """`count` URL-safe tokens from a single urandom read."""
+    raw = os.urandom(TOKEN_BYTES * count)
+    return [base64.urlsafe_b64encode(raw[i:i + TOKEN_BYTES]).rstrip(b'=').decode('ascii')
+            for i in range(0, len(raw), TOKEN_BYTES)]
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _string_errors(where, spec, fields):
+    # JSON lists/objects here would reach dict lookups and the INSERT as-is
+    return [f"{where}: {field} must be a string" for field in fields
+            if spec.get(field) is not None and not isinstance(spec[field], str)]
+
+
+def _validate(manifest, partitioning):
+    errors = []
+    if not isinstance(manifest, dict):
+        raise ProvisioningError(['Manifest must be a JSON object with "tanks" and/or "feeders"'])
+    tanks = manifest.get('tanks') or []
+    feeders = manifest.get('feeders') or []
+    if not isinstance(tanks, list) or not isinstance(feeders, list):
+        raise ProvisioningError(['"tanks" and "feeders" must be lists'])
+    if not tanks and not feeders:
+        errors.append('Manifest has no devices')
+    if len(tanks) + len(feeders) > MAX_DEVICES:
+        errors.append(f'At most {MAX_DEVICES} devices per manifest')
+
+    keys = {}
+    for index, tank in enumerate(tanks):
+        where = f"tanks[{index}]"
+        if not isinstance(tank, dict) or not tank.get('name'):
+            errors.append(f"{where}: name is required")
+            continue
+        errors += _string_errors(where, tank, ('name', 'capacity', 'block_name', 'key'))
+        if tank.get('type') not in ('food', 'water'):
+            errors.append(f"{where}: type must be 'food' or 'water'")
+        for field in ('max_weight', 'current_weight'):
+            if tank.get(field) is not None and not _is_number(tank[field]):
+                errors.append(f"{where}: {field} must be a number")
+        key = tank.get('key')
+        if isinstance(key, str):
+            if key in keys:
+                errors.append(f"{where}: duplicate key {key!r}")
+            keys[key] = (index, tank.get('type'))
+
+    linked_ids = {}
+    for index, feeder in enumerate(feeders):
+        where = f"feeders[{index}]"
+        if not isinstance(feeder, dict) or not feeder.get('name'):
+            errors.append(f"{where}: name is required")
+            continue
+        errors += _string_errors(where, feeder, ('name', 'block_name', 'avatar'))
+        for field, kind in (('food_tank', 'food'), ('water_tank', 'water')):
+            ref = feeder.get(field)
+            if ref is None:
+                continue
+            if isinstance(ref, int) and not isinstance(ref, bool):
+                linked_ids.setdefault(ref, []).append((where, field, kind))
+            elif not isinstance(ref, str):
+                errors.append(f"{where}: {field} must be a manifest tank key (string) or a tank id (integer)")
+            elif ref in keys:
+                if keys[ref][1] != kind:
+                    errors.append(f"{where}: {field} {ref!r} is not a {kind} tank")
+            else:
+                errors.append(f"{where}: {field} {ref!r} is neither a manifest tank key nor a tank id")
+
+    if linked_ids:
+        existing = dict(db.session.query(Tank.id, Tank.type).filter(Tank.id.in_(list(linked_ids))).all())
+        for tank_id, uses in linked_ids.items():
+            for where, field, kind in uses:
+                if tank_id not in existing:
+                    errors.append(f"{where}: {field} {tank_id} does not exist")
+                elif existing[tank_id] != kind:
+                    errors.append(f"{where}: {field} {tank_id} is not a {kind} tank")
+
+    if partitioning.enabled:
+        for index, device in enumerate(tanks + feeders):
+            if isinstance(device, dict) and isinstance(device.get('block_name'), str) and device['block_name']:
+                key = placement_key(block_name=device['block_name'])
+                if not partitioning.is_local_key(key):
+                    errors.append(f"{device.get('name')}: block {device['block_name']!r} belongs to "
+                                  f"partition {partitioning.node_for_key(key)}")
+
+    if errors:
+        raise ProvisioningError(errors)
+    return tanks, feeders
+
+
+def split_manifest(manifest, partitioning):
+    """Splits a manifest by owning partition: {node: manifest}, in node order.
+
+    Devices with a block go to the block's partition, a tank without one follows
+    the feeders linking it, a feeder without one follows its tanks, and the rest
+    are placed by name. Returns None for a malformed manifest (the node it is
+    sent to reports the errors); raises ProvisioningError when a feeder would
+    link a tank on another partition."""
+    if not isinstance(manifest, dict):
+        return None
+    tanks = manifest.get('tanks') or []
+    feeders = manifest.get('feeders') or []
+    if not isinstance(tanks, list) or not isinstance(feeders, list):
+        return None
+    if not all(isinstance(device, dict) for device in tanks + feeders):
+        return None
+
+    def block_node(spec):
+        block = spec.get('block_name')
+        if isinstance(block, str) and block:
+            return partitioning.node_for_key(placement_key(block_name=block))
+        return None
+
+    def name_node(spec):
+        return partitioning.node_for_key(placement_key(name=str(spec.get('name'))))
+
+    key_index = {t['key']: i for i, t in enumerate(tanks) if isinstance(t.get('key'), str)}
+    tank_nodes = [block_node(t) for t in tanks]
+
+    def refs(feeder):
+        return [(field, feeder.get(field)) for field in ('food_tank', 'water_tank') if feeder.get(field) is not None]
+
+    def ref_node(ref):
+        if isinstance(ref, int) and not isinstance(ref, bool):
+            return partitioning.node_for_id(ref)
+        if isinstance(ref, str) and ref in key_index:
+            return tank_nodes[key_index[ref]]
+        return None
+
+    # Feeders placed by block or by an existing tank pull their unplaced manifest tanks along
+    for feeder in feeders:
+        node = block_node(feeder) or next(filter(None, (ref_node(r) for _, r in refs(feeder))), None)
+        for _, ref in refs(feeder):
+            if node and isinstance(ref, str) and ref in key_index and tank_nodes[key_index[ref]] is None:
+                tank_nodes[key_index[ref]] = node
+    tank_nodes = [node or name_node(tank) for node, tank in zip(tank_nodes, tanks)]
+
+    errors = []
+    feeder_nodes = []
+    for index, feeder in enumerate(feeders):
+        node = block_node(feeder) or next(filter(None, (ref_node(r) for _, r in refs(feeder))), None) \
+            or name_node(feeder)
+        for field, ref in refs(feeder):
+            other = ref_node(ref)
+            if other is not None and other != node:
+                errors.append(f"feeders[{index}]: {field} {ref!r} is on partition {other}, "
+                              f"the feeder on {node}")
+        feeder_nodes.append(node)
+    if errors:
+        raise ProvisioningError(errors)
+
+    parts = {}
+    for kind, devices, nodes in (('tanks', tanks, tank_nodes), ('feeders', feeders, feeder_nodes)):
+        for device, node in zip(devices, nodes):
+            parts.setdefault(node, {'tanks': [], 'feeders': []})[kind].append(device)
+    return {node: parts[node] for node in partitioning.names if node in parts}
+
+
+def provision(manifest, partitioning, dry_run=False):
+    """Creates every tank and feeder of the manifest in one transaction.
+
+    Returns the credential sheet: one dict per device (SHEET_COLUMNS); with
+    dry_run the manifest is only validated and the sheet is empty."""
+    tank_specs, feeder_specs = _validate(manifest, partitioning)
+    if dry_run:
+        return []
+    tokens = iter(generate_tokens(len(tank_specs) + len(feeder_specs)))
+
+    tanks = []
+    tank_ids = {}
+    for tank_id, spec in zip(partitioning.allocate_ids(Tank, len(tank_specs)), tank_specs):
+        tank = Tank(id=tank_id, token=next(tokens), **{f: spec[f] for f in TANK_FIELDS if f in spec})
+        if spec.get('max_weight') is not None and spec.get('current_weight') is None:
+            tank.current_weight = spec['max_weight']  # commissioned full
+        tanks.append(tank)
+        if spec.get('key') is not None:
+            tank_ids[spec['key']] = tank_id
+
+    def link(ref):
+        return tank_ids.get(ref) if isinstance(ref, str) else ref
+
+    feeders = []
+    for feeder_id, spec in zip(partitioning.allocate_ids(Feeder, len(feeder_specs)), feeder_specs):
+        feeder = Feeder(name=spec['name'], food_tank_id=link(spec.get('food_tank')),
+                        water_tank_id=link(spec.get('water_tank')),
+                        avatar=spec.get('avatar') or 'cat', token=next(tokens))
+        feeder.id = feeder_id
+        feeder.block_name = spec.get('block_name')
+        feeders.append(feeder)
+
+    # Built before the commit, which expires the instances
+    sheet = [{'kind': 'tank', 'id': t.id, 'name': t.name, 'block_name': t.block_name, 'type': t.type,
+              'food_tank_id': None, 'water_tank_id': None, 'token': t.token} for t in tanks]
+    sheet += [{'kind': 'feeder', 'id': f.id, 'name': f.name, 'block_name': f.block_name, 'type': None,
+               'food_tank_id': f.food_tank_id, 'water_tank_id': f.water_tank_id, 'token': f.token}
+              for f in feeders]
+
+    # Explicit primary keys let the flush batch each table into one executemany
+    try:
+        db.session.add_all(tanks)
+        db.session.add_all(feeders)
+        commit_devices(*tanks, *feeders)
+    except Exception:
+        db.session.rollback()
+        raise
+    return sheet
+
+
+def sheet_csv(sheet):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=SHEET_COLUMNS)
+    writer.writeheader()
+    writer.writerows(sheet)
+    return buffer.getvalue()
+
+
+def sheet_json(sheet):
+    return json.dumps({'devices': sheet}, ensure_ascii=False, indent=2)
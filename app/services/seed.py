@@ -0,0 +1,35 @@
+# Default data for a fresh installation.
+# Kept out of create_app() so worker boots never pay for the seed queries
+# or the password hashing; run it once with `flask --app main seed`.
+
+from flask import current_app
+from database import db
+from app.models.tank import Tank
+from app.models.user import User
+
+DEFAULT_USERS = [
+    ('admin', 'admin123'),
+    ('Daniel', 'codeez4ever'),
+]
+
+
+def seed_defaults():
+    # Initialize default tanks if none exist
+    if not Tank.query.first():
+        partitioning = current_app.extensions['partitioning']
+        for tank in (Tank(name="Tanque de Ração Principal", type="food", capacity="5kg"),
+                     Tank(name="Bebedouro Principal", type="water", capacity="3L")):
+            partitioning.assign_id(tank)
+            db.session.add(tank)
+            db.session.flush()
+        db.session.commit()
+        print("Default tanks created.")
+
+    # Initialize default admin users
+    for username, password in DEFAULT_USERS:
+        if not User.query.filter_by(username=username).first():
+            user = User(username=username, is_admin=True)
+            user.set_password(password)
+            db.session.add(user)
+            db.session.commit()
+            print(f"User {username} created.")
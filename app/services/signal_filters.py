@@ -0,0 +1,203 @@
+# Streaming filters for the drawer scale readings in report_status.
+# Each feeder selects a filter (Feeder.weight_filter); its state is O(1) and kept
+# in memory per worker process (see FilterBank). 'deadband' is the original 2 g
+# band against last_stable_weight and keeps its state in the database row.
+#
+# The filtered weight is classified into LSH/LSL/LSLL with a hysteresis margin:
+# a feeder drops to a worse state immediately but only climbs back once the
+# weight clears the threshold by STATE_MARGIN_G, so readings hovering around a
+# threshold no longer flip sensor_state (and fire smart refills) on every beat.
+
+import math
+import threading
+from collections import deque
+
+STATE_MARGIN_G = 3.0      # climb-back margin for the non-legacy filters
+WEIGHT_RESOLUTION_G = 1.0  # filtered changes below this are not persisted
+
+
+class DeadbandFilter:
+    """Legacy behaviour: only move when the raw reading leaves a +/-2 g band."""
+    stateful = False
+    margin = 0.0
+
+    def __init__(self, band=2.0):
+        self.band = band
+
+    def update(self, raw, last_stable):
+        if abs(raw - (last_stable or 0.0)) > self.band:
+            return raw
+        return None
+
+
+class MovingMedianFilter:
+    """Median of the last `window` readings: removes single-sample vibration spikes."""
+    stateful = True
+    margin = STATE_MARGIN_G
+
+    def __init__(self, window=5):
+        self.samples = deque(maxlen=window)
+
+    def update(self, raw, last_stable):
+        self.samples.append(raw)
+        # Upper median while the window fills: one early spike cannot halve the weight
+        ordered = sorted(self.samples)
+        return ordered[len(ordered) // 2]
+
+
+class EMAFilter:
+    """Exponential moving average: smooths noise and follows slow drift."""
+    stateful = True
+    margin = STATE_MARGIN_G
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, raw, last_stable):
+        if self.value is None:
+            self.value = raw
+        else:
+            self.value += self.alpha * (raw - self.value)
+        return self.value
+
+
+class HysteresisFilter:
+    """Band filter with memory: output only moves when the reading leaves the band,
+    and then by the excess, so slow drift is tracked instead of ignored."""
+    stateful = True
+    margin = STATE_MARGIN_G
+
+    def __init__(self, band=4.0):
+        self.band = band
+        self.value = None
+
+    def update(self, raw, last_stable):
+        if self.value is None:
+            self.value = raw
+        elif raw > self.value + self.band:
+            self.value = raw - self.band
+        elif raw < self.value - self.band:
+            self.value = raw + self.band
+        return self.value
+
+
+class KalmanFilter:
+    """1-D constant-level Kalman filter (process noise q, measurement noise r)."""
+    stateful = True
+    margin = STATE_MARGIN_G
+
+    def __init__(self, q=0.5, r=16.0):
+        self.q = q
+        self.r = r
+        self.x = None
+        self.p = r
+
+    def update(self, raw, last_stable):
+        if self.x is None:
+            self.x = raw
+            return self.x
+        self.p += self.q
+        gain = self.p / (self.p + self.r)
+        self.x += gain * (raw - self.x)
+        self.p *= (1 - gain)
+        return self.x
+
+
+FILTERS = {
+    'deadband': DeadbandFilter,
+    'median': MovingMedianFilter,
+    'ema': EMAFilter,
+    'hysteresis': HysteresisFilter,
+    'kalman': KalmanFilter,
+}
+
+
+def classify(weight, warning, critical, previous_state=None, margin=0.0):
+    """LSH / LSL / LSLL with a climb-back margin (downgrades are immediate)."""
+    if weight > warning:
+        state = 'LSH'
+    elif weight > critical:
+        state = 'LSL'
+    else:
+        state = 'LSLL'
+
+    if margin and previous_state in ('LSL', 'LSLL'):
+        if previous_state == 'LSLL' and state != 'LSLL' and weight <= critical + margin:
+            state = 'LSLL'
+        elif previous_state == 'LSL' and state == 'LSH' and weight <= warning + margin:
+            state = 'LSL'
+    return state
+
+
+class FilterBank:
+    """Per-process filter instances, one per feeder.
+
+    Not shared between gunicorn workers: each worker filters only the beats
+    routed to it, so with N workers a median window spans about N times more
+    wall time and EMA/Kalman converge on fewer samples, and a worker restart
+    starts the feeder's filter over. Only the result is shared (drawer_weight
+    and sensor_state in the row), and classify()'s climb-back margin keeps
+    workers that disagree by a few grams from flipping sensor_state. For the
+    same reason drawer_weight is only rewritten when this worker's output moves
+    away from what this worker last persisted, never by comparing it with the
+    column another worker may have written. Feeders
+    that need one coherent filter state should use 'deadband', whose state is
+    last_stable_weight in the database."""
+    _filters = {}  # feeder_id -> (filter name, instance)
+    _persisted = {}  # feeder_id -> drawer_weight this worker last wrote
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, feeder_id, name):
+        name = name if name in FILTERS else 'deadband'
+        with cls._lock:
+            entry = cls._filters.get(feeder_id)
+            if entry is None or entry[0] != name:
+                entry = (name, FILTERS[name]())
+                cls._filters[feeder_id] = entry
+                cls._persisted.pop(feeder_id, None)
+            return entry[1]
+
+    @classmethod
+    def persisted(cls, feeder_id):
+        with cls._lock:
+            return cls._persisted.get(feeder_id)
+
+    @classmethod
+    def mark_persisted(cls, feeder_id, weight):
+        with cls._lock:
+            cls._persisted[feeder_id] = weight
+
+    @classmethod
+    def reset(cls, feeder_id=None):
+        with cls._lock:
+            if feeder_id is None:
+                cls._filters.clear()
+                cls._persisted.clear()
+            else:
+                cls._filters.pop(feeder_id, None)
+                cls._persisted.pop(feeder_id, None)
+
+
+def filter_weight(feeder, raw):
+    """Runs raw through the feeder's filter.
+
+    Returns (weight to persist or None if unchanged, weight to classify, margin)."""
+    filt = FilterBank.get(feeder.id, feeder.weight_filter)
+    filtered = filt.update(raw, feeder.last_stable_weight)
+
+    if not filt.stateful:
+        # Deadband: None means "inside the band, keep the stored weight"
+        current = feeder.drawer_weight or raw
+        return filtered, (filtered if filtered is not None else current), filt.margin
+
+    # Compare with this worker's own last write: another worker's filter output in the
+    # column differs by more than the resolution, and would be rewritten on every beat
+    previous = FilterBank.persisted(feeder.id)
+    if previous is None:
+        previous = feeder.drawer_weight
+    if previous is None or math.fabs(filtered - previous) >= WEIGHT_RESOLUTION_G:
+        FilterBank.mark_persisted(feeder.id, round(filtered, 1))
+        return round(filtered, 1), filtered, filt.margin
+    return None, filtered, filt.margin
@@ -0,0 +1,141 @@
+# Opt-in per-request SQL profiling (SQL_PROFILE=1).
+# Engine events time every statement executed inside a request. At the end of
+# the request the statements are grouped by shape (whitespace collapsed,
+# expanded IN lists folded), and:
+#   - a shape repeated SQL_NPLUSONE_THRESHOLD+ times is logged as an N+1 suspect,
+#     with the app code line that issued it (usually a lazy relationship load);
+#   - statements slower than SQL_SLOW_MS are logged with the route;
+#   - the response carries X-SQL-Queries and a Server-Timing `sql` entry
+#     (shown by browser devtools);
+#   - the report is kept in a per-process ring buffer for /debug/sql.
+# Statements outside a request (log writer thread, CLI, boot) are not recorded.
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\((?:\?|%\(\w+\)s|:\w+)(?:,\s*(?:\?|%\(\w+\)s|:\w+))+\)')
+
+
+def statement_shape(statement):
+    """Statement without layout noise: one line, IN (?, ?, ...) folded."""
+    return _IN_LIST.sub('(?...)', _WHITESPACE.sub(' ', statement).strip())
+
+
+def _origin():
+    """file:line of the innermost app frame (not SQLAlchemy, not this module)."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_ROOT) and filename != __file__ and 'site-packages' not in filename:
+            return f"{os.path.relpath(filename, APP_ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+class SQLProfiler:
+    def __init__(self, app, engine, slow_ms=50.0, repeat_threshold=5, history=200):
+        self.app = app
+        self.slow_ms = slow_ms
+        self.repeat_threshold = repeat_threshold
+        self.reports = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+        app.after_request(self._after_request)
+
+    # --- Engine events ---
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None and has_request_context():
+            context._profiler_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_profiler_started', None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        shape = statement_shape(statement)
+
+        if 'sql_profile' not in g:
+            g.sql_profile = {'count': 0, 'ms': 0.0, 'shapes': {}, 'slow': []}
+        profile = g.sql_profile
+        profile['count'] += 1
+        profile['ms'] += elapsed_ms
+
+        entry = profile['shapes'].get(shape)
+        if entry is None:
+            entry = profile['shapes'][shape] = {'count': 0, 'ms': 0.0, 'origin': None}
+        entry['count'] += 1
+        entry['ms'] += elapsed_ms
+        if entry['count'] == self.repeat_threshold:
+            # The repeating call site, while it is still on the stack
+            entry['origin'] = _origin()
+
+        if elapsed_ms >= self.slow_ms:
+            profile['slow'].append({'statement': shape, 'ms': round(elapsed_ms, 2), 'origin': _origin()})
+
+    # --- Request hook ---
+
+    def _after_request(self, response):
+        profile = g.pop('sql_profile', None) or {'count': 0, 'ms': 0.0, 'shapes': {}, 'slow': []}
+        route = request.endpoint or request.path
+
+        repeated = sorted(
+            ({'statement': shape, 'count': entry['count'], 'ms': round(entry['ms'], 2), 'origin': entry['origin']}
+             for shape, entry in profile['shapes'].items() if entry['count'] >= self.repeat_threshold),
+            key=lambda r: -r['count'])
+        for suspect in repeated:
+            self.app.logger.warning("N+1 suspect in %s %s: %dx %s (%s)", request.method, route,
+                                    suspect['count'], suspect['statement'][:200], suspect['origin'] or 'unknown origin')
+        for slow in profile['slow']:
+            self.app.logger.warning("Slow query in %s %s: %.1f ms %s (%s)", request.method, route,
+                                    slow['ms'], slow['statement'][:200], slow['origin'] or 'unknown origin')
+
+        response.headers['X-SQL-Queries'] = (f"count={profile['count']}; time={profile['ms']:.1f}ms; "
+                                             f"repeated={len(repeated)}; slow={len(profile['slow'])}")
+        timing = f'sql;dur={profile["ms"]:.1f};desc="{profile["count"]} queries"'
+        existing = response.headers.get('Server-Timing')
+        response.headers['Server-Timing'] = f"{existing}, {timing}" if existing else timing
+
+        report = {
+            'at': time.time(),
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'endpoint': route,
+            'status': response.status_code,
+            'queries': profile['count'],
+            'sql_ms': round(profile['ms'], 2),
+            'distinct': len(profile['shapes']),
+            'repeated': repeated,
+            'slow': profile['slow'],
+        }
+        with self._lock:
+            self.reports.append(report)
+        return response
+
+    # --- Debug page ---
+
+    def recent(self):
+        with self._lock:
+            return list(reversed(self.reports))
+
+    def by_endpoint(self):
+        """Per-route worst case over the ring buffer: the numbers a regression moves."""
+        routes = {}
+        for report in self.recent():
+            route = routes.setdefault(report['endpoint'], {'endpoint': report['endpoint'], 'requests': 0,
+                                                           'max_queries': 0, 'max_sql_ms': 0.0, 'suspects': 0})
+            route['requests'] += 1
+            route['max_queries'] = max(route['max_queries'], report['queries'])
+            route['max_sql_ms'] = max(route['max_sql_ms'], report['sql_ms'])
+            route['suspects'] += len(report['repeated'])
+        return sorted(routes.values(), key=lambda r: -r['max_queries'])
@@ -0,0 +1,98 @@
+# Hierarchical timing wheel (Varghese & Lauck).
+# `levels` wheels of `slots` buckets each; level L buckets span slots**L ticks, so
+# with the defaults (1 s tick, 64 slots, 3 levels) deadlines up to ~3 days are
+# placed directly and later ones are parked in the last level and re-placed as
+# time catches up. Buckets are dicts keyed by timer key, so schedule and cancel
+# are O(1); advancing costs one bucket per tick plus the occasional cascade of a
+# higher-level bucket into the levels below. Not thread-safe: callers lock.
+
+
+class _Timer:
+    __slots__ = ('key', 'expires', 'payload', 'level', 'slot')
+
+    def __init__(self, key, expires, payload):
+        self.key = key
+        self.expires = expires
+        self.payload = payload
+        self.level = None
+        self.slot = None
+
+
+class TimingWheel:
+    def __init__(self, tick=1.0, slots=64, levels=3, now=0.0):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.current = int(now // tick)  # last tick processed
+        self._wheels = [[{} for _ in range(slots)] for _ in range(levels)]
+        self._timers = {}
+
+    def __len__(self):
+        return len(self._timers)
+
+    def __contains__(self, key):
+        return key in self._timers
+
+    def schedule(self, key, at, payload=None):
+        """Fires `payload` at time `at` (replaces an existing timer with the same key)."""
+        self.cancel(key)
+        timer = _Timer(key, max(int(-(-at // self.tick)), self.current + 1), payload)
+        self._timers[key] = timer
+        self._place(timer)
+
+    def cancel(self, key):
+        """Removes a timer; returns its payload, or None if it was not scheduled."""
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return None
+        del self._wheels[timer.level][timer.slot][key]
+        return timer.payload
+
+    def get(self, key):
+        """Payload of a scheduled timer, or None."""
+        timer = self._timers.get(key)
+        return timer.payload if timer else None
+
+    def advance(self, now):
+        """Processes every tick up to `now`; returns [(key, payload)] of expired timers."""
+        target = int(now // self.tick)
+        expired = []
+        while self.current < target:
+            if not self._timers:
+                self.current = target
+                break
+            self.current += 1
+            # Cascade higher levels first: their timers may land in the buckets below
+            for level in range(self.levels - 1, 0, -1):
+                if self.current % self.slots ** level == 0:
+                    bucket = self._wheels[level][(self.current // self.slots ** level) % self.slots]
+                    timers = list(bucket.values())
+                    bucket.clear()
+                    for timer in timers:
+                        self._place(timer)
+            bucket = self._wheels[0][self.current % self.slots]
+            if bucket:
+                timers = list(bucket.values())
+                bucket.clear()
+                for timer in timers:
+                    if timer.expires <= self.current:
+                        del self._timers[timer.key]
+                        expired.append((timer.key, timer.payload))
+                    else:
+                        self._place(timer)  # parked beyond the wheel's range
+        return expired
+
+    def _place(self, timer):
+        delta = timer.expires - self.current
+        if delta <= 0:
+            level, slot = 0, self.current % self.slots
+        else:
+            for level in range(self.levels):
+                if delta < self.slots ** (level + 1):
+                    break
+            else:
+                # Beyond the top level: park in the farthest bucket, re-placed on cascade
+                delta = self.slots ** self.levels - 1
+            slot = ((self.current + delta) // self.slots ** level) % self.slots
+        timer.level, timer.slot = level, slot
+        self._wheels[level][slot][timer.key] = timer
@@ -0,0 +1,52 @@
+# Per-process cache for the flask-login user loader.
+# Every dashboard request (including the update_theme XHR) resolves current_user;
+# cache hits return a detached CachedUser so templates never touch the database.
+# Entries expire after USER_CACHE_TTL seconds, which bounds staleness across
+# gunicorn workers; writes in this process call invalidate() directly.
+
+import time
+from flask_login import UserMixin
+from database import db
+from app.models.user import User
+
+
+class CachedUser(UserMixin):
+    """Lightweight, session-free copy of the fields the views and templates use."""
+    __slots__ = ('id', 'username', 'is_admin', 'theme')
+
+    def __init__(self, id, username, is_admin, theme):
+        self.id = id
+        self.username = username
+        self.is_admin = is_admin
+        self.theme = theme
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+
+class UserCache:
+    _entries = {}  # user_id -> (expires_at, CachedUser)
+    ttl = 30.0
+
+    @classmethod
+    def get(cls, user_id):
+        entry = cls._entries.get(user_id)
+        now = time.monotonic()
+        if entry and entry[0] > now:
+            return entry[1]
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            cls._entries.pop(user_id, None)
+            return None
+
+        cached = CachedUser(user.id, user.username, bool(user.is_admin), user.theme or 'dark')
+        cls._entries[user_id] = (now + cls.ttl, cached)
+        return cached
+
+    @classmethod
+    def invalidate(cls, user_id=None):
+        if user_id is None:
+            cls._entries.clear()
+        else:
+            cls._entries.pop(user_id, None)
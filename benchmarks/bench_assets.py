@@ -0,0 +1,123 @@
+"""Dashboard page weight and modelled load time: CDN assets vs the self-hosted build.
+
+Renders the dashboard (three feeders, one per avatar) through the test client
+twice: once as the old base.html loaded it (CDN libraries and avatars, Google
+Fonts, the full-size logo) and once from the hashed, pre-compressed build. Each asset referenced by the page is fetched the way a
+browser would (Accept-Encoding: br, gzip) and its transferred size and cache
+policy recorded; CDN assets are fetched over the network and reported as
+unmeasured when it is unreachable. The load time is modelled for a barn link:
+a new TLS connection per origin (3 RTT), one RTT per request, bytes over the
+bandwidth; on a repeat visit, immutable assets cost nothing.
+
+    python benchmarks/bench_assets.py [rtt_ms] [kbit_s]
+
+Run `flask --app main assets --fetch` first so the self-hosted side is complete
+(this script rebuilds app/static/dist like `flask --app main assets`).
+"""
+import html as markup
+import os
+import re
+import sys
+import tempfile
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+GOOGLE_FONTS = 'https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap'
+REF = re.compile(r'<(?:script|img|link)\b[^>]*?(?:src|href)="([^"]+)"')
+
+
+def make_app(tmp):
+    from config import Config
+    from main import create_app
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        JOURNAL_DIR = os.path.join(tmp, 'journal')
+        HISTORY_DIR = os.path.join(tmp, 'history')
+        BACKUP_DIR = os.path.join(tmp, 'backups')
+        BACKUP_INTERVAL_S = 0
+        LOG_WRITER_ASYNC = False
+        ADMISSION_ENABLED = False
+        DEADLINE_THREAD = False
+        DISPENSE_VERIFY_THREAD = False
+    return create_app(BenchConfig)
+
+
+def fetch_external(url):
+    request = urllib.request.Request(url, headers={'Accept-Encoding': 'br, gzip', 'User-Agent': 'bench'})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return len(response.read()), response.headers.get('Cache-Control', '')
+    except OSError:
+        return None, ''
+
+
+def page(app, client):
+    html = client.get('/').get_data()
+    assets = [('(page)', len(html), 'no-store')]
+    for ref in dict.fromkeys(markup.unescape(ref) for ref in REF.findall(html.decode())):
+        if ref.startswith('https://'):
+            size, cache = fetch_external(ref)
+            assets.append((ref, size, cache))
+        elif ref.startswith('/static/'):
+            response = client.get(ref, headers={'Accept-Encoding': 'br, gzip'})
+            assets.append((ref, len(response.data) if response.status_code == 200 else None,
+                           response.headers.get('Cache-Control', '')))
+    return assets
+
+
+def cacheable(cache_control):
+    max_age = re.search(r'max-age=(\d+)', cache_control)
+    return bool(max_age) and int(max_age.group(1)) > 0 and 'no-cache' not in cache_control
+
+
+def report(label, assets, rtt, kbit_s):
+    origins = {a[0].split('/')[2] for a in assets if a[0].startswith('https://')}
+    measured = sum(a[1] or 0 for a in assets)
+    unmeasured = sum(1 for a in assets if a[1] is None)
+    first = (len(origins) * 3 + 1 + len(assets)) * rtt + measured * 8 / (kbit_s * 1000)
+    # Repeat visit: only what the cache may not reuse goes out (revalidation, no body but the page)
+    revisit = [a for a in assets if not cacheable(a[2])]
+    revisit_origins = {a[0].split('/')[2] for a in revisit if a[0].startswith('https://')}
+    repeat = (len(revisit_origins) * 3 + len(revisit)) * rtt + assets[0][1] * 8 / (kbit_s * 1000)
+    print(f"\n{label}: {len(assets)} requests, {len(origins)} third-party origins, "
+          f"{measured / 1024:,.1f} KiB transferred" + (f" (+{unmeasured} unmeasured)" if unmeasured else ''))
+    for name, size, cache in assets:
+        print(f"  {'?' if size is None else f'{size / 1024:9,.1f} KiB'}  {cache[:38]:38}  {name}")
+    print(f"  modelled first load {first:5.2f} s, repeat visit {repeat:5.2f} s")
+
+
+def main():
+    rtt = (float(sys.argv[1]) if len(sys.argv) > 1 else 300.0) / 1000
+    kbit_s = float(sys.argv[2]) if len(sys.argv) > 2 else 1000.0
+    from app.services import assets as pipeline
+    from app.services.seed import seed_defaults
+
+    tmp = tempfile.mkdtemp()
+    app = make_app(tmp)
+    with app.app_context():
+        from database import db
+        from app.models.feeder import Feeder
+        seed_defaults()
+        db.session.add_all(Feeder(name=f"Bench {avatar}", avatar=avatar) for avatar in ('squirrel', 'mouse', 'twister'))
+        db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+
+    store = app.extensions['assets']
+    store.manifest, store.hashed = {}, set()
+    store._resolved = {name: url for name, (url, _) in pipeline.VENDOR.items()}
+    store._resolved.update({'css/fonts.css': GOOGLE_FONTS, 'logo-96.png': 'logo.png'})
+    report('CDN', page(app, client), rtt, kbit_s)
+
+    stats = pipeline.build(app.static_folder)
+    store.load()
+    report(f"Self-hosted build (brotli {'on' if stats['brotli'] else 'off'})", page(app, client), rtt, kbit_s)
+    print(f"\nLink model: RTT {rtt * 1000:.0f} ms, {kbit_s:,.0f} kbit/s")
+
+
+if __name__ == '__main__':
+    main()
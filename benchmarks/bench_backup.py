@@ -0,0 +1,104 @@
+"""Heartbeat latency while an online backup runs: WAL vs rollback journal.
+
+A separate process (like a gunicorn worker) posts status heartbeats whose
+weight changes every time, so each one commits. Meanwhile this process takes a
+backup of the same database; heartbeat p50/p99 inside the backup window are
+compared with the ones outside it.
+
+    python benchmarks/bench_backup.py [log_rows] [feeders]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_config(tmp, wal):
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        JOURNAL_DIR = os.path.join(tmp, 'journal')
+        HISTORY_DIR = os.path.join(tmp, 'history')
+        BACKUP_DIR = os.path.join(tmp, 'backups')
+        BACKUP_INTERVAL_S = 0
+        LOG_WRITER_ASYNC = False
+        ADMISSION_ENABLED = False
+        DEADLINE_THREAD = False
+        SQLITE_WAL = wal
+    return BenchConfig
+
+
+def heartbeats(tmp, wal, creds, seconds, results):
+    from main import create_app
+    client = create_app(make_config(tmp, wal)).test_client()
+    samples = []
+    deadline = time.time() + seconds
+    i = 0
+    while time.time() < deadline:
+        fid, token = creds[i % len(creds)]
+        started = time.perf_counter()
+        client.post(f'/api/feeder/{fid}/status', json={'weight': 100.0 + i % 97, 'battery': 90},
+                    headers={'Authorization': f'Bearer {token}'})
+        samples.append((time.time(), time.perf_counter() - started))
+        i += 1
+        time.sleep(0.002)
+    results.put(samples)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[max(0, -(-p * len(values) // 100) - 1)] * 1000 if values else float('nan')
+
+
+def run(label, wal, step_pages, log_rows, feeders):
+    from sqlalchemy import insert
+    from main import create_app
+    from database import db
+    from app.models.feeder import Feeder
+    from app.models.log import Log
+    from app.services import backup
+
+    tmp = tempfile.mkdtemp()
+    app = create_app(make_config(tmp, wal))
+    with app.app_context():
+        rows = [Feeder(name=f"Feeder {i}") for i in range(feeders)]
+        db.session.add_all(rows)
+        db.session.commit()
+        creds = [(f.id, f.token) for f in rows]
+        batch = [{'feeder_id': creds[i % feeders][0], 'action': 'auto', 'duration_ms': 1000} for i in range(10000)]
+        for _ in range(log_rows // len(batch)):
+            db.session.execute(insert(Log), batch)
+        db.session.commit()
+        db_path = backup.sqlite_path(db.engine)
+    size_mb = os.path.getsize(db_path) / 1e6
+
+    results = multiprocessing.Queue()
+    worker = multiprocessing.Process(target=heartbeats, args=(tmp, wal, creds, 6.0, results))
+    worker.start()
+    time.sleep(2.0)
+    started = time.time()
+    stats = backup.snapshot(db_path, os.path.join(tmp, 'backups'), 'manual', step_pages=step_pages)
+    finished = time.time()
+    samples = results.get()
+    worker.join()
+
+    inside = [s for t, s in samples if started <= t <= finished + 0.05]
+    outside = [s for t, s in samples if t < started - 0.5 or t > finished + 0.5]
+    print(f"{label:>28}: {size_mb:5.0f} MB in {stats['seconds'] * 1000:6.0f} ms "
+          f"({stats['steps']} steps, {stats['restarts']} restarts) | heartbeat p50/p99 "
+          f"idle {percentile(outside, 50):5.1f}/{percentile(outside, 99):5.1f} ms, "
+          f"during {percentile(inside, 50):5.1f}/{percentile(inside, 99):6.1f} ms (max {max(inside, default=0) * 1000:.0f}, n={len(inside)})")
+
+
+if __name__ == '__main__':
+    log_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    feeders = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    multiprocessing.set_start_method('spawn')
+    run('rollback journal, stepped', False, 1024, log_rows, feeders)
+    run('rollback journal, one step', False, -1, log_rows, feeders)
+    run('WAL (snapshot copy)', True, 1024, log_rows, feeders)
@@ -0,0 +1,60 @@
+"""Dashboard render time for a large fleet: full render vs cached fragments vs 304.
+
+    python benchmarks/bench_dashboard.py [feeders]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_app(count, fragment_cache_size):
+    from config import Config
+    from main import create_app
+    from database import db
+    from app.models.feeder import Feeder
+    from app.services.seed import seed_defaults
+
+    tmp = tempfile.mkdtemp()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        FRAGMENT_CACHE_SIZE = fragment_cache_size
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        seed_defaults()
+        db.session.add_all([Feeder(name=f"Feeder {i:04d}", food_tank_id=1, water_tank_id=2) for i in range(count)])
+        db.session.commit()
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    client.get('/')  # warm up the read model (and the fragments, when enabled)
+    return client
+
+
+def timed(client, runs=10, headers=None):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        response = client.get('/', headers=headers or {})
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), response
+
+
+def main(count=500):
+    full, _ = timed(make_app(count, 0))
+    client = make_app(count, 5000)
+    cached, response = timed(client)
+    not_modified, _ = timed(client, headers={'If-None-Match': response.headers['ETag']})
+    print(f"{count}-feeder dashboard (median of 10):")
+    print(f"  full render        {full:7.1f} ms")
+    print(f"  cached fragments   {cached:7.1f} ms")
+    print(f"  ETag 304           {not_modified:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,73 @@
+"""Memory footprint and serve time of the in-memory fleet read model.
+
+    python benchmarks/bench_fleet.py [feeders]
+"""
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main(count=10000):
+    from config import Config
+    from main import create_app
+    from database import db
+    from app.models.feeder import Feeder
+    from app.services.fleet import FleetModel
+
+    tmp = tempfile.mkdtemp()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        feeders = []
+        for i in range(count):
+            f = Feeder(name=f"Feeder {i:05d}")
+            f.block_name = f"Block {i % 50}"
+            feeders.append(f)
+        db.session.add_all(feeders)
+        db.session.commit()
+        db.session.expunge_all()
+
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        FleetModel.sync()
+        records = tracemalloc.take_snapshot()
+        FleetModel.fleet_json()
+        with_json = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        def diff(a, b):
+            return sum(s.size_diff for s in b.compare_to(a, 'filename'))
+
+        rec = diff(before, records)
+        js = diff(records, with_json)
+        print(f"{count} feeders: records {rec / 1e6:.2f} MB ({rec / count:.0f} B/feeder), "
+              f"cached JSON {js / 1e6:.2f} MB ({js / count:.0f} B/feeder)")
+
+        runs = 20
+        started = time.perf_counter()
+        for _ in range(runs):
+            json.dumps({'feeders': [f.to_dict() for f in Feeder.query.all()]})
+            db.session.expunge_all()
+        orm_ms = (time.perf_counter() - started) / runs * 1000
+
+        FleetModel.sync_interval = 3600
+        started = time.perf_counter()
+        for _ in range(runs):
+            FleetModel.fleet_json()
+        model_ms = (time.perf_counter() - started) / runs * 1000
+        print(f"fleet JSON: query + to_dict {orm_ms:.1f} ms, read model {model_ms:.1f} ms")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,84 @@
+"""State-transition journal: append rate, timeline query and point-in-time replay.
+
+Writes `days` of synthetic transitions for a fleet (a status/sensor/valve change
+or a command every few minutes per feeder), then times /timeline-style queries
+for one feeder over the last 24 h and fleet state reconstruction at random times.
+
+    python benchmarks/bench_journal.py [feeders] [days]
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.services.journal import Journal  # noqa: E402
+
+TRANSITIONS = [
+    ('status', ['ONLINE', 'CRITICAL', 'TRIP', 'MAINTENANCE']),
+    ('sensor_state', ['LSH', 'LSL', 'LSLL']),
+    ('water_valve_state', ['OPEN', 'CLOSED']),
+    ('is_locked', [True, False]),
+    ('command', [{'type': 'feed', 'duration': 5000}, {'type': 'water_valve', 'state': 'OPEN'}]),
+]
+
+
+def main(feeders, days):
+    tmp = tempfile.mkdtemp()
+    journal = Journal(tmp)
+    journal.ensure_started({})
+    rng = random.Random(7)
+
+    start = time.time() - days * 86400
+    step = 240.0 / feeders  # one transition per feeder every ~4 minutes
+    records = int(days * 86400 / step)
+
+    started = time.perf_counter()
+    ts = start
+    batch = []
+    for _ in range(records):
+        field, values = rng.choice(TRANSITIONS)
+        batch.append((ts, rng.randint(1, feeders), field, rng.choice(values)))
+        ts += step
+        if len(batch) == 64:
+            journal.append(batch)
+            batch = []
+    journal.append(batch)
+    elapsed = time.perf_counter() - started
+
+    size = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp))
+    print(f"{records:,} transitions appended in {elapsed:.1f} s ({records / elapsed:,.0f}/s), "
+          f"{len(journal.segments())} segments, {size / records:.1f} bytes/transition on disk")
+
+    end = start + days * 86400
+    samples = []
+    for _ in range(50):
+        feeder_id = rng.randint(1, feeders)
+        q_end = rng.uniform(start + 86400, end)
+        t0 = time.perf_counter()
+        events = journal.timeline(feeder_id, q_end - 86400, q_end)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    print(f"timeline (24 h, one feeder, ~{len(events)} events): median {samples[len(samples) // 2]:.2f} ms, "
+          f"max {samples[-1]:.2f} ms")
+
+    samples = []
+    for _ in range(20):
+        t0 = time.perf_counter()
+        state = journal.state_at(rng.uniform(start, end))
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    print(f"state_at (snapshot + replay, {len(state)} feeders): median {samples[len(samples) // 2]:.1f} ms, "
+          f"max {samples[-1]:.1f} ms")
+
+    shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    feeders = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    days = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+    main(feeders, days)
@@ -0,0 +1,67 @@
+"""Feed event log throughput: per-request commit vs the group-commit writer.
+
+Several client threads post /api/feeder/<id>/log concurrently (like a whole
+block firing its scheduled feeds at once) against a file-backed SQLite DB.
+
+    python benchmarks/bench_log_writer.py [events] [threads]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def run(async_writer, events, threads):
+    from config import Config
+    from main import create_app
+    from database import db
+    from app.models.feeder import Feeder
+    from app.models.log import Log
+
+    tmp = tempfile.mkdtemp()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        LOG_WRITER_ASYNC = async_writer
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        feeders = [Feeder(name=f"Bench {i}") for i in range(threads)]
+        db.session.add_all(feeders)
+        db.session.commit()
+        creds = [(f.id, f.token) for f in feeders]
+
+    def client(feeder_id, token, count):
+        c = app.test_client()
+        headers = {'Authorization': f'Bearer {token}'}
+        for _ in range(count):
+            c.post(f'/api/feeder/{feeder_id}/log', json={'action': 'auto', 'duration_ms': 1000}, headers=headers)
+
+    per_thread = events // threads
+    workers = [threading.Thread(target=client, args=(fid, tok, per_thread)) for fid, tok in creds]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    writer = app.extensions['log_writer']
+    writer.flush()
+    elapsed = time.perf_counter() - started
+    writer.stop()
+
+    with app.app_context():
+        stored = Log.query.count()
+    label = 'group commit' if async_writer else 'per-request commit'
+    print(f"{label:>20}: {stored} logs in {elapsed:.2f} s -> {stored / elapsed:,.0f} events/s"
+          + (f" ({writer.batches} batches)" if async_writer else ""))
+
+
+if __name__ == '__main__':
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    run(False, events, threads)
+    run(True, events, threads)
@@ -0,0 +1,96 @@
+"""Local multi-process check of the partitioned mode.
+
+Starts N partition processes (each with its own SQLite file) plus the router,
+registers feeders across several blocks through the router, sends heartbeats
+and reports placement, fan-out results and heartbeat throughput.
+
+    python benchmarks/bench_partitions.py [partitions] [feeders]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_PORT = 8100
+ROUTER_PORT = 8199
+
+NODE_CMD = (
+    "import main; from app.services.seed import seed_defaults; a = main.app\n"
+    "with a.app_context(): seed_defaults()\n"
+    "a.run(port={port}, threaded=True)"
+)
+ROUTER_CMD = "import router; router.app.run(port={port}, threaded=True)"
+
+
+def wait_for(url, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def main(partitions=3, feeders=30):
+    tmp = tempfile.mkdtemp()
+    nodes = ",".join(f"p{i}=http://127.0.0.1:{BASE_PORT + i}" for i in range(partitions))
+    base_env = dict(os.environ, PARTITION_NODES=nodes, PARTITION_SECRET='bench', LOG_WRITER_ASYNC='0')
+    procs = []
+    try:
+        for i in range(partitions):
+            env = dict(base_env, PARTITION_NAME=f"p{i}", DATABASE_URL=f"sqlite:///{tmp}/p{i}.db")
+            procs.append(subprocess.Popen([sys.executable, '-c', NODE_CMD.format(port=BASE_PORT + i)],
+                                          cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        procs.append(subprocess.Popen([sys.executable, '-c', ROUTER_CMD.format(port=ROUTER_PORT)],
+                                      cwd=ROOT, env=base_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        for i in range(partitions):
+            wait_for(f"http://127.0.0.1:{BASE_PORT + i}/login")
+        router = f"http://127.0.0.1:{ROUTER_PORT}"
+        wait_for(router + "/login")
+
+        devices = []
+        placement = Counter()
+        for n in range(feeders):
+            block = f"Block {chr(65 + n % 8)}"
+            resp = requests.post(router + "/api/feeder/register", json={'name': f"F{n}", 'block_name': block})
+            data = resp.json()
+            devices.append((data['id'], data['token'], block))
+            placement[(block, resp.headers['X-Partition'])] += 1
+        blocks = {}
+        for (block, node), count in sorted(placement.items()):
+            blocks.setdefault(block, []).append(node)
+        split = [b for b, nodes_ in blocks.items() if len(nodes_) > 1]
+        print(f"blocks -> partitions: { {b: n[0] for b, n in blocks.items()} }")
+        print(f"blocks split across partitions: {split or 'none'}")
+
+        started = time.perf_counter()
+        routed = Counter()
+        rounds = 5
+        for _ in range(rounds):
+            for fid, token, _ in devices:
+                resp = requests.post(f"{router}/api/feeder/{fid}/status", json={'weight': 150, 'battery': 90},
+                                     headers={'Authorization': f'Bearer {token}'})
+                assert resp.status_code == 200, resp.text
+                routed[resp.headers['X-Partition']] += 1
+        elapsed = time.perf_counter() - started
+        print(f"heartbeats via router: {rounds * len(devices)} in {elapsed:.2f} s "
+              f"({rounds * len(devices) / elapsed:,.0f} req/s), per partition {dict(routed)}")
+
+        fleet = requests.get(router + "/api/fleet/feeders").json()
+        print(f"fan-out /api/fleet/feeders: {len(fleet['feeders'])} feeders, partitions {fleet['partitions']}")
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:3]))
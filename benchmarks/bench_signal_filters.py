@@ -0,0 +1,55 @@
+"""Compares the scale filters on a synthetic drawer trace.
+
+The trace drains slowly through the LSL threshold with gaussian noise,
+occasional vibration spikes and a slow drift of the load cell. For each
+filter it counts sensor_state flips (false alarms / smart refills) and
+drawer_weight writes, like report_status would see them.
+
+    python benchmarks/bench_signal_filters.py [samples]
+"""
+import os
+import random
+import sys
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.services.signal_filters import FILTERS, FilterBank, classify, filter_weight  # noqa: E402
+
+
+def trace(samples, seed=7):
+    rng = random.Random(seed)
+    for i in range(samples):
+        level = 120.0 - 60.0 * i / samples           # drains from 120 g to 60 g (warning = 80 g)
+        drift = 3.0 * i / samples                     # load-cell drift
+        noise = rng.gauss(0, 1.5)
+        spike = rng.choice([-40, 40]) if rng.random() < 0.02 else 0.0
+        yield level + drift + noise + spike
+
+
+def run(name, samples):
+    FilterBank.reset()
+    feeder = SimpleNamespace(id=1, weight_filter=name, drawer_weight=0.0, last_stable_weight=0.0, sensor_state='LSH')
+    flips = writes = 0
+    for raw in trace(samples):
+        stable, weight, margin = filter_weight(feeder, raw)
+        if stable is not None and stable != feeder.drawer_weight:
+            feeder.drawer_weight = feeder.last_stable_weight = stable
+            writes += 1
+        state = classify(weight, 80.0, 20.0, feeder.sensor_state, margin)
+        if state != feeder.sensor_state:
+            flips += 1
+            feeder.sensor_state = state
+    return flips, writes
+
+
+def main(samples=2000):
+    print(f"{samples} readings, one real LSH -> LSL transition expected")
+    for name in FILTERS:
+        flips, writes = run(name, samples)
+        print(f"  {name:<11} state flips {flips:4d}   weight writes {writes:5d}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,49 @@
+"""Cold-start timing for a worker: `import main` + building `main.app`.
+
+Each sample runs in a fresh interpreter against a temporary database,
+like a gunicorn worker boot after a deploy.
+
+    python benchmarks/bench_startup.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = """
+import time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+main.app
+t2 = time.perf_counter()
+print((t1 - t0) * 1000, (t2 - t1) * 1000)
+"""
+
+
+def sample(env):
+    out = subprocess.run([sys.executable, '-c', SNIPPET], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return [float(x) for x in out.split()[-2:]]
+
+
+def main(runs=5):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        first_import, first_app = sample(env)  # fresh file: runs the migrations
+        print(f"first boot (migrations): import {first_import:.1f} ms, app {first_app:.1f} ms")
+
+        imports, apps = [], []
+        for _ in range(runs):
+            i, a = sample(env)
+            imports.append(i)
+            apps.append(a)
+        print(f"warm boot x{runs}: import median {statistics.median(imports):.1f} ms, "
+              f"app median {statistics.median(apps):.1f} ms")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
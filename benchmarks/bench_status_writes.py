@@ -0,0 +1,69 @@
+"""SQLite write load of a stable fleet: always-commit vs change-only persistence.
+
+Every feeder reports the same battery/weight/firmware/sensor values on each
+heartbeat. PRESENCE_WRITE_INTERVAL=0 reproduces the old behaviour (every
+heartbeat writes last_seen and commits).
+
+    python benchmarks/bench_status_writes.py [feeders] [rounds]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def run(label, presence_interval, feeders, rounds):
+    from config import Config
+    from main import create_app
+    from database import db
+    from app.models.feeder import Feeder
+    from app.services.dirty import WriteStats
+
+    tmp = tempfile.mkdtemp()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        PRESENCE_WRITE_INTERVAL = presence_interval
+
+    app = create_app(BenchConfig)
+    WriteStats.reset()
+    with app.app_context():
+        rows = [Feeder(name=f"Feeder {i}") for i in range(feeders)]
+        db.session.add_all(rows)
+        db.session.commit()
+        creds = [(f.id, f.token) for f in rows]
+
+        counts = {'UPDATE': 0, 'COMMIT': 0}
+
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_updates(conn, cursor, statement, *args):
+            if statement.startswith('UPDATE'):
+                counts['UPDATE'] += 1
+
+        @event.listens_for(db.engine, 'commit')
+        def count_commits(conn):
+            counts['COMMIT'] += 1
+
+    client = app.test_client()
+    payload = {'battery': 90, 'weight': 150.0, 'water_sensor': 'LSH', 'firmware_version': '1.0.0'}
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for fid, token in creds:
+            client.post(f'/api/feeder/{fid}/status', json=payload, headers={'Authorization': f'Bearer {token}'})
+    elapsed = time.perf_counter() - started
+    stats = WriteStats.snapshot().get('report_status', {})
+    total = feeders * rounds
+    print(f"{label:>22}: {counts['UPDATE']:5d} UPDATEs, {counts['COMMIT']:5d} commits for {total} heartbeats "
+          f"({stats.get('applied', 0)} applied / {stats.get('skipped', 0)} skipped), {total / elapsed:,.0f} req/s")
+
+
+if __name__ == '__main__':
+    feeders = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    run('always write presence', 0, feeders, rounds)
+    run('change-only (60 s)', 60, feeders, rounds)
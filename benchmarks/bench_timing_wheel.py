@@ -0,0 +1,54 @@
+"""Timing wheel: schedule/cancel/advance cost with many armed deadlines.
+
+Arms `count` command deadlines (5 min) and valve deadlines (10-40 s), acks
+(cancels) 95% of the commands, then advances the wheel second by second through
+the next 10 minutes, as the deadlines ticker would.
+
+    python benchmarks/bench_timing_wheel.py [count]
+"""
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.services.timing_wheel import TimingWheel  # noqa: E402
+
+
+def main(count):
+    rng = random.Random(7)
+    now = 1767225600.0
+    wheel = TimingWheel(tick=1.0, now=now)
+
+    started = time.perf_counter()
+    for i in range(count):
+        wheel.schedule(('command', i), now + 300, i)
+        wheel.schedule(('valve', i), now + rng.uniform(10, 40), i)
+    schedule_s = time.perf_counter() - started
+
+    acked = rng.sample(range(count), int(count * 0.95))
+    started = time.perf_counter()
+    for i in acked:
+        wheel.cancel(('command', i))
+    cancel_s = time.perf_counter() - started
+
+    expired = 0
+    worst = 0.0
+    started = time.perf_counter()
+    for second in range(1, 601):
+        tick_started = time.perf_counter()
+        expired += len(wheel.advance(now + second))
+        worst = max(worst, time.perf_counter() - tick_started)
+    advance_s = time.perf_counter() - started
+
+    print(f"{count:,} commands + {count:,} valves")
+    print(f"schedule: {schedule_s / (2 * count) * 1e6:.2f} us/timer")
+    print(f"cancel:   {cancel_s / len(acked) * 1e6:.2f} us/timer")
+    print(f"advance:  600 ticks in {advance_s * 1000:.1f} ms (worst tick {worst * 1000:.2f} ms), "
+          f"{expired:,} expired, {len(wheel)} left")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
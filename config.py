@@ -4,3 +4,104 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///feeders_v7.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Apply pending schema migrations at boot (deploy.sh migrates before restarting)
+    AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', '1') == '1'
+    # Seconds a logged-in user is served from the per-process cache
+    USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '30'))
+    # Feed event logs: async group-commit writer (batch size / max wait in seconds)
+    LOG_WRITER_ASYNC = os.environ.get('LOG_WRITER_ASYNC', '1') == '1'
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+    LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', '200'))
+    LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', '0.005'))
+    # Failed batch writes: attempts before dropping, first backoff (s, doubles each retry)
+    LOG_WRITE_RETRIES = int(os.environ.get('LOG_WRITE_RETRIES', '5'))
+    LOG_RETRY_BACKOFF = float(os.environ.get('LOG_RETRY_BACKOFF', '0.1'))
+    # Partitioned mode: "name=url,..." for every partition and this node's name
+    PARTITION_NODES = os.environ.get('PARTITION_NODES', '')
+    PARTITION_NAME = os.environ.get('PARTITION_NAME', '')
+    PARTITION_SECRET = os.environ.get('PARTITION_SECRET', '')  # required when PARTITION_NODES is set
+    # Max staleness (s) of the in-memory fleet read model for writes from other workers
+    FLEET_SYNC_INTERVAL = float(os.environ.get('FLEET_SYNC_INTERVAL', '2'))
+    # Max cached template fragments per process (0 disables fragment caching)
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', '5000'))
+    # Seconds between last_seen writes for a device that keeps reporting (online window is 120 s;
+    # feeders told to report slowly are written sooner, see heartbeat.presence_interval)
+    PRESENCE_WRITE_INTERVAL = float(os.environ.get('PRESENCE_WRITE_INTERVAL', '60'))
+    # State-transition journal (segment files); defaults to <instance>/journal
+    JOURNAL_ENABLED = os.environ.get('JOURNAL_ENABLED', '1') == '1'
+    JOURNAL_DIR = os.environ.get('JOURNAL_DIR', '')
+    JOURNAL_SEGMENT_BYTES = int(os.environ.get('JOURNAL_SEGMENT_BYTES', str(1 << 20)))
+    # Firmware OTA: artifact dir (defaults to <instance>/firmware), downloads in flight
+    # across all workers, signed URL lifetime (s); FIRMWARE_ACCEL_PREFIX hands the
+    # transfer to nginx (X-Accel-Redirect to an internal location), whose limit_conn
+    # then caps concurrent downloads instead of FIRMWARE_MAX_DOWNLOADS
+    FIRMWARE_DIR = os.environ.get('FIRMWARE_DIR', '')
+    FIRMWARE_MAX_DOWNLOADS = int(os.environ.get('FIRMWARE_MAX_DOWNLOADS', '2'))
+    FIRMWARE_URL_TTL = int(os.environ.get('FIRMWARE_URL_TTL', '86400'))
+    FIRMWARE_ACCEL_PREFIX = os.environ.get('FIRMWARE_ACCEL_PREFIX', '')
+    # Gunicorn sync workers (biofeed.service sets WEB_CONCURRENCY, which gunicorn reads
+    # as its worker count): each serves one request at a time, so this is the most
+    # requests that can ever be in flight
+    WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', '3'))
+    # Device API admission control (state shared by all workers in <instance>/admission.shm):
+    # per-device token bucket (tokens/s, burst), requests in flight across workers
+    # (defaults to the worker count; a larger cap is never reached and never sheds),
+    # share of that cap plain heartbeats may use, and max nginx backlog wait (ms, 0 = off)
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '1') == '1'
+    ADMISSION_RATE = float(os.environ.get('ADMISSION_RATE', '1.0'))
+    ADMISSION_BURST = int(os.environ.get('ADMISSION_BURST', '5'))
+    ADMISSION_MAX_INFLIGHT = int(os.environ.get('ADMISSION_MAX_INFLIGHT', str(WEB_CONCURRENCY)))
+    ADMISSION_HEARTBEAT_SHARE = float(os.environ.get('ADMISSION_HEARTBEAT_SHARE', '0.75'))
+    ADMISSION_MAX_QUEUE_MS = float(os.environ.get('ADMISSION_MAX_QUEUE_MS', '2000'))
+    # Server-directed heartbeat: next report interval (s) sent to feeders by state
+    HEARTBEAT_MIN_S = int(os.environ.get('HEARTBEAT_MIN_S', '2'))
+    HEARTBEAT_WARNING_S = int(os.environ.get('HEARTBEAT_WARNING_S', '15'))
+    HEARTBEAT_IDLE_S = int(os.environ.get('HEARTBEAT_IDLE_S', '60'))
+    HEARTBEAT_MAX_S = int(os.environ.get('HEARTBEAT_MAX_S', '90'))
+    # Tripped feeders report at HEARTBEAT_MIN_S this long after the trip, then at HEARTBEAT_WARNING_S
+    HEARTBEAT_TRIP_FAST_S = int(os.environ.get('HEARTBEAT_TRIP_FAST_S', '120'))
+    # Per-request SQL profiling (off by default): slow statement threshold (ms), repeats of
+    # one statement shape that flag an N+1 suspect, and requests kept for /debug/sql
+    SQL_PROFILE = os.environ.get('SQL_PROFILE', '0') == '1'
+    SQL_SLOW_MS = float(os.environ.get('SQL_SLOW_MS', '50'))
+    SQL_NPLUSONE_THRESHOLD = int(os.environ.get('SQL_NPLUSONE_THRESHOLD', '5'))
+    SQL_PROFILE_HISTORY = int(os.environ.get('SQL_PROFILE_HISTORY', '200'))
+    # Deadlines (shared table, timing wheel in the scanning worker): command ack timeout, grace
+    # after a timed valve open, max time a valve opened without duration may stay open (s), wheel tick (s)
+    COMMAND_ACK_TIMEOUT_S = float(os.environ.get('COMMAND_ACK_TIMEOUT_S', '300'))
+    WATER_VALVE_GRACE_S = float(os.environ.get('WATER_VALVE_GRACE_S', '30'))
+    WATER_VALVE_MAX_OPEN_S = float(os.environ.get('WATER_VALVE_MAX_OPEN_S', '600'))
+    DEADLINE_TICK_S = float(os.environ.get('DEADLINE_TICK_S', '1'))
+    DEADLINE_THREAD = os.environ.get('DEADLINE_THREAD', '1') == '1'
+    # Reading history for charts: day files under HISTORY_DIR (default <instance>/history),
+    # how many downsampled day tiles each worker keeps cached, and days of files kept
+    # (older ones are pruned daily by the dispense verifier thread; 0 = keep forever)
+    HISTORY_ENABLED = os.environ.get('HISTORY_ENABLED', '1') == '1'
+    HISTORY_DIR = os.environ.get('HISTORY_DIR', '')
+    HISTORY_CACHE_TILES = int(os.environ.get('HISTORY_CACHE_TILES', '2048'))
+    HISTORY_RETENTION_DAYS = int(os.environ.get('HISTORY_RETENTION_DAYS', '365'))
+    # Command round-trip tracing: latest acked commands per stage and group used for percentiles
+    COMMAND_TRACE_SAMPLES = int(os.environ.get('COMMAND_TRACE_SAMPLES', '512'))
+    # SQLite: WAL journal (readers, including backups, never block the writers)
+    SQLITE_WAL = os.environ.get('SQLITE_WAL', '1') == '1'
+    # Online backups into BACKUP_DIR (default <instance>/backups): interval (s, 0 = off),
+    # scheduled copies kept, backup API pages per step / pause between steps (s),
+    # restarts (caused by concurrent writes) before finishing in one step
+    BACKUP_DIR = os.environ.get('BACKUP_DIR', '')
+    BACKUP_INTERVAL_S = float(os.environ.get('BACKUP_INTERVAL_S', '86400'))
+    BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', '7'))
+    BACKUP_STEP_PAGES = int(os.environ.get('BACKUP_STEP_PAGES', '1024'))
+    BACKUP_STEP_SLEEP = float(os.environ.get('BACKUP_STEP_SLEEP', '0.005'))
+    BACKUP_MAX_RESTARTS = int(os.environ.get('BACKUP_MAX_RESTARTS', '3'))
+    # Snapshot the database before applying schema migrations
+    BACKUP_BEFORE_MIGRATE = os.environ.get('BACKUP_BEFORE_MIGRATE', '1') == '1'
+    # Dispense verification (needs the reading history): run interval (s, 0 = off), how long
+    # after a feed/refill the drawer is compared (s), events merged into one dispense (s),
+    # minimum weight change (g), how far back the first run looks (s), and whether a thread
+    # runs it (off when something else drives run_once, like the simulator)
+    DISPENSE_VERIFY_INTERVAL_S = float(os.environ.get('DISPENSE_VERIFY_INTERVAL_S', '300'))
+    DISPENSE_VERIFY_WINDOW_S = float(os.environ.get('DISPENSE_VERIFY_WINDOW_S', '300'))
+    DISPENSE_MERGE_S = float(os.environ.get('DISPENSE_MERGE_S', '60'))
+    DISPENSE_MIN_DELTA_G = float(os.environ.get('DISPENSE_MIN_DELTA_G', '20'))
+    DISPENSE_VERIFY_LOOKBACK_S = float(os.environ.get('DISPENSE_VERIFY_LOOKBACK_S', '3600'))
+    DISPENSE_VERIFY_THREAD = os.environ.get('DISPENSE_VERIFY_THREAD', '1') == '1'
@@ -6,11 +6,18 @@ echo "🚀 Starting BioFeed Deployment..."
 echo "📥 Pulling changes from Git..."
 git pull origin main
 
-# 2. Update Database
+# 2. Update Database (pending migrations first snapshot the live database into instance/backups)
 echo "🗄️ Migrating Database..."
 source venv/bin/activate
 python update_db.py
 
+# 2b. Seed defaults (idempotent, first install only creates rows)
+flask --app main seed
+
+# 2c. Static assets: vendored libraries (fetched once, sha256-checked), Tailwind CSS
+#     compiled from the templates (Node.js), hashed + pre-compressed build
+flask --app main assets --fetch --css
+
 # 3. Restart Service
 echo "🔄 Restarting Gunicorn Service..."
 sudo systemctl restart biofeed
@@ -2,6 +2,7 @@
 #include <HTTPClient.h>
 #include <ArduinoJson.h>
 #include <ESP32Servo.h>
+#include <HTTPUpdate.h> // OTA
 
 // ================= CONFIGURATIONS =================
 const char* WIFI_SSID = "YOUR_WIFI_SSID";
@@ -11,6 +12,7 @@ const char* WIFI_PASS = "YOUR_WIFI_PASSWORD";
 const char* SERVER_URL = "http://biofeed.danielmello.store/api"; // Use HTTP for simplicity, or HTTPS with ClientSecure
 const char* FEEDER_TOKEN = "YOUR_DEVICE_TOKEN_HERE"; // Get this from the Web Dashboard
 const char* FEEDER_ID = "2";       // Get this from the Web Dashboard
+const char* FIRMWARE_VERSION = "1.2.0-ESP32"; // Must match the version published for OTA
 
 // Hardware Pins
 const int SERVO_PIN = 13;
@@ -18,7 +20,7 @@ const int TRIG_PIN = 12; // Optional: Ultrasonic Trig
 const int ECHO_PIN = 14; // Optional: Ultrasonic Echo
 
 // Settings
-const int CHECK_INTERVAL = 5000; // Check for commands every 5 seconds
+unsigned long checkInterval = 5000; // Next report delay, set by the server (next_report_s / Retry-After)
 const int SERVO_OPEN_POS = 90;
 const int SERVO_CLOSED_POS = 0;
 
@@ -59,7 +61,7 @@ void loop() {
   }
 
   // Heartbeat & Command Check
-  if (millis() - lastCheckTime > CHECK_INTERVAL) {
+  if (millis() - lastCheckTime > checkInterval) {
     lastCheckTime = millis();
     sendHeartbeat();
   }
@@ -116,14 +118,20 @@ void sendHeartbeat() {
     doc["battery"] = 100; 
     doc["weight"] = level; // Should be readScale() in real hardware
     doc["water_sensor"] = "LSH"; 
-    doc["firmware_version"] = "1.2.0-ESP32";
+    doc["firmware_version"] = FIRMWARE_VERSION;
 
     String requestBody;
     serializeJson(doc, requestBody);
 
+    const char* headerKeys[] = {"Retry-After"};
+    http.collectHeaders(headerKeys, 1);
     int httpResponseCode = http.POST(requestBody);
 
-    if (httpResponseCode > 0) {
+    if (httpResponseCode == 429 || httpResponseCode == 503) {
+      // Server shedding load: back off as told
+      checkInterval = http.header("Retry-After").toInt() * 1000UL;
+      if (checkInterval == 0) checkInterval = 30000;
+    } else if (httpResponseCode > 0) {
       String response = http.getString();
       Serial.println("Heartbeat Sent. Response: " + response);
       processResponse(response);
@@ -148,6 +156,11 @@ void processResponse(String jsonResponse) {
     return;
   }
 
+  // Server-chosen delay: ~60 s when idle and healthy, 2 s while alarming or busy
+  if (doc.containsKey("next_report_s")) {
+    checkInterval = doc["next_report_s"].as<unsigned long>() * 1000UL;
+  }
+
   JsonArray commands = doc["commands"];
   for (JsonObject cmd : commands) {
     String type = cmd["type"];
@@ -168,6 +181,23 @@ void processResponse(String jsonResponse) {
       ackCommand("water_control", "executed", cmdId);
     }
   }
+
+  // OTA: offered (signed URL) when this feeder is in the current rollout wave
+  if (doc.containsKey("firmware")) {
+    String url = doc["firmware"]["url"];
+    performOta(url);
+  }
+}
+
+void performOta(String url) {
+  Serial.println("Firmware update available. Downloading...");
+  WiFiClient client;
+  t_httpUpdate_return ret = httpUpdate.update(client, url);
+  if (ret == HTTP_UPDATE_FAILED) {
+    // 503 = server download limit reached; the offer comes back on a later heartbeat
+    Serial.printf("OTA failed (%d): %s\n", httpUpdate.getLastError(), httpUpdate.getLastErrorString().c_str());
+  }
+  // On success the ESP32 reboots into the new image
 }
 
 void dispenseFood(int duration) {
@@ -1,12 +1,20 @@
+import os
+import time
+import click
 from flask import Flask
 from config import Config
 from database import db
-from app.routes.api_feed import api_bp
-from app.routes.dashboard import dashboard_bp
 
-def create_app():
+def create_app(config_class=Config):
+    started = time.perf_counter()
+
+    # Blueprints are imported here so `import main` stays cheap (CLI, scripts)
+    from app.routes.api_feed import api_bp
+    from app.routes.dashboard import dashboard_bp
+    from app.routes.auth import auth_bp
+
     app = Flask(__name__, template_folder='app/templates', static_folder='app/static')
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
 
     db.init_app(app)
 
@@ -18,48 +26,295 @@ def create_app():
     login_manager.login_message = "Faça login para acessar esta página."
     login_manager.login_message_category = "info"
 
-    from app.models.user import User
+    from app.services.user_cache import UserCache
+    UserCache.ttl = app.config['USER_CACHE_TTL']
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return UserCache.get(int(user_id))
 
     # Blueprints
-    from app.routes.auth import auth_bp
     app.register_blueprint(auth_bp)
-    
     app.register_blueprint(api_bp, url_prefix='/api')
     app.register_blueprint(dashboard_bp)
 
+    # Static assets: hashed, pre-compressed build (dist/manifest.json) behind asset_url()
+    from app.services.assets import Assets
+    app.extensions['assets'] = Assets(app.static_folder)
+    app.add_template_global(app.extensions['assets'].url, 'asset_url')
+    app.add_template_global(app.extensions['assets'].exists, 'asset_exists')
+    app.view_functions['static'] = app.extensions['assets'].serve
+
+    # Partitioned deployment (no-op unless PARTITION_NODES is set)
+    from app.services.partitioning import Partitioning
+    app.extensions['partitioning'] = Partitioning.from_config(app.config)
+
+    # In-memory fleet read model (per process)
+    from app.services.fleet import FleetModel
+    FleetModel.reset(sync_interval=app.config['FLEET_SYNC_INTERVAL'])
+
+    # Template fragment cache (feeder cards, tank dropdowns, recent logs)
+    from app.services.fragments import FragmentCache
+    app.extensions['fragments'] = FragmentCache(app.config['FRAGMENT_CACHE_SIZE'])
+
+    # Group-commit writer for feed event logs
+    from app.services.log_writer import LogWriter
+    app.extensions['log_writer'] = LogWriter(
+        app,
+        max_queue=app.config['LOG_QUEUE_SIZE'],
+        batch_size=app.config['LOG_BATCH_SIZE'],
+        flush_interval=app.config['LOG_FLUSH_INTERVAL'],
+        enabled=app.config['LOG_WRITER_ASYNC'],
+        max_retries=app.config['LOG_WRITE_RETRIES'],
+        retry_backoff=app.config['LOG_RETRY_BACKOFF'],
+    )
+
+    # Firmware OTA artifact store, rollout and download slots
+    from app.services.firmware import FirmwareStore
+    app.extensions['firmware'] = FirmwareStore(
+        app.config['FIRMWARE_DIR'] or os.path.join(app.instance_path, 'firmware'),
+        app.config['SECRET_KEY'],
+        max_downloads=app.config['FIRMWARE_MAX_DOWNLOADS'],
+        url_ttl=app.config['FIRMWARE_URL_TTL'],
+    )
+
+    # Command queue, ack deadlines and water valve timeouts (shared table, one scanning worker)
+    from app.services.deadlines import Deadlines
+    Deadlines.configure(
+        app,
+        tick=app.config['DEADLINE_TICK_S'],
+        command_timeout=app.config['COMMAND_ACK_TIMEOUT_S'],
+        valve_grace=app.config['WATER_VALVE_GRACE_S'],
+        valve_max_open=app.config['WATER_VALVE_MAX_OPEN_S'],
+        use_thread=app.config['DEADLINE_THREAD'],
+    )
+
+    # Command round-trip tracing (read from the shared command_deadlines rows)
+    from app.services.command_trace import CommandTrace
+    CommandTrace.configure(samples=app.config['COMMAND_TRACE_SAMPLES'])
+
+    # Device API admission control (shared across workers)
+    if app.config['ADMISSION_ENABLED']:
+        from app.services.admission import AdmissionControl
+        app.extensions['admission'] = AdmissionControl(
+            os.path.join(app.instance_path, 'admission.shm'),
+            rate=app.config['ADMISSION_RATE'],
+            burst=app.config['ADMISSION_BURST'],
+            max_inflight=app.config['ADMISSION_MAX_INFLIGHT'],
+            low_share=app.config['ADMISSION_HEARTBEAT_SHARE'],
+            max_queue_ms=app.config['ADMISSION_MAX_QUEUE_MS'],
+        )
+
+    # Opt-in per-request SQL profiling (N+1 suspects, slow queries, /debug/sql)
+    if app.config['SQL_PROFILE']:
+        from app.services.sql_profiler import SQLProfiler
+        with app.app_context():
+            app.extensions['sql_profiler'] = SQLProfiler(
+                app, db.engine,
+                slow_ms=app.config['SQL_SLOW_MS'],
+                repeat_threshold=app.config['SQL_NPLUSONE_THRESHOLD'],
+                history=app.config['SQL_PROFILE_HISTORY'],
+            )
+
+    # SQLite WAL and online backups (scheduled, pre-migration, CLI)
+    from app.services import backup
+    with app.app_context():
+        db_path = backup.sqlite_path(db.engine)
+    snapshot_dir = backup.backup_dir(app) if db_path and app.config['BACKUP_BEFORE_MIGRATE'] else None
+    if db_path and app.config['SQLITE_WAL']:
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        try:
+            backup.enable_wal(db_path)
+        except Exception as e:
+            app.logger.warning("Could not enable WAL on %s: %s", db_path, e)
+    if db_path:
+        app.extensions['backups'] = backup.BackupScheduler(
+            db_path, backup.backup_dir(app),
+            interval=app.config['BACKUP_INTERVAL_S'],
+            keep=app.config['BACKUP_KEEP'],
+            step_pages=app.config['BACKUP_STEP_PAGES'],
+            sleep=app.config['BACKUP_STEP_SLEEP'],
+            max_restarts=app.config['BACKUP_MAX_RESTARTS'],
+        )
+
+    # CLI: `flask --app main seed` / `flask --app main migrate` / `flask --app main provision`
+    #      `flask --app main backup` / `flask --app main restore` / `flask --app main verify-dispense`
+    #      `flask --app main assets`
+    @app.cli.command('seed')
+    def seed_command():
+        """Create the default tanks and admin users."""
+        from app.services.seed import seed_defaults
+        seed_defaults()
+
+    @app.cli.command('migrate')
+    def migrate_command():
+        """Apply pending schema migrations."""
+        from app.services.migrations import upgrade
+        applied = upgrade(db.engine, snapshot_dir)
+        print(f"Applied migrations: {applied}" if applied else "Schema already up to date.")
+
+    @app.cli.command('provision')
+    @click.argument('manifest', type=click.File('r', encoding='utf-8'))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'json']), default='csv')
+    @click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-',
+                  help='Credential sheet destination (default: stdout).')
+    def provision_command(manifest, fmt, output):
+        """Create the tanks and feeders of a JSON manifest and print their credentials."""
+        import json
+        from app.services.provisioning import ProvisioningError, provision, sheet_csv, sheet_json
+        try:
+            sheet = provision(json.load(manifest), app.extensions['partitioning'])
+        except (ProvisioningError, ValueError) as e:
+            for error in getattr(e, 'errors', [str(e)]):
+                click.echo(error, err=True)
+            raise SystemExit(1)
+        output.write(sheet_csv(sheet) if fmt == 'csv' else sheet_json(sheet) + '\n')
+        click.echo(f"Provisioned {len(sheet)} devices.", err=True)
+
+    @app.cli.command('backup')
+    def backup_command():
+        """Take an online backup of the SQLite database now."""
+        if not db_path:
+            raise click.ClickException("Backups are only supported for file-backed SQLite databases.")
+        scheduler = app.extensions['backups']
+        stats = backup.snapshot(db_path, scheduler.directory, 'manual', **scheduler.copy_options)
+        click.echo(f"{stats['path']} ({stats['bytes']} bytes in {stats['seconds']} s, "
+                   f"{stats['steps']} steps, {stats['restarts']} restarts)")
+
+    @app.cli.command('restore')
+    @click.argument('backup_file', required=False)
+    @click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+    def restore_command(backup_file, yes):
+        """Restore the database from a backup (lists the backups without an argument)."""
+        if not db_path:
+            raise click.ClickException("Backups are only supported for file-backed SQLite databases.")
+        directory = app.extensions['backups'].directory
+        if not backup_file:
+            for item in backup.list_backups(directory):
+                click.echo(f"{item['name']:<48} {item['bytes']:>12} bytes")
+            return
+        path = backup_file if os.path.sep in backup_file else os.path.join(directory, backup_file)
+        if not yes:
+            click.confirm(f"Replace {db_path} with {path}?", abort=True)
+        try:
+            stats = backup.restore(path, db_path, directory)
+        except backup.BackupError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Restored {path} in {stats['seconds']} s; previous database saved as {stats['previous']}.")
+        click.echo("Restart the service (systemctl restart biofeed) so workers drop their cached state.")
+
+    @app.cli.command('verify-dispense')
+    def verify_dispense_command():
+        """Check the recent feed/refill events against the drawer scale now."""
+        verifier = app.extensions.get('dispense_check')
+        if verifier is None:
+            raise click.ClickException("Dispense verification needs HISTORY_ENABLED=1.")
+        result = verifier.run_once()
+        if result is None:
+            click.echo("Nothing to check (up to date, or another worker is running it).")
+            return
+        click.echo(f"{result['bursts']} dispenses: {result['verified']} verified, {result['failed']} failed, "
+                   f"{result['skipped']} skipped, {result['unverifiable']} without readings; "
+                   f"{result['tripped']} feeders tripped ({result['seconds']} s)")
+        for failure in result['failures']:
+            click.echo(f"  feeder {failure['feeder_id']}: {'refill' if failure['refill'] else 'feed'} "
+                       f"{failure['before']} g -> {failure['after']} g")
+
+    @app.cli.command('assets')
+    @click.option('--fetch', is_flag=True, help='Download the vendored front-end libraries that are missing.')
+    @click.option('--force', is_flag=True, help='With --fetch, download them again.')
+    @click.option('--css', is_flag=True, help='Compile the Tailwind CSS (css/app.css) with the pinned CLI (Node.js).')
+    def assets_command(fetch, force, css):
+        """Build the hashed, pre-compressed static files (app/static/dist)."""
+        import subprocess
+        from app.services import assets
+        if fetch:
+            try:
+                fetched = assets.fetch_vendor(app.static_folder, force=force)
+            except (OSError, assets.VendorError) as e:
+                raise click.ClickException(f"Could not download the vendored libraries: {e}")
+            click.echo(f"Fetched {len(fetched)} vendored files." if fetched else "Vendored files up to date.")
+        if css:
+            try:
+                click.echo(f"Compiled {assets.build_css(app.root_path, app.static_folder)}")
+            except (OSError, subprocess.CalledProcessError) as e:
+                raise click.ClickException(f"Could not compile the Tailwind CSS: {e}")
+        missing = [name for name in assets.VENDOR if not os.path.exists(os.path.join(app.static_folder, name))]
+        if missing:
+            click.echo(f"Not vendored (pages load them from the CDN): {', '.join(missing)}", err=True)
+        if not os.path.exists(os.path.join(app.static_folder, assets.TAILWIND_OUTPUT)):
+            click.echo("No css/app.css (pages compile Tailwind in the browser): run with --css", err=True)
+        stats = assets.build(app.static_folder)
+        click.echo(f"{stats['files']} files ({stats['bytes']} bytes): gzip {stats['gz']} bytes, "
+                   f"brotli {stats['br'] if stats['brotli'] else 'unavailable (pip install brotli)'}; "
+                   f"{stats['written']} written, {stats['pruned']} stale removed.")
+
+    # Schema check: one version lookup per boot; seeding lives in the CLI
+    from app.services.migrations import ensure_schema
     with app.app_context():
-        db.create_all()
-        
-        # Initialize default tanks if none exist
-        from app.models.tank import Tank
-        if not Tank.query.first():
-            db.session.add(Tank(name="Tanque de Ração Principal", type="food", capacity="5kg"))
-            db.session.add(Tank(name="Bebedouro Principal", type="water", capacity="3L"))
-            db.session.commit()
-            print("Default tanks created.")
-
-        # Initialize Default Admin
-        if not User.query.filter_by(username='admin').first():
-            admin = User(username='admin', is_admin=True)
-            admin.set_password('admin123') # Default password
-            db.session.add(admin)
-            db.session.commit()
-            print("Default admin created (admin/admin123).")
-
-        # Initialize Daniel User
-        if not User.query.filter_by(username='Daniel').first():
-            daniel = User(username='Daniel', is_admin=True)
-            daniel.set_password('codeez4ever')
-            db.session.add(daniel)
-            db.session.commit()
-            print("User Daniel created.")
+        ensure_schema(db.engine, auto_upgrade=app.config['AUTO_MIGRATE'], snapshot_dir=snapshot_dir)
+
+    # Append-only journal of feeder state transitions
+    from app.services import journal
+    if app.config['JOURNAL_ENABLED']:
+        os.makedirs(app.instance_path, exist_ok=True)
+        journal.configure(app.config['JOURNAL_DIR'] or os.path.join(app.instance_path, 'journal'),
+                          segment_bytes=app.config['JOURNAL_SEGMENT_BYTES'])
+        with app.app_context():
+            journal.start_from_database()
+    else:
+        journal.configure(None)
+
+    # Per-device reading history (charts)
+    from app.services import history
+    history_dir = app.config['HISTORY_DIR'] or os.path.join(app.instance_path, 'history')
+    if app.config['HISTORY_ENABLED']:
+        history.configure(history_dir, cache_tiles=app.config['HISTORY_CACHE_TILES'],
+                          retention_days=app.config['HISTORY_RETENTION_DAYS'])
+    else:
+        history.configure(None)
+
+    # Batch check of feed/refill events against the drawer scale (one worker per run)
+    if app.config['HISTORY_ENABLED']:
+        from app.services.dispense_check import DispenseVerifier
+        app.extensions['dispense_check'] = DispenseVerifier(
+            app, os.path.join(history_dir, 'dispense_check.json'),
+            interval=app.config['DISPENSE_VERIFY_INTERVAL_S'],
+            window=app.config['DISPENSE_VERIFY_WINDOW_S'],
+            merge_s=app.config['DISPENSE_MERGE_S'],
+            min_delta=app.config['DISPENSE_MIN_DELTA_G'],
+            lookback=app.config['DISPENSE_VERIFY_LOOKBACK_S'],
+        )
+
+    @app.before_request
+    def start_background_threads():
+        # First request: the threads belong to the serving worker, never to the CLI
+        # (migrate, restore, backup), a benchmark that only builds the app, or a pre-fork master
+        Deadlines.ensure_started()
+        if 'backups' in app.extensions:
+            app.extensions['backups'].start()
+        if 'dispense_check' in app.extensions and app.config['DISPENSE_VERIFY_THREAD']:
+            app.extensions['dispense_check'].start()
+
+    app.config['STARTUP_MS'] = (time.perf_counter() - started) * 1000
+    app.logger.info("App created in %.1f ms", app.config['STARTUP_MS'])
 
     return app
 
-app = create_app()
+_app = None
+
+def __getattr__(name):
+    # Lazy `main.app`: gunicorn's `main:app` builds the app on first access,
+    # while plain imports (CLI, scripts, benchmarks) skip it entirely.
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        from app.services.seed import seed_defaults
+        seed_defaults()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,183 @@
+"""Partition router for the scale-out deployment mode.
+
+Forwards device and per-device dashboard traffic to the partition that owns
+the device (see app/services/partitioning.py), sends creation requests to the
+partition their block (or name) is placed on, splits provisioning manifests
+across partitions and serves merged fleet views. Everything else goes to the
+first partition, whose dashboard views (feeders, tanks, logs, exports) fan out.
+
+    PARTITION_NODES="p0=http://127.0.0.1:8101,p1=http://127.0.0.1:8102" python router.py
+    gunicorn --workers 2 --bind 0.0.0.0:8001 router:app
+"""
+from flask import Flask, Response, request, jsonify
+import requests
+from config import Config
+from app.services.partitioning import Partitioning, placement_key
+from app.services.provisioning import ProvisioningError, sheet_csv, split_manifest
+
+HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-encoding',
+               'content-length', 'host', 'upgrade', 'te', 'trailer'}
+
+app = Flask(__name__)
+app.config.from_object(Config)
+partitioning = Partitioning.from_config(app.config)
+session = requests.Session()
+
+
+def _headers():
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_HEADERS}
+    headers['X-Forwarded-Host'] = request.host
+    return headers
+
+
+def forward(node):
+    url = partitioning.urls[node] + request.full_path.rstrip('?')
+    headers = _headers()
+    try:
+        upstream = session.request(request.method, url, headers=headers, data=request.get_data(),
+                                   allow_redirects=False, timeout=10)
+    except requests.RequestException as e:
+        resp = jsonify({'error': f'Partition {node} unavailable', 'detail': str(e)})
+        resp.status_code = 502
+        resp.headers['Retry-After'] = '5'
+        return resp
+
+    response_headers = [(k, v) for k, v in upstream.raw.headers.items() if k.lower() not in HOP_HEADERS]
+    response_headers.append(('X-Partition', node))
+    return Response(upstream.content, upstream.status_code, response_headers)
+
+
+def forward_by_id(device_id):
+    node = partitioning.node_for_id(device_id)
+    if node is None:
+        return jsonify({'error': 'Unknown device partition'}), 404
+    return forward(node)
+
+
+def _post(node, path, payload):
+    headers = {k: v for k, v in _headers().items() if k.lower() != 'content-type'}
+    try:
+        return session.post(partitioning.urls[node] + path, json=payload, headers=headers,
+                            allow_redirects=False, timeout=60)
+    except requests.RequestException as e:
+        print(f"Partition {node} unavailable: {e}")
+        return None
+
+
+def _errors(node, resp):
+    if resp is None:
+        return [f"{node}: unavailable"]
+    try:
+        body = resp.json()
+    except ValueError:
+        body = {}
+    return [f"{node}: {e}" for e in body.get('errors') or [body.get('error') or f'HTTP {resp.status_code}']]
+
+
+@app.route('/api/feeder/register', methods=['POST'])
+def register():
+    data = request.get_json(silent=True) or {}
+    return forward(partitioning.node_for_key(placement_key(data.get('block_name'), data.get('name'))))
+
+
+@app.route('/register', methods=['POST'])
+def register_page():
+    # Dashboard form: the feeder goes where its tanks are, else by name.
+    # get_data() first so the form parse leaves the body cached for forward()
+    request.get_data()
+    for field in ('food_tank_id', 'water_tank_id'):
+        tank_id = request.form.get(field, type=int)
+        if tank_id is not None and partitioning.node_for_id(tank_id):
+            return forward(partitioning.node_for_id(tank_id))
+    return forward(partitioning.node_for_key(placement_key(name=request.form.get('name'))))
+
+
+@app.route('/tanks/create', methods=['POST'])
+def create_tank():
+    request.get_data()
+    return forward(partitioning.node_for_key(placement_key(name=request.form.get('name'))))
+
+
+@app.route('/api/provision', methods=['POST'])
+def provision():
+    try:
+        parts = split_manifest(request.get_json(silent=True), partitioning)
+    except ProvisioningError as e:
+        return jsonify({'error': 'Invalid manifest', 'errors': e.errors}), 400
+    if parts is None or len(parts) <= 1:
+        # Malformed (the node reports it) or owned by a single partition
+        return forward(next(iter(parts or {}), partitioning.names[0]))
+
+    # Every part is validated before any is created, so a bad manifest creates nothing
+    errors = []
+    for node, part in parts.items():
+        resp = _post(node, '/api/provision?dry_run=1', part)
+        if resp is None or resp.status_code != 200:
+            errors += _errors(node, resp)
+    if errors:
+        return jsonify({'error': 'Invalid manifest', 'errors': errors}), 400
+
+    sheet, created = [], []
+    for node, part in parts.items():
+        resp = _post(node, '/api/provision', part)
+        if resp is None or resp.status_code != 201:
+            # Earlier parts are committed: report them so their credentials are not lost
+            return jsonify({'error': f'Provisioning failed on partition {node}', 'errors': _errors(node, resp),
+                            'created_on': created, 'devices': sheet}), 502
+        sheet += resp.json()['devices']
+        created.append(node)
+
+    if request.args.get('format') == 'csv':
+        return Response(sheet_csv(sheet), mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=credentials.csv'})
+    return jsonify({'devices': sheet}), 201
+
+
+@app.route('/tanks/<int:id>/<path:rest>', methods=['GET', 'POST'])
+def tank_pages(id, rest):
+    return forward_by_id(id)
+
+
+@app.route('/api/feeder/<int:id>/<path:rest>', methods=['GET', 'POST'])
+@app.route('/api/tank/<int:id>/<path:rest>', methods=['GET', 'POST'])
+def device_api(id, rest):
+    return forward_by_id(id)
+
+
+@app.route('/feeder/<int:id>', methods=['GET', 'POST'])
+@app.route('/feeder/<int:id>/<path:rest>', methods=['GET', 'POST'])
+def feeder_pages(id, rest=None):
+    return forward_by_id(id)
+
+
+@app.route('/api/identify', methods=['GET'])
+def identify():
+    # Tokens are unique per partition: ask every node, the owner answers 200
+    for node in partitioning.names:
+        resp = forward(node)
+        if resp.status_code == 200:
+            return resp
+    return jsonify({'error': 'Device not found'}), 404
+
+
+@app.route('/api/fleet/feeders', methods=['GET'])
+def fleet_feeders():
+    results = partitioning.fan_out('/api/partition/feeders')
+    feeders = []
+    for payload in results.values():
+        feeders.extend((payload or {}).get('feeders', []))
+    feeders.sort(key=lambda f: f['id'])
+    return jsonify({
+        'feeders': feeders,
+        'partitions': {name: payload is not None for name, payload in results.items()}
+    })
+
+
+@app.route('/', defaults={'path': ''}, methods=['GET', 'POST'])
+@app.route('/<path:path>', methods=['GET', 'POST'])
+def primary(path):
+    return forward(partitioning.names[0])
+
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=8001)
@@ -3,31 +3,47 @@ import requests
 import threading
 import time
 import uuid
+import os
 from datetime import datetime
-    self.feeder_id = feeder_id # Real DB ID (Feeder ID or Tank ID)
-    self.token = token
-    self.device_type = device_type # 'feeder', 'food_tank', 'water_tank'
-    self.connected = False
-    self.last_log = "Initialized"
+
+app = Flask(__name__)
+app.secret_key = os.environ.get('SIMULATOR_SECRET', 'simulator-secret')
+
+MAIN_API_URL = os.environ.get('MAIN_API_URL', 'http://localhost:5000/api')
+HEARTBEAT_SECONDS = 5  # until the server sends next_report_s
+
+DEVICES = {}  # simulator id -> SimulatedDevice
+
+
+class SimulatedDevice:
+    def __init__(self, name, feeder_id, token, device_type='feeder'):
+        self.id = uuid.uuid4().hex[:8]
+        self.name = name
+        self.feeder_id = feeder_id # Real DB ID (Feeder ID or Tank ID)
+        self.token = token
+        self.device_type = device_type # 'feeder', 'food_tank', 'water_tank'
+        self.connected = False
+        self.last_log = "Initialized"
     
-    # Sensors (Feeder)
-    self.battery_level = 100
-    self.drawer_weight = 0.0
+        # Sensors (Feeder)
+        self.battery_level = 100
+        self.drawer_weight = 0.0
     
-    # Sensors (Tank)
-    self.tank_level = 100 # %
-    self.tank_weight = 5.0 # kg (for food tank)
+        # Sensors (Tank)
+        self.tank_level = 100 # %
+        self.tank_weight = 5.0 # kg (for food tank)
     
-    # Internal State
-    self.is_feeding = False
-    self.is_refilling = False
-    self.door_state = 'CLOSED' 
+        # Internal State
+        self.is_feeding = False
+        self.is_refilling = False
+        self.door_state = 'CLOSED' 
+        self.next_report = HEARTBEAT_SECONDS
     
-    # Thread control
-    self.active = True
-    self.thread = threading.Thread(target=self.run_loop)
-    self.thread.daemon = True
-    self.thread.start()
+        # Thread control
+        self.active = True
+        self.thread = threading.Thread(target=self.run_loop)
+        self.thread.daemon = True
+        self.thread.start()
 
     def log(self, message):
         timestamp = datetime.now().strftime("%H:%M:%S")
@@ -45,7 +61,7 @@ from datetime import datetime
                 except Exception as e:
                     self.connected = False
                     self.log(f"Connection Error: {e}")
-            time.sleep(5) 
+            time.sleep(self.next_report)
 
     def send_tank_heartbeat(self):
         # /api/tank/<id>/status
@@ -99,9 +115,14 @@ from datetime import datetime
                 
                 # Check for commands in response
                 data = response.json()
+                self.next_report = data.get('next_report_s', HEARTBEAT_SECONDS)
                 if 'commands' in data and data['commands']:
                     for cmd in data['commands']:
                         self.handle_command(cmd)
+            elif response.status_code in (429, 503):
+                # Load shedding: retry when told to
+                self.next_report = int(response.headers.get('Retry-After', HEARTBEAT_SECONDS))
+                self.log(f"Server busy ({response.status_code}), retrying in {self.next_report}s")
             else:
                 self.connected = False
                 self.log(f"API Error: {response.status_code} - {response.text}")
@@ -113,13 +134,16 @@ from datetime import datetime
         self.log(f"Received Command: {cmd['type']}")
         
         if cmd['type'] == 'feed':
-            self.simulate_feed(cmd.get('duration', 1000))
-        elif cmd['type'] == 'refill':
-            self.simulate_refill(cmd.get('duration', 1000))
+            self.simulate_feed(cmd.get('duration', 1000), cmd.get('id'))
+        elif cmd['type'] in ('refill', 'smart_refill'):
+            self.simulate_refill(cmd.get('duration', 1000), cmd.get('id'))
         elif cmd['type'] == 'water_refill':
-            self.simulate_water_refill(cmd.get('duration', 5000))
+            self.simulate_water_refill(cmd.get('duration', 5000), cmd.get('id'))
+        else:
+            # water_control etc.: acknowledged on receipt, like the ESP32
+            self.ack_command(cmd['type'], 'executed', cmd.get('id'))
 
-    def simulate_feed(self, duration):
+    def simulate_feed(self, duration, cmd_id=None):
         def _feed():
             self.is_feeding = True
             self.door_state = 'OPEN'
@@ -131,11 +155,11 @@ from datetime import datetime
             self.log("Feeding Done (Door Closed)")
             
             # Acknowledge command
-            self.ack_command('feed', 'executed')
+            self.ack_command('feed', 'executed', cmd_id)
             
         threading.Thread(target=_feed).start()
 
-    def simulate_refill(self, duration):
+    def simulate_refill(self, duration, cmd_id=None):
         def _refill():
             self.is_refilling = True
             self.log("Refilling Drawer...")
@@ -148,26 +172,26 @@ from datetime import datetime
             self.is_refilling = False
             self.log("Refill Done")
             
-            self.ack_command('refill', 'executed')
+            self.ack_command('refill', 'executed', cmd_id)
             
         threading.Thread(target=_refill).start()
 
-    def simulate_water_refill(self, duration):
+    def simulate_water_refill(self, duration, cmd_id=None):
         def _water_refill():
             self.log("Refilling Water...")
             time.sleep(duration / 1000.0)
             # Same here, Main Tank level is separate.
             self.log("Water Refill Done")
             
-            self.ack_command('water_refill', 'executed')
+            self.ack_command('water_refill', 'executed', cmd_id)
             
         threading.Thread(target=_water_refill).start()
 
-    def ack_command(self, cmd_type, status):
-        # /api/feeder/<id>/ack
+    def ack_command(self, cmd_type, status, cmd_id=None):
+        # /api/feeder/<id>/ack (the id disarms the server's ack deadline)
         url = f"{MAIN_API_URL}/feeder/{self.feeder_id}/ack"
         headers = {'Authorization': f'Bearer {self.token}'}
-        payload = {'command_id': 'sim-cmd', 'status': status} # Mock ID
+        payload = {'command_id': cmd_id, 'status': status}
         try:
             requests.post(url, json=payload, headers=headers, timeout=2)
         except:
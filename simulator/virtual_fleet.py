@@ -0,0 +1,342 @@
+"""Time-accelerated, deterministic fleet simulation against the real app.
+
+Drives create_app() through its test client with a seeded population of
+feeders and block tanks, on a virtual clock (app.services.clock.Clock). Events
+run from a heap, so idle time costs nothing: days of heartbeats, drawer
+consumption, LSLL smart refills, block interlock escalations and water
+auto-open cycles replay in seconds.
+
+The same seed always produces the same trace (JSON lines: commands received and
+feeder_status transitions, stamped with virtual seconds), so two runs or two
+branches can be compared with `diff` or by the printed digest.
+
+With --adaptive, feeders follow the server-chosen `next_report_s` from each
+status response instead of the fixed --heartbeat interval.
+
+    python simulator/virtual_fleet.py --feeders 12 --days 2 --seed 1 --trace trace.jsonl
+    python simulator/virtual_fleet.py --feeders 12 --days 1 --heartbeat 5 --adaptive
+"""
+import argparse
+import hashlib
+import heapq
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[0] = ROOT  # instead of simulator/, whose app.py would shadow the app package
+
+START_EPOCH = 1767225600.0  # 2026-01-01 00:00 UTC: fixed so traces are reproducible
+BLOCK_SIZE = 4
+DRAWER_MAX_G = 500.0
+BOWL_MAX_ML = 1000.0
+BOWL_LOW_ML = 150.0
+VALVE_FLOW_ML_S = 50.0
+FOOD_TANK_KG = 40.0
+WATER_TANK_L = 60.0
+TANK_SERVICE_HOUR = 8  # operator refills empty block tanks once a day
+
+
+class VirtualClock:
+    def __init__(self, start):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+class SimTank:
+    """Block food (kg) or water (L) tank; reports weight and level like the tank ESP."""
+
+    def __init__(self, tank_id, token, kind, block, capacity):
+        self.id = tank_id
+        self.token = token
+        self.kind = kind
+        self.block = block
+        self.capacity = capacity
+        self.amount = capacity
+
+    @property
+    def level(self):
+        return int(round(100 * self.amount / self.capacity))
+
+    def draw(self, wanted):
+        taken = min(self.amount, wanted)
+        self.amount -= taken
+        return taken
+
+
+class SimFeeder:
+    """One feeder: drawer scale with noise, animals eating/drinking, valve and gates."""
+
+    def __init__(self, feeder_id, token, rng, food_tank, water_tank):
+        self.id = feeder_id
+        self.token = token
+        self.rng = rng
+        self.food_tank = food_tank
+        self.water_tank = water_tank
+        self.appetite_g_day = rng.uniform(250, 450)
+        self.thirst_ml_day = rng.uniform(800, 1400)
+        self.drawer = rng.uniform(150, 210)
+        self.bowl = rng.uniform(400, BOWL_MAX_ML)
+        self.valve_until = None
+        self.status = None
+        self.jammed = False
+
+    def advance(self, now, dt):
+        # Animals eat mostly during the day (06-18 h)
+        hour = (now // 3600) % 24
+        factor = 1.6 if 6 <= hour < 18 else 0.4
+        self.drawer = max(0.0, self.drawer - self.appetite_g_day * factor * dt / 86400 * self.rng.uniform(0.5, 1.5))
+        self.bowl = max(0.0, self.bowl - self.thirst_ml_day * factor * dt / 86400)
+        if self.valve_until is not None:
+            open_s = min(dt, max(0.0, self.valve_until - (now - dt)))
+            wanted = min(BOWL_MAX_ML - self.bowl, VALVE_FLOW_ML_S * open_s)
+            self.bowl += self.water_tank.draw(wanted / 1000.0) * 1000.0 if self.water_tank else wanted
+            if now >= self.valve_until:
+                self.valve_until = None
+
+    def reading(self):
+        noise = self.rng.gauss(0, 1.0)
+        if self.rng.random() < 0.01:
+            noise += 30.0  # vibration spike
+        return round(max(0.0, self.drawer + noise), 1)
+
+    def handle(self, command, now):
+        kind = command.get('type')
+        if self.jammed and kind in ('smart_refill', 'feed', 'refill'):
+            return  # gate stuck: acks "executed" but nothing moves
+        if kind == 'smart_refill':
+            wanted_g = max(0.0, command.get('target_weight', 210.0) - self.drawer)
+            self.drawer += self.food_tank.draw(wanted_g / 1000.0) * 1000.0 if self.food_tank else wanted_g
+        elif kind == 'feed':
+            self.drawer = max(0.0, self.drawer - 50.0)
+        elif kind == 'refill':
+            self.drawer = min(DRAWER_MAX_G, self.drawer + 210.0)
+        elif kind == 'water_control':
+            if command.get('action') == 'OPEN':
+                self.valve_until = now + (command.get('duration') or 10000) / 1000.0
+            else:
+                self.valve_until = None
+
+
+class Simulation:
+    def __init__(self, app, clock, feeders, seed, heartbeat, tank_interval, adaptive=False, jammed=0):
+        self.app = app
+        self.client = app.test_client()
+        self.clock = clock
+        self.rng = random.Random(seed)
+        self.heartbeat = heartbeat
+        self.adaptive = adaptive
+        self.tank_interval = tank_interval
+        self.events = []
+        self.sequence = 0
+        self.trace = []
+        self.requests = {}
+        self.commands = {}
+        self.feeders = []
+        self.tanks = []
+        self._provision(feeders)
+        for feeder in self.feeders[:jammed]:
+            feeder.jammed = True
+
+    # --- Setup ---
+
+    def _provision(self, count):
+        from database import db
+        from app.models.feeder import Feeder
+        from app.models.tank import Tank
+        from app.services.fleet import commit_devices
+
+        partitioning = self.app.extensions['partitioning']
+        with self.app.app_context():
+            blocks = {}
+            for index in range((count + BLOCK_SIZE - 1) // BLOCK_SIZE):
+                block = f"Bloco {chr(ord('A') + index % 26)}{index // 26 or ''}"
+                food = Tank(name=f"Ração {block}", type='food', capacity=f"{FOOD_TANK_KG:g}kg",
+                            max_weight=FOOD_TANK_KG, current_weight=FOOD_TANK_KG, block_name=block)
+                water = Tank(name=f"Água {block}", type='water', capacity=f"{WATER_TANK_L:g}L",
+                             max_weight=WATER_TANK_L, current_weight=WATER_TANK_L, block_name=block)
+                for tank in (food, water):
+                    partitioning.assign_id(tank)
+                    db.session.add(tank)
+                commit_devices(food, water)
+                blocks[block] = (SimTank(food.id, food.token, 'food', block, FOOD_TANK_KG),
+                                 SimTank(water.id, water.token, 'water', block, WATER_TANK_L))
+                self.tanks.extend(blocks[block])
+
+            names = sorted(blocks)
+            for index in range(count):
+                block = names[index // BLOCK_SIZE]
+                food, water = blocks[block]
+                data = self._post('register', '/api/feeder/register',
+                                  {'name': f"Sim {index + 1:03d}", 'block_name': block}).get_json()
+                feeder = db.session.get(Feeder, data['id'])
+                feeder.food_tank_id, feeder.water_tank_id = food.id, water.id
+                commit_devices(feeder)
+                rng = random.Random(self.rng.random())
+                self.feeders.append(SimFeeder(data['id'], data['token'], rng, food, water))
+
+        # Stagger first heartbeats like devices booting at different times
+        for feeder in self.feeders:
+            self._schedule(self.rng.uniform(0, self.heartbeat), 'heartbeat', feeder)
+        for tank in self.tanks:
+            self._schedule(self.rng.uniform(0, self.tank_interval), 'tank', tank)
+        self._schedule(self._next_service(START_EPOCH) - START_EPOCH, 'service', None)
+        verifier = self.app.extensions.get('dispense_check')
+        if verifier is not None and verifier.interval > 0:
+            self._schedule(verifier.interval, 'verify', verifier)
+
+    def _next_service(self, now):
+        day = now - now % 86400
+        service = day + TANK_SERVICE_HOUR * 3600
+        return service if service > now else service + 86400
+
+    # --- Event loop ---
+
+    def _schedule(self, delay, kind, target):
+        self.sequence += 1
+        heapq.heappush(self.events, (self.clock.now + delay, self.sequence, kind, target))
+
+    def _post(self, route, url, payload, token=None):
+        self.requests[route] = self.requests.get(route, 0) + 1
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        return self.client.post(url, json=payload, headers=headers)
+
+    def _record(self, **entry):
+        entry['t'] = round(self.clock.now - START_EPOCH, 3)
+        self.trace.append(entry)
+
+    def run(self, seconds):
+        from app.services.deadlines import Deadlines
+        end = START_EPOCH + seconds
+        last = {id(f): START_EPOCH for f in self.feeders}
+        scanned = START_EPOCH
+        while self.events and self.events[0][0] <= end:
+            at, _, kind, target = heapq.heappop(self.events)
+            self.clock.now = at
+            if at - scanned >= Deadlines.tick:  # like the scanner thread: once per tick
+                Deadlines.advance(at)
+                scanned = at
+            if kind == 'heartbeat':
+                target.advance(at, at - last[id(target)])
+                last[id(target)] = at
+                self._schedule(self._heartbeat(target) or self.heartbeat, 'heartbeat', target)
+            elif kind == 'tank':
+                self._post('tank_status', f'/api/tank/{target.id}/status',
+                           {'level': target.level, 'weight': round(target.amount, 2)}, target.token)
+                self._schedule(self.tank_interval, 'tank', target)
+            elif kind == 'service':
+                for tank in self.tanks:
+                    if tank.level < 25:
+                        tank.amount = tank.capacity
+                        self._record(device=f"tank:{tank.id}", event='tank_refilled', kind=tank.kind)
+                self._schedule(86400, 'service', None)
+            elif kind == 'verify':
+                result = target.run_once()
+                if result and result['failed']:
+                    self._record(device='server', event='dispense_check', failed=result['failed'],
+                                 feeders=sorted({f['feeder_id'] for f in result['failures']}))
+                self._schedule(target.interval, 'verify', target)
+
+    def _heartbeat(self, feeder):
+        """Sends one status report; returns the server-chosen delay when adaptive."""
+        payload = {
+            'battery': max(5, 100 - int((self.clock.now - START_EPOCH) / 21600)),
+            'weight': feeder.reading(),
+            'water_sensor': 'LSLL' if feeder.bowl < BOWL_LOW_ML else 'LSH',
+            'firmware_version': '1.2.0-SIM',
+        }
+        response = self._post('status', f'/api/feeder/{feeder.id}/status', payload, feeder.token)
+        if response.status_code != 200:
+            self._record(device=f"feeder:{feeder.id}", event='http_error', code=response.status_code)
+            return None
+        data = response.get_json()
+        if data.get('feeder_status') != feeder.status:
+            self._record(device=f"feeder:{feeder.id}", event='status', previous=feeder.status,
+                         status=data.get('feeder_status'), weight=payload['weight'])
+            feeder.status = data.get('feeder_status')
+        for command in data.get('commands', []):
+            self.commands[command.get('type')] = self.commands.get(command.get('type'), 0) + 1
+            # Command ids are random: keep them out of the trace so runs stay comparable
+            self._record(device=f"feeder:{feeder.id}", event='command',
+                         command={k: v for k, v in command.items() if k != 'id'})
+            feeder.handle(command, self.clock.now)
+            # The server logs executed feed/refill commands from the ack itself
+            self._post('ack', f'/api/feeder/{feeder.id}/ack',
+                       {'command_id': command.get('id'), 'status': 'executed'}, feeder.token)
+        return data.get('next_report_s') if self.adaptive else None
+
+    def digest(self):
+        return hashlib.sha256('\n'.join(json.dumps(e, sort_keys=True) for e in self.trace).encode()).hexdigest()[:16]
+
+
+def build_app(tmp):
+    from config import Config
+    from main import create_app
+
+    class SimulationConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'simulation.db')}"
+        JOURNAL_DIR = os.path.join(tmp, 'journal')
+        HISTORY_DIR = os.path.join(tmp, 'history')
+        BACKUP_INTERVAL_S = 0
+        DISPENSE_VERIFY_THREAD = False  # run() schedules the checks on the virtual clock
+        LOG_WRITER_ASYNC = False  # synchronous writes keep runs deterministic
+        ADMISSION_ENABLED = False  # one process, and its shared state would outlive the run
+        DEADLINE_THREAD = False  # deadlines advance with the virtual clock instead
+
+    return create_app(SimulationConfig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--feeders', type=int, default=12)
+    parser.add_argument('--days', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--heartbeat', type=float, default=60.0, help='virtual seconds between feeder heartbeats')
+    parser.add_argument('--adaptive', action='store_true', help='follow the server-chosen next_report_s')
+    parser.add_argument('--tank-interval', type=float, default=300.0, help='virtual seconds between tank reports')
+    parser.add_argument('--trace', help='write the JSON-lines trace to this file')
+    parser.add_argument('--jam', type=int, default=0, help='feeders whose gate is stuck (dispenses do nothing)')
+    args = parser.parse_args()
+
+    import contextlib
+    import io
+    from app.services.clock import Clock
+    from app.services.signal_filters import FilterBank
+
+    tmp = tempfile.mkdtemp()
+    FilterBank.reset()
+    clock = VirtualClock(START_EPOCH)
+    Clock.use(clock)
+    try:
+        # The routes print every escalation/refill decision; the trace records them instead
+        with contextlib.redirect_stdout(io.StringIO()):
+            app = build_app(tmp)
+            sim = Simulation(app, clock, args.feeders, args.seed, args.heartbeat, args.tank_interval,
+                             args.adaptive, args.jam)
+            started = time.perf_counter()
+            sim.run(args.days * 86400)
+            elapsed = time.perf_counter() - started
+    finally:
+        Clock.reset()
+
+    total = sum(sim.requests.values())
+    print(f"Simulated {args.days:g} day(s), {args.feeders} feeders / {len(sim.tanks)} tanks in {elapsed:.1f} s "
+          f"({args.days * 86400 / elapsed:,.0f}x real time)")
+    print(f"Requests: {total:,} ({total / elapsed:,.0f} req/s) " + json.dumps(dict(sorted(sim.requests.items()))))
+    print(f"Commands: {json.dumps(dict(sorted(sim.commands.items())))}")
+    transitions = sum(1 for e in sim.trace if e['event'] == 'status')
+    print(f"Status transitions: {transitions}, trace events: {len(sim.trace)}, digest {sim.digest()}")
+    if args.trace:
+        with open(args.trace, 'w') as f:
+            for entry in sim.trace:
+                f.write(json.dumps(entry, sort_keys=True) + '\n')
+        print(f"Trace written to {args.trace}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+// Tailwind build of the dashboard CSS: flask --app main assets --css (deploy.sh)
+// writes app/static/css/app.css with the classes the templates use.
+// The in-browser fallback in templates/base.html repeats this theme: keep them in step.
+module.exports = {
+    content: ['./app/templates/**/*.html'],
+    darkMode: 'class',
+    theme: {
+        extend: {
+            colors: {
+                slate: {
+                    50: '#f8fafc',
+                    100: '#f1f5f9',
+                    200: '#e2e8f0',
+                    300: '#cbd5e1',
+                    400: '#94a3b8',
+                    500: '#64748b',
+                    600: '#475569',
+                    700: '#334155',
+                    800: '#1e293b',
+                    900: '#0f172a',
+                    950: '#020617'
+                },
+                indigo: { 500: '#6366f1', 600: '#4f46e5', 700: '#4338ca' },
+                emerald: { 500: '#10b981', 900: '#064e3b' },
+                amber: { 500: '#f59e0b', 900: '#78350f' }
+            }
+        }
+    }
+};
@@ -0,0 +1,93 @@
+"""Shared fixtures: an app on a temporary instance, and gunicorn-like workers on the same database.
+
+    python -m pytest tests
+"""
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_app(tmp):
+    from config import Config
+    from main import create_app
+
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmp, 'test.db')}"
+        JOURNAL_DIR = os.path.join(tmp, 'journal')
+        HISTORY_DIR = os.path.join(tmp, 'history')
+        FIRMWARE_DIR = os.path.join(tmp, 'firmware')
+        BACKUP_DIR = os.path.join(tmp, 'backups')
+        BACKUP_INTERVAL_S = 0
+        LOG_WRITER_ASYNC = False
+        ADMISSION_ENABLED = False
+        DEADLINE_THREAD = False
+        DISPENSE_VERIFY_THREAD = False
+    return create_app(TestConfig)
+
+
+def _worker_main(target, tmp, args, start, results):
+    app = make_app(tmp)
+    if start is not None:
+        start.wait(timeout=60)
+    results.put(target(app, *args))
+
+
+class Workers:
+    """Runs target(app, *args) in spawned processes, each with its own app on the shared instance.
+
+    Targets are module-level functions (they are pickled by name) and return a picklable value.
+    """
+
+    def __init__(self, tmp):
+        self.tmp = tmp
+        self.context = multiprocessing.get_context('spawn')
+
+    def run(self, target, *args):
+        return self.run_all(target, [args])[0]
+
+    def run_all(self, target, calls):
+        # All workers build their app first, then start together
+        start, results = self.context.Event(), self.context.Queue()
+        processes = [self.context.Process(target=_worker_main, args=(target, self.tmp, args, start, results))
+                     for args in calls]
+        for process in processes:
+            process.start()
+        start.set()
+        values = [results.get(timeout=60) for _ in processes]
+        for process in processes:
+            process.join(timeout=60)
+            assert process.exitcode == 0
+        return values
+
+
+@pytest.fixture
+def tmp(tmp_path):
+    return str(tmp_path)
+
+
+@pytest.fixture
+def app(tmp):
+    return make_app(tmp)
+
+
+@pytest.fixture
+def workers(tmp):
+    return Workers(tmp)
+
+
+@pytest.fixture
+def admin(app):
+    """A test client logged in as the seeded admin."""
+    from app.services.seed import seed_defaults
+
+    with app.app_context():
+        seed_defaults()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    return client
@@ -0,0 +1,58 @@
+"""Admission control: forged ids cannot drain a device's bucket, and the cap fits the workers.
+
+    python -m pytest tests
+"""
+import os
+
+
+def enable_admission(app, tmp, **options):
+    from app.services.admission import AdmissionControl
+
+    options.setdefault('max_inflight', app.config['ADMISSION_MAX_INFLIGHT'])
+    admission = AdmissionControl(os.path.join(tmp, 'admission.shm'), **options)
+    app.extensions['admission'] = admission
+    return admission
+
+
+def add_feeder(app):
+    from database import db
+    from app.models.feeder import Feeder
+    from app.services.fleet import commit_devices
+
+    with app.app_context():
+        feeder = Feeder(name='Admitted')
+        db.session.add(feeder)
+        commit_devices(feeder)
+        return feeder.id, feeder.token
+
+
+def test_forged_requests_pay_from_their_own_bucket(app, tmp):
+    admission = enable_admission(app, tmp, rate=0.001, burst=2)
+    feeder_id, token = add_feeder(app)
+    client = app.test_client()
+
+    def status(bearer):
+        return client.post(f'/api/feeder/{feeder_id}/status', json={'battery': 90},
+                           headers={'Authorization': f'Bearer {bearer}'}).status_code
+
+    assert [status('forged') for _ in range(3)] == [401, 401, 429]
+    assert [status(token) for _ in range(3)] == [200, 200, 429]
+    assert admission.stats()['rate_limited'] == 2
+
+
+def test_heartbeats_leave_the_last_worker_to_priority_traffic(app, tmp):
+    # The default cap is the gunicorn worker count
+    assert app.config['ADMISSION_MAX_INFLIGHT'] == app.config['WEB_CONCURRENCY'] == 3
+    admission = enable_admission(app, tmp)
+    feeder_id, token = add_feeder(app)
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client()
+
+    # Two other workers are busy: this one is the last
+    with admission._locked():
+        slot = admission._worker_slot()
+        admission._add_inflight(slot, 2)
+    response = client.post(f'/api/feeder/{feeder_id}/status', json={'battery': 90}, headers=headers)
+    assert response.status_code == 503 and response.get_json()['reason'] == 'shed_busy'
+    response = client.post(f'/api/feeder/{feeder_id}/ack', json={'command_id': 'gone'}, headers=headers)
+    assert response.status_code == 200
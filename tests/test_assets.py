@@ -0,0 +1,57 @@
+"""Static assets: hashed build with rewritten CSS urls, manifest lookup, pinned vendor downloads.
+
+    python -m pytest tests
+"""
+import hashlib
+import io
+import os
+
+import pytest
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_build_rewrites_css_urls_and_templates_resolve_hashed_names(app, tmp):
+    from app.services import assets
+
+    static = os.path.join(tmp, 'static')
+    write(os.path.join(static, 'vendor', 'font.woff2'), b'wOF2' * 64)
+    write(os.path.join(static, 'css', 'fonts.css'),
+          b"@font-face { src: url('../vendor/font.woff2') format('woff2'), url('https://cdn.example/font.woff2'); }")
+    stats = assets.build(static)
+    assert stats['files'] == 2
+
+    store = assets.Assets(static)
+    font, css = store.manifest['vendor/font.woff2'], store.manifest['css/fonts.css']
+    assert font == f"dist/{assets.hashed_name('vendor/font.woff2', b'wOF2' * 64)}"
+    with open(os.path.join(static, css), 'rb') as f:
+        built = f.read().decode()
+    assert f"url('../{font[len('dist/'):]}')" in built and 'https://cdn.example/font.woff2' in built
+
+    with app.test_request_context():
+        assert store.url('css/fonts.css') == f'/static/{css}'
+        assert store.url('logo.png') == '/static/logo.png'
+        assert store.exists('css/fonts.css') and not store.exists('css/app.css')
+        # A vendored library that was never fetched comes from its pinned CDN URL
+        assert store.url('vendor/chart.umd.min.js') == assets.VENDOR['vendor/chart.umd.min.js'][0]
+
+
+def test_vendor_downloads_must_match_their_pin(tmp, monkeypatch):
+    from app.services import assets
+
+    body = b'console.log("lucide")'
+    monkeypatch.setattr(assets.urllib.request, 'urlopen', lambda request, timeout: io.BytesIO(body))
+    url = 'https://cdn.example/lucide.min.js'
+    monkeypatch.setattr(assets, 'VENDOR', {'vendor/lucide.min.js': (url, hashlib.sha256(body).hexdigest())})
+    assert assets.fetch_vendor(tmp) == ['vendor/lucide.min.js']
+
+    # Tampered, or never pinned: nothing is written
+    for pin in ('0' * 64, None):
+        monkeypatch.setattr(assets, 'VENDOR', {'vendor/chart.js': (url, pin)})
+        with pytest.raises(assets.VendorError):
+            assets.fetch_vendor(tmp)
+        assert not os.path.exists(os.path.join(tmp, 'vendor', 'chart.js'))
@@ -0,0 +1,44 @@
+"""The backup scheduler belongs to the serving worker, not to every create_app.
+
+    python -m pytest tests
+"""
+import os
+
+
+def test_scheduler_starts_on_first_request_only(app, tmp):
+    scheduler = app.extensions['backups']
+    scheduler.interval = 3600  # the test config disables the schedule
+    assert scheduler.directory == os.path.join(tmp, 'backups')
+
+    # CLI commands, restores and benchmarks build the app without serving
+    app.test_cli_runner().invoke(args=['restore'])
+    assert scheduler._thread is None
+
+    app.test_client().get('/login')
+    assert scheduler._thread is not None and scheduler._thread.is_alive()
+    scheduler.stop()
+
+
+def test_legacy_database_is_snapshotted_before_its_first_migration(tmp):
+    import sqlite3
+    from sqlalchemy import create_engine
+    from app.services import backup
+    from app.services.migrations import LATEST_VERSION, upgrade
+
+    # Production predates schema_version: it reads as version 0 but holds data
+    legacy, fresh = os.path.join(tmp, 'legacy.db'), os.path.join(tmp, 'fresh.db')
+    with sqlite3.connect(legacy) as conn:
+        conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(64), "
+                     "password_hash VARCHAR(128), is_admin BOOLEAN)")
+        conn.execute("INSERT INTO users (username, is_admin) VALUES ('admin', 1)")
+    snapshots = os.path.join(tmp, 'snapshots')
+
+    assert upgrade(create_engine(f'sqlite:///{fresh}'), snapshots)[-1] == LATEST_VERSION
+    assert backup.list_backups(snapshots) == []
+
+    assert upgrade(create_engine(f'sqlite:///{legacy}'), snapshots)[-1] == LATEST_VERSION
+    [taken] = backup.list_backups(snapshots)
+    assert taken['reason'] == 'pre-migration'
+    with sqlite3.connect(taken['path']) as conn:
+        assert conn.execute("SELECT username FROM users").fetchall() == [('admin',)]
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'feeders'").fetchall() == []
@@ -0,0 +1,44 @@
+"""Dashboard validators agree across gunicorn workers (one process per worker here).
+
+    python -m pytest tests
+"""
+
+
+def fetch_dashboard(app, etag, churn):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    client.get('/')
+    if churn:
+        # Rename and restore: same rows, but this worker's version counters moved on
+        from database import db
+        from app.models.feeder import Feeder
+        from app.services.fleet import commit_devices
+        with app.app_context():
+            feeder = db.session.get(Feeder, 1)
+            name = feeder.name
+            for value in ('Churn', name):
+                feeder.name = value
+                commit_devices(feeder)
+    response = client.get('/', headers={'If-None-Match': etag} if etag else {})
+    return response.status_code, response.headers.get('ETag')
+
+
+def test_etag_from_one_worker_revalidates_on_another(app, workers):
+    from database import db
+    from app.models.feeder import Feeder
+    from app.services.seed import seed_defaults
+
+    with app.app_context():
+        seed_defaults()
+        db.session.add(Feeder(name='Shared ETag'))
+        db.session.commit()
+
+    status, etag = workers.run(fetch_dashboard, None, False)
+    assert status == 200 and etag.startswith('W/')
+    assert workers.run(fetch_dashboard, etag, True) == (304, etag)
+
+    with app.app_context():
+        db.session.get(Feeder, 1).name = 'Renamed'
+        db.session.commit()
+    assert workers.run(fetch_dashboard, etag, False)[0] == 200
@@ -0,0 +1,127 @@
+"""Command deadlines are shared by the gunicorn workers (one process per worker here).
+
+    python -m pytest tests
+"""
+
+
+def queue_commands(app, feeder_id):
+    # Worker 1: the dashboard queues two commands
+    from app.services.command_bus import CommandBus
+    with app.test_request_context():
+        from database import db
+        first = {'type': 'feed', 'duration': 1000}
+        second = {'type': 'refill', 'duration': 1000}
+        CommandBus.add_command(feeder_id, first)
+        CommandBus.add_command(feeder_id, second)
+        db.session.commit()
+    return first['id'], second['id']
+
+
+def acknowledge(app, feeder_id, token, command_id):
+    # Worker 2: the device's ack lands on another process
+    response = app.test_client().post(f'/api/feeder/{feeder_id}/ack', json={'command_id': command_id, 'status': 'executed'},
+                                      headers={'Authorization': f'Bearer {token}'})
+    return response.status_code, response.get_json()
+
+
+def test_ack_on_another_worker_cancels_the_deadline(app, workers):
+    from database import db
+    from app.models.command_deadline import CommandDeadline
+    from app.models.feeder import Feeder
+    from app.services.clock import Clock
+    from app.services.deadlines import Deadlines
+
+    with app.app_context():
+        feeder = Feeder(name='Cross-worker')
+        db.session.add(feeder)
+        db.session.commit()
+        feeder_id, token = feeder.id, feeder.token
+
+    acked, unacked = workers.run(queue_commands, feeder_id)
+    status, body = workers.run(acknowledge, feeder_id, token, acked)
+    assert status == 200 and body['matched'] and body['command'] == 'feed'
+
+    with app.app_context():
+        assert db.session.get(CommandDeadline, acked).acked_at is not None
+        assert db.session.get(CommandDeadline, unacked).acked_at is None
+        # The round trip is traced from the shared row, not the worker that queued it
+        from app.services.command_trace import CommandTrace
+        stats = CommandTrace.stats()
+        assert stats['stages']['executed']['count'] == 1
+        assert list(stats['by_type']) == ['feed']
+
+    # The scanner (this process) only expires the command nobody acked
+    assert Deadlines.advance(Clock.time() + Deadlines.command_timeout + 1) == 1
+    with app.app_context():
+        assert db.session.get(CommandDeadline, acked).expired_at is None
+        assert db.session.get(CommandDeadline, unacked).expired_at is not None
+        feeder = db.session.get(Feeder, feeder_id)
+        assert feeder.status == 'TRIP'
+        assert 'refill' in feeder.trip_reason
+
+
+def test_late_ack_still_logs_the_dispense(app, workers):
+    from database import db
+    from app.models.feeder import Feeder
+    from app.models.log import Log
+    from app.services.clock import Clock
+    from app.services.deadlines import Deadlines
+
+    with app.app_context():
+        feeder = Feeder(name='Late ack')
+        db.session.add(feeder)
+        db.session.commit()
+        feeder_id, token = feeder.id, feeder.token
+
+    feed, refill = workers.run(queue_commands, feeder_id)
+    assert Deadlines.advance(Clock.time() + Deadlines.command_timeout + 1) == 2
+
+    # Both acks arrive after expiry on another worker; the repeated one is ignored
+    for command_id, matched in ((feed, True), (refill, True), (refill, False)):
+        status, body = workers.run(acknowledge, feeder_id, token, command_id)
+        assert status == 200 and body['matched'] is matched
+    with app.app_context():
+        assert sorted(log.action for log in Log.query.filter_by(feeder_id=feeder_id)) == ['feed', 'refill']
+
+
+def open_valve(app, feeder_id):
+    from app.services.command_bus import CommandBus
+    with app.test_request_context():
+        from database import db
+        CommandBus.add_command(feeder_id, {'type': 'water_control', 'action': 'OPEN', 'duration': 10000})
+        db.session.commit()
+
+
+def poll(app, feeder_id, token):
+    response = app.test_client().get(f'/api/feeder/{feeder_id}/command', headers={'Authorization': f'Bearer {token}'})
+    return [(c['type'], c.get('action')) for c in response.get_json()['commands']]
+
+
+def test_commands_and_the_forced_close_reach_the_feeder_through_any_worker(app, workers):
+    from database import db
+    from app.models.feeder import Feeder
+    from app.services.clock import Clock
+    from app.services.command_bus import CommandBus
+    from app.services.deadlines import Deadlines
+
+    with app.app_context():
+        feeder = Feeder(name='Shared queue')
+        db.session.add(feeder)
+        db.session.commit()
+        feeder_id, token = feeder.id, feeder.token
+
+    # This process is the scanner: its wheel is loaded before the valve is opened elsewhere
+    assert Deadlines.advance() == 0
+    workers.run(open_valve, feeder_id)
+
+    # Two workers polling at once: the command is handed out once
+    delivered = workers.run_all(poll, [(feeder_id, token)] * 2)
+    assert sorted(delivered) == [[], [('water_control', 'OPEN')]]
+
+    # The valve is never acknowledged: the scanner's CLOSE is delivered by another worker
+    assert Deadlines.advance(Clock.time() + 10 + Deadlines.valve_grace + 1) == 1
+    assert workers.run(poll, feeder_id, token) == [('water_control', 'CLOSE')]
+    with app.app_context():
+        feeder = db.session.get(Feeder, feeder_id)
+        assert feeder.status == 'TRIP' and feeder.water_valve_state == 'CLOSED'
+        assert not CommandBus.has_commands(feeder_id)
@@ -0,0 +1,40 @@
+"""Exports stream in chunks, filtered in the query, with an inclusive end date.
+
+    python -m pytest tests
+"""
+import json
+from datetime import datetime, timedelta
+
+
+def test_log_export_streams_the_filtered_range(admin, app):
+    from database import db
+    from app.models.feeder import Feeder
+    from app.models.log import Log
+    from app.services import export
+
+    with app.app_context():
+        inside, outside = Feeder(name='Exported'), Feeder(name='Other')
+        inside.block_name, outside.block_name = 'Bloco A', 'Bloco B'
+        db.session.add_all([inside, outside])
+        db.session.flush()
+        start = datetime(2026, 3, 1)
+        db.session.add_all([Log(feeder_id=feeder.id, timestamp=start + timedelta(minutes=i), action='auto',
+                                duration_ms=i)
+                            for feeder in (inside, outside) for i in range(export.CHUNK_ROWS + 100)])
+        # The day after the range
+        db.session.add(Log(feeder_id=inside.id, timestamp=datetime(2026, 3, 2, 0, 0, 1), action='auto'))
+        db.session.commit()
+
+    resp = admin.get('/logs/export?format=ndjson&block=Bloco A&start=2026-03-01&end=2026-03-01')
+    assert resp.status_code == 200 and resp.is_streamed
+    assert 'Content-Length' not in resp.headers
+    chunks = list(resp.response)
+    assert len(chunks) == 2  # CHUNK_ROWS, then the rest
+    rows = [json.loads(line) for line in b''.join(chunks).splitlines()]
+    assert len(rows) == export.CHUNK_ROWS + 100
+    assert {row['feeder_name'] for row in rows} == {'Exported'}
+    assert [row['duration_ms'] for row in rows] == list(range(export.CHUNK_ROWS + 100))
+
+    csv_lines = admin.get('/logs/export?block=Bloco B').get_data(as_text=True).splitlines()
+    assert csv_lines[0] == ','.join(export.LOG_COLUMNS) and len(csv_lines) == export.CHUNK_ROWS + 101
+    assert admin.get('/logs/export?start=yesterday').status_code == 400
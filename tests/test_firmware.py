@@ -0,0 +1,44 @@
+"""Firmware OTA: only upgrades are offered, and the signed URL serves the artifact.
+
+    python -m pytest tests
+"""
+import io
+import os
+
+
+def report(client, device, version):
+    feeder_id, token = device
+    response = client.post(f'/api/feeder/{feeder_id}/status', json={'firmware_version': version},
+                           headers={'Authorization': f'Bearer {token}'})
+    return response.get_json().get('firmware')
+
+
+def test_only_newer_builds_are_offered(app, tmp):
+    from database import db
+    from app.models.feeder import Feeder
+    from app.services.firmware import version_key
+
+    store = app.extensions['firmware']
+    assert not os.path.exists(os.path.join(tmp, 'firmware', 'slots'))
+    assert version_key('v1.2') == version_key('1.2.0-SIM') == (1, 2)
+
+    with app.test_request_context():
+        release = store.add(io.BytesIO(b'\xe9' * 4096), '1.2.0')
+        release.rollout_percent = 100
+        feeder = Feeder(name='OTA')
+        db.session.add(feeder)
+        db.session.commit()
+        store.invalidate()
+        device = feeder.id, feeder.token
+
+    client = app.test_client()
+    assert report(client, device, '1.10.0') is None  # never downgrade
+    assert report(client, device, '1.2.0') is None
+    offer = report(client, device, '1.1.9')
+    assert offer['version'] == '1.2.0' and offer['size'] == 4096
+
+    response = client.get(offer['url'])
+    assert response.status_code == 200 and response.get_data() == b'\xe9' * 4096
+    assert response.headers['ETag'] == f'"{offer["sha256"]}"'
+    response.close()
+    assert store.busy_slots() == 0
@@ -0,0 +1,114 @@
+"""Fleet read model: local commits apply at once, other workers' writes on resync.
+
+    python -m pytest tests
+"""
+
+
+def lock_feeder(app, feeder_id):
+    # Another worker flips the Safety Lock
+    from database import db
+    from app.models.feeder import Feeder
+    from app.services.fleet import commit_devices
+    with app.app_context():
+        feeder = db.session.get(Feeder, feeder_id)
+        feeder.is_locked = True
+        commit_devices(feeder)
+    return True
+
+
+def test_other_workers_writes_show_up_on_resync(app, admin, workers):
+    from database import db
+    from app.models.command_deadline import CommandDeadline
+    from app.models.feeder import Feeder
+    from app.services.fleet import FleetModel, commit_devices
+
+    FleetModel.reset(sync_interval=3600)
+    with app.app_context():
+        feeder = Feeder(name='Read model')
+        db.session.add(feeder)
+        commit_devices(feeder)
+        assert FleetModel.feeder(feeder.id).name == 'Read model'
+        feeder.name = 'Renamed'
+        commit_devices(feeder)
+        assert FleetModel.feeder(feeder.id).name == 'Renamed'
+        feeder_id = feeder.id
+
+    assert workers.run(lock_feeder, feeder_id)
+    with app.app_context():
+        assert not FleetModel.feeder(feeder_id).is_locked  # within the sync interval
+
+    # The interlock reads the row, not the stale record
+    admin.post(f'/feeder/{feeder_id}/feed')
+    with app.app_context():
+        assert CommandDeadline.query.filter_by(feeder_id=feeder_id).count() == 0
+        FleetModel.invalidate()
+        assert FleetModel.feeder(feeder_id).is_locked
+
+
+def move_feeder(app, feeder_id, block_name, drawer_weight):
+    # Another worker moves a feeder to another block and records its drawer
+    from database import db
+    from app.models.feeder import Feeder
+    from app.services.fleet import commit_devices
+    with app.app_context():
+        feeder = db.session.get(Feeder, feeder_id)
+        feeder.block_name, feeder.drawer_weight = block_name, drawer_weight
+        commit_devices(feeder)
+    return True
+
+
+def block_totals(summary):
+    return {key: summary[key] for key in ('feeders', 'status', 'drawer_food_kg', 'tank_food_kg', 'water_l')}
+
+
+def recomputed(block_name):
+    # The GROUP BY the aggregates replace
+    from app.models.feeder import Feeder
+    from app.models.tank import Tank
+    feeders = Feeder.query.filter_by(block_name=block_name).all()
+    tanks = Tank.query.filter_by(block_name=block_name).all()
+    statuses = {}
+    for feeder in feeders:
+        statuses[feeder.status] = statuses.get(feeder.status, 0) + 1
+    return {
+        'feeders': len(feeders),
+        'status': dict(sorted(statuses.items())),
+        'drawer_food_kg': round(sum(f.drawer_weight for f in feeders) / 1000.0, 3),
+        'tank_food_kg': round(sum(t.current_weight for t in tanks if t.type == 'food'), 3),
+        'water_l': round(sum(t.current_weight for t in tanks if t.type == 'water'), 3),
+    }
+
+
+def test_block_totals_follow_reports_and_resync(app, workers):
+    from database import db
+    from app.models.feeder import Feeder
+    from app.models.tank import Tank
+    from app.services.fleet import FleetModel, commit_devices
+
+    FleetModel.reset(sync_interval=3600)
+    with app.app_context():
+        food = Tank(name='Ração A', type='food', capacity='40kg')
+        food.block_name, food.max_weight, food.current_weight = 'Bloco A', 40.0, 30.0
+        feeders = [Feeder(name=f'A-{i}') for i in range(2)]
+        for feeder in feeders:
+            feeder.block_name, feeder.drawer_weight = 'Bloco A', 200.0
+        db.session.add_all([food, *feeders])
+        commit_devices(food, *feeders)
+        tank_id, tank_token, moved_id = food.id, food.token, feeders[1].id
+        assert block_totals(FleetModel.block_summary('Bloco A')) == recomputed('Bloco A')
+
+    # Local commit (tank report on this worker): applied at once
+    resp = app.test_client().post(f'/api/tank/{tank_id}/status', json={'weight': 12.5},
+                                  headers={'Authorization': f'Bearer {tank_token}'})
+    assert resp.status_code == 200 and resp.get_json()['level'] == 31
+    with app.app_context():
+        assert FleetModel.block_summary('Bloco A')['tank_food_kg'] == 12.5
+
+    # Another worker's move: picked up on resync, from both blocks
+    assert workers.run(move_feeder, moved_id, 'Bloco B', 150.0)
+    with app.app_context():
+        FleetModel.invalidate()
+        for block in ('Bloco A', 'Bloco B'):
+            assert block_totals(FleetModel.block_summary(block)) == recomputed(block)
+        assert FleetModel.block_summary('Bloco B')['feeders'] == 1
+        assert [b['block'] for b in FleetModel.block_summaries()] == ['Bloco A', 'Bloco B']
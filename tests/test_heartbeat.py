@@ -0,0 +1,71 @@
+"""Tripped feeders poll fast right after the trip, then back off.
+
+    python -m pytest tests
+"""
+
+
+def test_trip_backs_off_to_the_warning_interval(app):
+    from database import db
+    from app.models.feeder import Feeder
+    from app.services.clock import Clock
+    from app.services.fleet import commit_devices
+    from app.services.heartbeat import next_report_interval
+
+    config = app.config
+    with app.app_context():
+        feeder = Feeder(name='Tripped')
+        db.session.add(feeder)
+        commit_devices(feeder)
+        feeder.status = 'TRIP'
+        commit_devices(feeder)
+        assert abs(feeder.status_changed_at - Clock.time()) < 5
+
+        assert next_report_interval(feeder, config) == config['HEARTBEAT_MIN_S']
+        feeder.status_changed_at -= config['HEARTBEAT_TRIP_FAST_S'] + 1
+        assert next_report_interval(feeder, config) == config['HEARTBEAT_WARNING_S']
+
+
+def test_two_busy_workers_stretch_healthy_feeders(app, tmp):
+    import os
+    from app.models.feeder import Feeder
+    from app.services.admission import AdmissionControl
+    from app.services.heartbeat import next_report_interval, server_load
+
+    admission = AdmissionControl(os.path.join(tmp, 'admission.shm'), max_inflight=app.config['ADMISSION_MAX_INFLIGHT'])
+    app.extensions['admission'] = admission
+    with admission._locked():
+        admission._add_inflight(admission._worker_slot(), 2)
+    assert server_load(app) > 0.5
+
+    with app.app_context():
+        feeder = Feeder(name='Healthy')
+        feeder.id, feeder.status = 1, 'NORMAL'
+        assert next_report_interval(feeder, app.config, server_load(app)) > app.config['HEARTBEAT_IDLE_S']
+
+
+def test_slow_reports_keep_the_feeder_online(app):
+    from datetime import timedelta
+    from database import db
+    from app.models.feeder import Feeder
+    from app.services.clock import Clock
+    from app.services.fleet import commit_devices
+    from app.services.heartbeat import ONLINE_WINDOW_S
+
+    app.config['HEARTBEAT_IDLE_S'] = app.config['HEARTBEAT_MAX_S']
+    with app.app_context():
+        feeder = Feeder(name='Slow')
+        db.session.add(feeder)
+        commit_devices(feeder)
+        feeder_id, token = feeder.id, feeder.token
+        # Presence written 59 s ago, just under PRESENCE_WRITE_INTERVAL
+        feeder.online, feeder.last_seen = True, Clock.utcnow() - timedelta(seconds=59)
+        commit_devices(feeder)
+
+    response = app.test_client().get(f'/api/feeder/{feeder_id}/config', headers={'Authorization': f'Bearer {token}'})
+    next_report_s = response.get_json()['next_report_s']
+    assert next_report_s == app.config['HEARTBEAT_MAX_S']
+    with app.app_context():
+        last_seen = db.session.get(Feeder, feeder_id).last_seen
+    # Still online when the next report is due
+    due = Clock.utcnow() + timedelta(seconds=next_report_s)
+    assert (due - last_seen).total_seconds() < ONLINE_WINDOW_S
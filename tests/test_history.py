@@ -0,0 +1,41 @@
+"""Reading history: min/max buckets keep the extremes, LTTB keeps the shape, old days are pruned.
+
+    python -m pytest tests
+"""
+import os
+
+import numpy as np
+
+from app.services.history import DAY_S, History, lttb, minmax_tile
+
+
+def test_minmax_buckets_keep_each_buckets_extremes():
+    ts = np.arange(0.0, 20.0)
+    values = np.array([5, 1, 9, 5, 5, 5, 5, 5, 5, 5, 5, 0, 5, 5, 5, 5, 5, 5, 7, 5], dtype=np.float64)
+    keep = minmax_tile(ts, values, 0.0, 10)
+    assert sorted(values[keep].tolist()) == [0.0, 1.0, 7.0, 9.0]
+
+    # LTTB keeps the endpoints and the spike
+    ts = np.arange(0.0, 1000.0)
+    values = np.zeros(1000)
+    values[500] = 100.0
+    keep = lttb(ts, values, 20)
+    assert len(keep) == 20 and keep[0] == 0 and keep[-1] == 999 and 500 in keep
+
+
+def test_queries_list_the_device_directory_and_prune_drops_old_days(tmp):
+    store = History(os.path.join(tmp, 'history'), retention_days=30)
+    today = 20000
+    for day in (today - 40, today - 1, today):
+        for second in range(0, DAY_S, 3600):
+            store.append('feeder', 1, day * DAY_S + second, 100.0 + second / 3600, 90.0)
+
+    # A start in year 1 costs a directory listing, not ~740k probes
+    start = -62135596800.0
+    assert [day for day, _, _ in store._days('feeder', 1, start, (today + 1) * DAY_S)] == [today - 40, today - 1, today]
+    result = store.query('feeder', 1, (today - 1) * DAY_S, (today + 1) * DAY_S - 1, points=500)
+    assert result['bucket_s'] == 0 and len(result['series']['weight']) == 48
+
+    assert store.prune(today * DAY_S) == 1
+    assert [day for day, _, _ in store._days('feeder', 1, start, (today + 1) * DAY_S)] == [today - 1, today]
+    assert store.prune(today * DAY_S) == 0
@@ -0,0 +1,33 @@
+"""Journal: point-in-time state and feeder timelines across sealed segments.
+
+    python -m pytest tests
+"""
+
+
+def test_state_at_and_timeline_across_segments(tmp):
+    from app.services.clock import Clock
+    from app.services.journal import Journal
+
+    start = 1767225600.0
+    Clock.use(lambda: start)
+    try:
+        journal = Journal(tmp, segment_bytes=256, index_stride=64)
+        journal.ensure_started({'1': {'status': 'NORMAL'}, '2': {'status': 'NORMAL'}})
+        # Feeder 1 alternates every minute, feeder 2 trips once in the middle
+        for minute in range(1, 61):
+            entries = [(start + minute * 60, 1, 'status', 'WARNING' if minute % 2 else 'NORMAL')]
+            if minute == 30:
+                entries += [(start + minute * 60, 2, 'status', 'TRIP'), (start + minute * 60, 2, 'trip_reason', 'Jam')]
+            journal.append(entries)
+    finally:
+        Clock.reset()
+
+    assert len(journal.segments()) > 3  # replay starts from the nearest snapshot
+    assert journal.state_at(start) == {1: {'status': 'NORMAL'}, 2: {'status': 'NORMAL'}}
+    assert journal.state_at(start + 29 * 60) == {1: {'status': 'WARNING'}, 2: {'status': 'NORMAL'}}
+    assert journal.state_at(start + 45 * 60 + 30) == {1: {'status': 'WARNING'}, 2: {'status': 'TRIP', 'trip_reason': 'Jam'}}
+
+    events = journal.timeline(2, start, start + 3600)
+    assert [(e['field'], e['value']) for e in events] == [('status', 'TRIP'), ('trip_reason', 'Jam')]
+    assert len(journal.timeline(1, start + 10 * 60, start + 20 * 60)) == 11
+    assert len(journal.timeline(1, start, start + 3600, limit=5)) == 5
@@ -0,0 +1,35 @@
+"""Feed-log writer: failed batches are retried, then dropped and counted.
+
+    python -m pytest tests
+"""
+
+
+def test_failed_batches_are_retried_then_counted(app):
+    from database import db
+    from app.models.feeder import Feeder
+    from app.models.log import Log
+    from app.services.log_writer import LogWriter
+
+    with app.app_context():
+        db.session.add(Feeder(name='Writer'))
+        db.session.commit()
+
+    writer = LogWriter(app, max_retries=2, retry_backoff=0.001)
+    write, failures = writer._write, [RuntimeError('database is locked')] * 2
+
+    def flaky(batch):
+        if failures:
+            raise failures.pop()
+        write(batch)
+
+    writer._write = flaky
+    assert writer.submit(1, 'feed', 1000)
+    writer.flush()
+    assert writer.stats()['retries'] == 2 and writer.stats()['dropped'] == 0
+
+    failures[:] = [RuntimeError('disk I/O error')] * 3
+    assert writer.submit(1, 'refill', 1000)
+    writer.stop()
+    assert writer.stats()['dropped'] == 1
+    with app.app_context():
+        assert [log.action for log in Log.query.all()] == ['feed']
@@ -0,0 +1,42 @@
+"""Worker boot: one schema version lookup, no create_all and no seeding.
+
+    python -m pytest tests
+"""
+import pytest
+
+
+def test_current_schema_boots_with_a_single_query(app):
+    from sqlalchemy import event
+    from database import db
+    from app.models.user import User
+    from app.services.migrations import LATEST_VERSION, ensure_schema
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            assert ensure_schema(db.engine) == LATEST_VERSION
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert statements == ['SELECT version FROM schema_version']
+        # Seeding is a CLI step, never part of building the app
+        assert User.query.count() == 0
+
+
+def test_outdated_schema_without_auto_migrate_refuses_to_boot(app):
+    from sqlalchemy import text
+    from database import db
+    from app.services.migrations import LATEST_VERSION, SchemaOutdated, ensure_schema, upgrade
+
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(text("UPDATE schema_version SET version = :v"), {'v': LATEST_VERSION - 1})
+        with pytest.raises(SchemaOutdated):
+            ensure_schema(db.engine, auto_upgrade=False)
+        # A worker allowed to migrate applies only the missing step
+        assert upgrade(db.engine) == [LATEST_VERSION]
+        assert ensure_schema(db.engine, auto_upgrade=False) == LATEST_VERSION
@@ -0,0 +1,86 @@
+"""Partitioned mode: manifests split by placement, and the dashboard views merge the peers'.
+
+    python -m pytest tests
+"""
+from datetime import datetime
+
+import pytest
+
+
+def partitioned(app):
+    from app.services.partitioning import Partitioning
+
+    partitioning = Partitioning([('p0', 'http://p0'), ('p1', 'http://p1')], self_name='p0', secret='s3cret')
+    app.extensions['partitioning'] = partitioning
+    return partitioning
+
+
+def block_on(partitioning, node):
+    from app.services.partitioning import placement_key
+
+    return next(f'Bloco {i}' for i in range(100)
+                if partitioning.node_for_key(placement_key(block_name=f'Bloco {i}')) == node)
+
+
+def test_manifest_splits_by_block_and_tanks_follow_their_feeders(app):
+    from app.services.provisioning import ProvisioningError, split_manifest
+
+    partitioning = partitioned(app)
+    a, b = block_on(partitioning, 'p0'), block_on(partitioning, 'p1')
+    manifest = {
+        'tanks': [{'key': 'food-b', 'name': 'Ração B', 'type': 'food'}],
+        'feeders': [{'name': 'A-01', 'block_name': a},
+                    {'name': 'B-01', 'block_name': b, 'food_tank': 'food-b'}],
+    }
+    parts = split_manifest(manifest, partitioning)
+    assert [f['name'] for f in parts['p0']['feeders']] == ['A-01']
+    assert parts['p1'] == {'tanks': manifest['tanks'], 'feeders': [manifest['feeders'][1]]}
+
+    # A tank id from p0's range cannot serve a feeder of a p1 block
+    manifest['feeders'].append({'name': 'B-02', 'block_name': b, 'water_tank': 1})
+    with pytest.raises(ProvisioningError) as error:
+        split_manifest(manifest, partitioning)
+    assert error.value.errors == ["feeders[2]: water_tank 1 is on partition p0, the feeder on p1"]
+
+
+def test_dry_run_validates_without_creating(admin, app):
+    from app.models.feeder import Feeder
+
+    manifest = {'feeders': [{'name': 'Dry-01'}]}
+    resp = admin.post('/api/provision?dry_run=1', json=manifest)
+    assert resp.status_code == 200 and resp.get_json() == {'devices': []}
+    with app.app_context():
+        assert Feeder.query.filter_by(name='Dry-01').count() == 0
+    assert admin.post('/api/provision?dry_run=1', json={'feeders': [{}]}).status_code == 400
+
+
+def test_logs_page_and_export_merge_the_peers(admin, app):
+    from database import db
+    from app.models.feeder import Feeder
+    from app.models.log import Log
+
+    partitioning = partitioned(app)
+    with app.app_context():
+        feeder = Feeder(name='Local-01')
+        db.session.add(feeder)
+        db.session.flush()
+        db.session.add_all([Log(feeder_id=feeder.id, timestamp=datetime(2026, 5, 1, h), action='auto', duration_ms=h)
+                            for h in (8, 12)])
+        db.session.commit()
+        local_id = feeder.id
+
+    remote = {'id': 10_000_001, 'timestamp': '2026-05-01T10:00:00', 'feeder_id': 10_000_001,
+              'feeder_name': 'Remote-01', 'action': 'manual', 'duration_ms': 10}
+    partitioning.fan_out = lambda path, params=None, skip_self=False: {'p1': {'total': 1, 'logs': [remote]}}
+    page = admin.get('/logs').get_data(as_text=True)
+    assert page.index('12:00:00') < page.index('Remote-01') < page.index('08:00:00')
+
+    record = dict(remote, feeder_name='Remote-01', block_name=None)
+    partitioning.stream = lambda name, path, params=None: iter([record])
+    rows = admin.get('/logs/export?format=csv').get_data(as_text=True).splitlines()[1:]
+    assert [row.split(',')[2] for row in rows] == [str(local_id), '10000001', str(local_id)]
+
+    # Peers authenticate with the shared secret
+    assert app.test_client().get('/api/partition/logs').status_code == 403
+    resp = app.test_client().get('/api/partition/logs?limit=1', headers={'X-Partition-Secret': 's3cret'})
+    assert resp.get_json()['total'] == 2 and resp.get_json()['logs'][0]['duration_ms'] == 12
@@ -0,0 +1,40 @@
+"""Bulk provisioning: per-row validation and id allocation across workers.
+
+    python -m pytest tests
+"""
+
+
+def login(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    return client
+
+
+def provision_batch(app, prefix):
+    client = login(app)
+    manifest = {'feeders': [{'name': f"{prefix}-{i:03d}"} for i in range(200)]}
+    response = client.post('/api/provision', json=manifest)
+    return response.status_code, [device['id'] for device in (response.get_json() or {}).get('devices', [])]
+
+
+def test_unhashable_and_mistyped_fields_are_row_errors(admin):
+    response = admin.post('/api/provision', json={
+        'tanks': [{'key': ['food-A'], 'name': 'Ração A', 'type': 'food', 'capacity': 40}],
+        'feeders': [{'name': 'A-01', 'block_name': {'x': 1}, 'food_tank': ['food-A'], 'water_tank': {}}],
+    })
+    assert response.status_code == 400
+    errors = response.get_json()['errors']
+    assert 'tanks[0]: capacity must be a string' in errors
+    assert 'tanks[0]: key must be a string' in errors
+    assert 'feeders[0]: block_name must be a string' in errors
+    assert sum(error.startswith('feeders[0]: food_tank') or error.startswith('feeders[0]: water_tank')
+               for error in errors) == 2
+
+
+def test_concurrent_manifests_get_disjoint_ids(admin, workers):
+    outcomes = workers.run_all(provision_batch, [(prefix,) for prefix in 'AB'])
+
+    assert [status for status, _ in outcomes] == [201, 201]
+    ids = [device_id for _, device_ids in outcomes for device_id in device_ids]
+    assert len(set(ids)) == 400
@@ -0,0 +1,39 @@
+"""Drawer scale filters: spikes are removed, states do not flap, workers do not fight over the row.
+
+    python -m pytest tests
+"""
+from app.services.signal_filters import FilterBank, MovingMedianFilter, classify, filter_weight
+
+
+class Row:
+    """The feeder columns filter_weight reads (no database needed)."""
+
+    def __init__(self, feeder_id, weight_filter, drawer_weight=None):
+        self.id = feeder_id
+        self.weight_filter = weight_filter
+        self.drawer_weight = drawer_weight
+        self.last_stable_weight = drawer_weight
+
+
+def test_median_drops_a_spike_and_classify_needs_the_margin_to_climb_back():
+    median = MovingMedianFilter(window=5)
+    assert [median.update(raw, None) for raw in (100, 100, 900, 101, 100)][-1] == 100
+
+    assert classify(79.0, 80.0, 20.0, 'LSH', 3.0) == 'LSL'
+    assert classify(81.0, 80.0, 20.0, 'LSL', 3.0) == 'LSL'  # inside the climb-back margin
+    assert classify(84.0, 80.0, 20.0, 'LSL', 3.0) == 'LSH'
+
+
+def test_worker_compares_with_its_own_last_write():
+    FilterBank.reset()
+    row = Row(7, 'ema')
+    persisted, _, _ = filter_weight(row, 100.0)
+    assert persisted == 100.0
+    row.drawer_weight = 104.0  # written meanwhile by another worker's filter
+
+    # This worker's output barely moved: the other worker's value is left alone
+    for raw in (100.5, 100.2, 100.4):
+        assert filter_weight(row, raw)[0] is None
+
+    assert filter_weight(row, 110.0)[0] > 101.0  # its own move is persisted
+    FilterBank.reset()
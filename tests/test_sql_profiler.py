@@ -0,0 +1,34 @@
+"""SQL profiling: a lazy load per row is reported as an N+1 suspect with its origin.
+
+    python -m pytest tests
+"""
+
+
+def test_lazy_loads_per_row_are_reported(admin, app):
+    from database import db
+    from app.models.feeder import Feeder
+    from app.models.log import Log
+    from app.services.sql_profiler import SQLProfiler, statement_shape
+
+    with app.app_context():
+        profiler = SQLProfiler(app, db.engine, slow_ms=10_000, repeat_threshold=3)
+        feeders = [Feeder(name=f'Lazy {i}') for i in range(4)]
+        db.session.add_all(feeders)
+        db.session.flush()
+        db.session.add_all([Log(feeder_id=feeder.id, action='auto', duration_ms=100) for feeder in feeders])
+        db.session.commit()
+
+    # logs.html reads log.feeder.name: one SELECT per distinct feeder
+    resp = admin.get('/logs')
+    assert resp.status_code == 200
+    assert 'repeated=1' in resp.headers['X-SQL-Queries']
+    assert resp.headers['Server-Timing'].startswith('sql;dur=')
+
+    report = profiler.recent()[0]
+    assert report['endpoint'] == 'dashboard.logs'
+    suspect, = report['repeated']
+    assert suspect['count'] == 4 and 'FROM feeders' in suspect['statement']
+    assert suspect['origin'].startswith('app/templates/logs.html')
+    assert profiler.by_endpoint()[0]['suspects'] == 1
+
+    assert statement_shape("SELECT *\n  FROM t WHERE id IN (?, ?, ?)") == "SELECT * FROM t WHERE id IN (?...)"
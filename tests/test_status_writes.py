@@ -0,0 +1,48 @@
+"""Change-only persistence: a heartbeat repeating the stored values writes nothing.
+
+    python -m pytest tests
+"""
+
+
+def test_repeated_heartbeats_skip_the_update_and_commit(app):
+    from sqlalchemy import event
+    from database import db
+    from app.models.feeder import Feeder
+    from app.services.dirty import WriteStats
+    from app.services.fleet import commit_devices
+
+    with app.app_context():
+        feeder = Feeder(name='Unchanged')
+        db.session.add(feeder)
+        commit_devices(feeder)
+        feeder_id, token = feeder.id, feeder.token
+    client = app.test_client()
+    WriteStats.reset()
+
+    writes = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.startswith(('UPDATE', 'INSERT')):
+            writes.append(statement)
+
+    def report(battery):
+        writes.clear()
+        resp = client.post(f'/api/feeder/{feeder_id}/status', json={'battery': battery, 'firmware_version': '1.0.0'},
+                           headers={'Authorization': f'Bearer {token}'})
+        assert resp.status_code == 200
+        return len(writes)
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        assert report(90) > 0   # first report: values and presence
+        assert report(90) == 0  # same values, presence still fresh
+        assert report(90) == 0
+        assert report(89) > 0
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+    assert WriteStats.snapshot()['report_status'] == {'applied': 2, 'skipped': 2}
+    with app.app_context():
+        assert db.session.get(Feeder, feeder_id).battery_level == 89
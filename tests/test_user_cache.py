@@ -0,0 +1,23 @@
+"""Cached sessions: current_user comes from the cache, and this worker's writes invalidate it.
+
+    python -m pytest tests
+"""
+
+
+def test_theme_update_invalidates_the_cached_user(app, admin):
+    from database import db
+    from app.models.user import User
+    from app.services.user_cache import UserCache
+
+    UserCache.invalidate()
+    with app.app_context():
+        cached = UserCache.get(1)
+        assert cached.is_admin and cached.theme == 'dark'
+        # Another worker's write is only seen once the entry expires
+        db.session.get(User, 1).theme = 'light'
+        db.session.commit()
+        assert UserCache.get(1) is cached
+
+    assert admin.post('/update_theme', json={'theme': 'dark'}).get_json()['success']
+    with app.app_context():
+        assert UserCache.get(1) is not cached and UserCache.get(1).theme == 'dark'